@@ -0,0 +1,43 @@
+"""workout upload jobs
+
+Revision ID: 3f6c2b7d9e41
+Revises: 1a338980f07f
+Create Date: 2020-10-24 14:12:37.418275
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6c2b7d9e41'
+down_revision = '1a338980f07f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('workout_upload_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('progress', sa.Integer(), nullable=False),
+    sa.Column('message', sa.String(length=255), nullable=True),
+    sa.Column('filepath', sa.String(length=255), nullable=False),
+    sa.Column('category_id', sa.Integer(), nullable=False),
+    sa.Column('profile_id', sa.Integer(), nullable=False),
+    sa.Column('workout_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['category_id'], ['workout_categories.id'], ),
+    sa.ForeignKeyConstraint(['profile_id'], ['user_profiles.id'], ),
+    sa.ForeignKeyConstraint(['workout_id'], ['workouts.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_workout_upload_jobs_profile_id'), 'workout_upload_jobs', ['profile_id'], unique=False)
+    op.create_index(op.f('ix_workout_upload_jobs_status'), 'workout_upload_jobs', ['status'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_workout_upload_jobs_status'), table_name='workout_upload_jobs')
+    op.drop_index(op.f('ix_workout_upload_jobs_profile_id'), table_name='workout_upload_jobs')
+    op.drop_table('workout_upload_jobs')
@@ -0,0 +1,26 @@
+"""script checkpoints
+
+Revision ID: 5d2a8c6e1f90
+Revises: c47a9f2e6b13
+Create Date: 2020-11-14 10:22:37.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d2a8c6e1f90'
+down_revision = 'c47a9f2e6b13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('scripts') as batch_op:
+        batch_op.add_column(sa.Column('checkpoint', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('scripts') as batch_op:
+        batch_op.drop_column('checkpoint')
@@ -0,0 +1,26 @@
+"""archive upload jobs
+
+Revision ID: 7e3b9d2f4a18
+Revises: 5d2a8c6e1f90
+Create Date: 2020-11-21 16:05:12.734512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e3b9d2f4a18'
+down_revision = '5d2a8c6e1f90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('workout_upload_jobs') as batch_op:
+        batch_op.add_column(sa.Column('archive_results', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('workout_upload_jobs') as batch_op:
+        batch_op.drop_column('archive_results')
@@ -0,0 +1,32 @@
+"""geocode cache
+
+Revision ID: 8b1e4d0c5a27
+Revises: 3f6c2b7d9e41
+Create Date: 2020-10-31 11:05:52.630118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b1e4d0c5a27'
+down_revision = '3f6c2b7d9e41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('geocode_cache',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('geohash', sa.String(length=12), nullable=False),
+    sa.Column('place_name', sa.String(length=128), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_geocode_cache_geohash'), 'geocode_cache', ['geohash'], unique=True)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_geocode_cache_geohash'), table_name='geocode_cache')
+    op.drop_table('geocode_cache')
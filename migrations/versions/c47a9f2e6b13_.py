@@ -0,0 +1,30 @@
+"""deferred workout naming
+
+Revision ID: c47a9f2e6b13
+Revises: 8b1e4d0c5a27
+Create Date: 2020-11-07 16:41:09.225873
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c47a9f2e6b13'
+down_revision = '8b1e4d0c5a27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('workouts') as batch_op:
+        batch_op.add_column(sa.Column('name_pending', sa.Boolean(), nullable=False, server_default=sa.false()))
+        batch_op.add_column(sa.Column('start_latitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('start_longitude', sa.Float(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('workouts') as batch_op:
+        batch_op.drop_column('start_longitude')
+        batch_op.drop_column('start_latitude')
+        batch_op.drop_column('name_pending')
@@ -2,6 +2,7 @@
 import logging
 from flask import Blueprint, Flask, current_app
 from flask_restful import Api, Resource
+from run4it.api.serializer import output_json
 from run4it.api.user.resource import (UserResource, Register, Confirmation, Login, LoginFresh, LoginRefresh,
 										Logout, LogoutRefresh)
 
@@ -10,7 +11,8 @@ from run4it.api.profile.resource import Profile, ProfileWeight
 from run4it.api.discipline import DisciplineResource, DisciplineListResource
 from run4it.api.goal import ProfileGoalListResource, ProfileGoalResource, GoalCategoryListResource
 from run4it.api.polar import ProfilePolarResource, PolarWebhookExerciseResource, PolarAuthorizationCallbackResource
-from run4it.api.workout import ProfileWorkoutListResource, ProfileWorkoutResource, ProfileWorkoutGpxResource, WorkoutCategoryListResource
+from run4it.api.workout import (ProfileWorkoutListResource, ProfileWorkoutResource, ProfileWorkoutGpxResource,
+								ProfileWorkoutUploadJobResource, ProfileWorkoutArchiveResource, WorkoutCategoryListResource)
 
 
 API_VERSION = 1
@@ -27,6 +29,7 @@ def create_api(app):
 	api_blueprint_url_prefix = "/{0}".format(API_VERSION_STR)
 	api_blueprint = Blueprint(api_blueprint_name, __name__)
 	api = Api(api_blueprint, catch_all_404s=True)
+	api.representation('application/json')(output_json)
 	api.add_resource(ApiVersion, "/")
 
 	# User resources
@@ -54,7 +57,9 @@ def create_api(app):
 	# Profile workout resources
 	api.add_resource(ProfileWorkoutListResource, "/profiles/<string:username>/workouts")
 	api.add_resource(ProfileWorkoutGpxResource, "/profiles/<string:username>/workouts/gpx/<int:category_id>")
+	api.add_resource(ProfileWorkoutArchiveResource, "/profiles/<string:username>/workouts/archive/<int:category_id>")
 	api.add_resource(ProfileWorkoutResource, "/profiles/<string:username>/workouts/<int:workout_id>")
+	api.add_resource(ProfileWorkoutUploadJobResource, "/profiles/<string:username>/workouts/jobs/<int:job_id>")
 
 	# Profile polar resources
 	api.add_resource(ProfilePolarResource, "/profiles/<string:username>/polar") 
@@ -0,0 +1,56 @@
+"""Validators and conditional GET handling (ETag, Last-Modified, Cache-Control)"""
+import hashlib
+from flask import current_app, request, Response
+from sqlalchemy import inspect
+from werkzeug.http import quote_etag, http_date
+
+CACHE_CONTROL_PRIVATE = "private, no-cache" # per-user data, may be stored by the browser but must be revalidated
+CACHE_CONTROL_REVALIDATE = "no-cache" # shared data that can change at any time
+REFERENCE_DATA_DEFAULT_MAX_AGE = 3600
+
+
+def get_rows_etag(rows, *extra_values):
+	'''Strong validator of the column values of the given database rows, and of any extra values
+	the representation depends on (file versions, query arguments)'''
+	digest = hashlib.sha1()
+	for row in rows:
+		if row is None:
+			digest.update(b'\0')
+			continue
+		digest.update(type(row).__name__.encode('utf-8'))
+		for column in inspect(row).mapper.column_attrs:
+			digest.update(b'\0' + repr(getattr(row, column.key)).encode('utf-8'))
+	for value in extra_values:
+		digest.update(b'\0' + repr(value).encode('utf-8'))
+	return digest.hexdigest()
+
+
+def get_reference_cache_control():
+	'''Cache-Control of reference data that only changes with deployments (categories)'''
+	max_age = current_app.config.get("REFERENCE_DATA_MAX_AGE", REFERENCE_DATA_DEFAULT_MAX_AGE)
+	return "public, max-age={0}".format(max_age)
+
+
+def get_conditional_headers(etag, last_modified=None, cache_control=CACHE_CONTROL_PRIVATE):
+	headers = { 'ETag': quote_etag(etag), 'Cache-Control': cache_control }
+	if last_modified is not None:
+		headers['Last-Modified'] = http_date(last_modified.replace(tzinfo=None))
+	return headers
+
+
+def is_not_modified(etag, last_modified=None):
+	'''True if the validators of the request match the current ones.
+	If-Modified-Since is only used without If-None-Match, and with one second precision'''
+	if request.if_none_match:
+		return request.if_none_match.contains_weak(etag)
+	if last_modified is not None and request.if_modified_since is not None:
+		return last_modified.replace(tzinfo=None, microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+	return False
+
+
+def get_not_modified_response(etag, last_modified=None, cache_control=CACHE_CONTROL_PRIVATE):
+	'''Returns a 304 response if the client already has the current representation, otherwise None.
+	Call before doing the expensive work of a GET, and send get_conditional_headers with the 200.'''
+	if not is_not_modified(etag, last_modified):
+		return None
+	return Response(status=304, headers=get_conditional_headers(etag, last_modified, cache_control))
@@ -4,15 +4,23 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from webargs.flaskparser import use_kwargs
 from run4it.app.database import db
 from run4it.api.templates import report_error_and_abort
+from run4it.api.conditional import (get_rows_etag, get_conditional_headers, get_not_modified_response,
+	CACHE_CONTROL_REVALIDATE)
 from .model import Discipline as DisciplineModel
 from .schema import discipline_schema, disciplines_schema, discipline_update_schema
 
 class DisciplineList(Resource):
 	@use_kwargs(discipline_schema, error_status_code = 422, locations={"query"})
 	@marshal_with(disciplines_schema)
-	def get(self, limit=20, offset=0, **kwargs):			
-		return DisciplineModel.query.order_by(DisciplineModel.length.asc()).\
+	def get(self, limit=20, offset=0, **kwargs):
+		disciplines = DisciplineModel.query.order_by(DisciplineModel.length.asc()).\
 			limit(limit).offset(offset).all()
+		# disciplines are added and edited by users, so the list is always revalidated
+		etag = get_rows_etag(disciplines)
+		not_modified_response = get_not_modified_response(etag, cache_control=CACHE_CONTROL_REVALIDATE)
+		if not_modified_response is not None:
+			return not_modified_response
+		return disciplines, 200, get_conditional_headers(etag, cache_control=CACHE_CONTROL_REVALIDATE)
 
 	@jwt_required
 	@use_kwargs(discipline_update_schema, error_status_code = 422)
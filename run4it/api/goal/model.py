@@ -43,7 +43,7 @@ class Goal(SurrogatePK, db.Model):
 	def __init__(self, profile_id, category, start_at=dt.datetime.utcnow(), end_at=dt.datetime.utcnow()+dt.timedelta(days=1), start_value=0, target_value=0, current_value=0):
 		db.Model.__init__(self, profile_id=profile_id, category=category, start_at=start_at, end_at=end_at, start_value=start_value, current_value=current_value, target_value=target_value)
 
-	def update_from_workout(self, workout):
+	def update_from_workout(self, workout, commit=True):
 		'''Add data from workout'''
 		if self.profile_id == workout.profile_id:
 			if self.start_at <= workout.start_at and self.end_at >= workout.start_at:
@@ -59,7 +59,16 @@ class Goal(SurrogatePK, db.Model):
 					elif self.category_unit == "m": #cumulative climb
 						self.current_value += workout.climb
 
-					self.save()
+					self.save(commit)
+
+	def add_workout_totals(self, num_workouts, distance, climb):
+		'''Add data of several workouts at once, the workouts must be relevant for the goal'''
+		if self.category_unit == "km":
+			self.current_value += distance / 1000.0
+		elif self.category_unit == "#":
+			self.current_value += num_workouts
+		elif self.category_unit == "m":
+			self.current_value += climb
 
 	def remove_from_workout(self, workout):
 		'''Remove data from workout, workout has been deleted or changed'''
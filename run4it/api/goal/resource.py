@@ -6,6 +6,8 @@ from flask_jwt_extended import jwt_required
 from webargs.flaskparser import use_kwargs
 from run4it.app.database import db
 from run4it.api.templates import report_error_and_abort
+from run4it.api.conditional import (get_rows_etag, get_conditional_headers, get_not_modified_response,
+	get_reference_cache_control)
 from run4it.api.profile.auth_helper import get_auth_profile_or_abort
 from .model import Goal, GoalCategory
 from .schema import goal_schema, goals_schema, goal_update_schema, goal_categories_schema
@@ -75,8 +77,12 @@ class ProfileGoal(Resource):
 
 		if goal is None:
 			report_error_and_abort(404, "goal", "Goal not found.")
-		
-		return goal
+
+		etag = get_rows_etag([goal, goal.category, goal.category.workout_category])
+		not_modified_response = get_not_modified_response(etag)
+		if not_modified_response is not None:
+			return not_modified_response
+		return goal, 200, get_conditional_headers(etag)
 
 
 	@jwt_required
@@ -119,5 +125,10 @@ class ProfileGoal(Resource):
 
 class GoalCategoryList(Resource):
 	@marshal_with(goal_categories_schema)
-	def get(self):			
-		return GoalCategory.query.order_by(GoalCategory.name.asc()).all()
+	def get(self):
+		categories = GoalCategory.query.order_by(GoalCategory.name.asc()).all()
+		etag = get_rows_etag(categories + [category.workout_category for category in categories])
+		not_modified_response = get_not_modified_response(etag, cache_control=get_reference_cache_control())
+		if not_modified_response is not None:
+			return not_modified_response
+		return categories, 200, get_conditional_headers(etag, cache_control=get_reference_cache_control())
@@ -1,8 +1,9 @@
 import datetime as dt
 from marshmallow import Schema, validate, fields
+from run4it.api.serializer import FastDumpSchema
 
 
-class GoalSchema(Schema):
+class GoalSchema(FastDumpSchema):
 	filter = fields.Str(load_only=True)
 	id = fields.Int(dump_only=True, required=True)
 	startAt = fields.DateTime(attribute='start_at', dump_only=True, required=True)
@@ -30,7 +31,7 @@ class GoalUpdateSchema(Schema):
 	class Meta:
 		strict = True
 
-class GoalCategorySchema(Schema):
+class GoalCategorySchema(FastDumpSchema):
 	id = fields.Int(dump_only=True, required=True)
 	name = fields.Str(dump_only=True, required=True)
 	unit = fields.Str(dump_only=True, required=True)
@@ -5,6 +5,7 @@ from webargs.flaskparser import use_kwargs
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from run4it.app.database import db
 from run4it.api.templates import report_error_and_abort
+from run4it.api.conditional import get_rows_etag, get_conditional_headers, get_not_modified_response
 from run4it.api.user import User
 from .model import ProfileWeightHistory
 from .schema import profile_schema, weight_schema, weights_schema
@@ -23,9 +24,15 @@ class Profile(Resource):
 
 		if user.profile is None: # should not be possible to have a user without a profile
 		   report_error_and_abort(422, "profile", "Profile not found") 
-		
+
+		etag = get_rows_etag([user.profile, user])
+		last_modified = max(user.profile.updated_at, user.updated_at) # the representation has fields of both
+		not_modified_response = get_not_modified_response(etag, last_modified)
+		if not_modified_response is not None:
+			return not_modified_response
+
 		# load profile from db
-		return user.profile, 200
+		return user.profile, 200, get_conditional_headers(etag, last_modified)
 
 	@jwt_required
 	@use_kwargs(profile_schema, error_status_code = 422)
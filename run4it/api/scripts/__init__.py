@@ -1,5 +1,8 @@
 from .model import Script as ScriptModel
 from .script import (
     script_import_polar_exercices,
+    script_import_workout_directory,
+    script_name_pending_workouts,
+    script_process_workout_upload_jobs,
     script_token_registry_purge
 )
@@ -1,3 +1,4 @@
+import json
 from run4it.app.database import Column, SurrogatePK, db
 
 
@@ -7,6 +8,7 @@ class Script(SurrogatePK, db.Model):
 	started_at = Column(db.DateTime, nullable=True)
 	completed_at = Column(db.DateTime, nullable=True)
 	return_code = Column(db.Integer, nullable=True)
+	checkpoint = Column(db.Text, nullable=True) # JSON progress of an interrupted run, resumed by the next one
 
 	def __init__(self, name):
 		db.Model.__init__(self, name=name)
@@ -15,6 +17,12 @@ class Script(SurrogatePK, db.Model):
 	def find_by_name(cls, name):
 		return cls.query.filter_by(name=name).first()
 
+	def get_checkpoint(self):
+		return json.loads(self.checkpoint) if self.checkpoint is not None else None
+
+	def set_checkpoint(self, checkpoint):
+		self.checkpoint = json.dumps(checkpoint) if checkpoint is not None else None
+
 	@property
 	def execution_time(self):
 		if self.started_at is not None and self.completed_at is not None:
@@ -1,12 +1,26 @@
 import datetime as dt
+from os import path
+from uuid import uuid4
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app
+from werkzeug.utils import secure_filename
 from .model import Script as ScriptModel
 from run4it.api.token import TokenRegistry
 from run4it.api.profile import Profile
-from run4it.api.workout import WorkoutModel, WorkoutCategoryModel
-from run4it.api.workout.resource import get_autogenerated_workout_name, add_workout_data_to_goals
+from run4it.api.user import User
+from run4it.api.workout import WorkoutModel, WorkoutCategoryModel, WorkoutUploadJobModel
+from run4it.api.workout.model import load_workout_summary
+from run4it.api.workout.resource import (add_workout_data_to_goals, process_workout_upload_job, name_workouts, remove_uploaded_file,
+	WORKOUT_NAMING_BATCH_SIZE)
+from run4it.api.workout.gmaps import geocode_cache
+from run4it.api.workout.archive import get_archive_pool_size, parse_workout_file_summaries
+from run4it.api.workout.bulk import (find_workout_files, parse_workout_files, get_workout_row, insert_workout_rows,
+	add_imported_workouts_to_goals, WORKOUT_IMPORT_DEFAULT_BATCH_SIZE)
 from run4it.api.polar import PolarUserModel, PolarWebhookExerciseModel, get_exercise_data_from_url, get_exercise_fit_from_url
 from run4it.app.database import db
 
+WORKOUT_JOB_STALE_MINUTES = 10
+
 
 def script_import_polar_exercices(script_name):
 	script_entry,ret_code = _init_script_execution(script_name)
@@ -17,6 +31,7 @@ def script_import_polar_exercices(script_name):
 	if polar_exercises is not None:
 		# Loop through exercises and download exercise data
 		print(str(dt.datetime.utcnow()), "Found {0} Polar exercise(s) ready for import".format(len(polar_exercises)))
+		imported_fit_paths = []
 		for exercise in polar_exercises:
 			polar_user = PolarUserModel.find_by_polar_user_id(exercise.polar_user_id)
 
@@ -32,6 +47,8 @@ def script_import_polar_exercices(script_name):
 					new_workout_id = _create_workout_from_polar_exercise(polar_user.profile_id, exercise_json, fit_path)
 					
 					if new_workout_id > 0:
+						if fit_path is not None:
+							imported_fit_paths.append(fit_path)
 						print(str(dt.datetime.utcnow()), "New workout created with id {0} for Polar exercise {1}".format(new_workout_id, exercise.entity_id))             
 					else:
 						print(str(dt.datetime.utcnow()), "Failed to create workout for Polar exercise {0}".format(exercise.entity_id))
@@ -49,6 +66,15 @@ def script_import_polar_exercices(script_name):
 			except:
 				print(str(dt.datetime.utcnow()), "Failed to set Polar exercise {0} as 'processed'".format(exercise.entity_id))
 
+		# workouts were created from the session totals, their tracks are parsed and stored at ingest as for uploads
+		num_processes = get_archive_pool_size(current_app.config.get("WORKOUT_ARCHIVE_PROCESSES"))
+		parsed_files = parse_workout_file_summaries(imported_fit_paths, min(num_processes, len(imported_fit_paths)))
+		num_stored = sum(1 for _, summary in parsed_files if summary is not None)
+		print(str(dt.datetime.utcnow()), "Parsed and stored the tracks of {0} workout file(s)".format(num_stored))
+
+		num_named = _name_all_pending_workouts()
+		print(str(dt.datetime.utcnow()), "Named {0} workout(s), geocode cache: {1}".format(num_named, geocode_cache.get_stats()))
+
 	else:
 		print(str(dt.datetime.utcnow()), "Error searching for Polar exercises for import")
 		ret_code = 1
@@ -68,6 +94,114 @@ def script_token_registry_purge(script_name):
 	return _commit_script_execution(script_entry, ret_code)
 
 
+def script_process_workout_upload_jobs(script_name, stale_minutes=WORKOUT_JOB_STALE_MINUTES):
+	script_entry,ret_code = _init_script_execution(script_name)
+	if script_entry is None:
+		print(str(dt.datetime.utcnow()), "Script init failed: {name!r},{ret!r}".format(name=script_name,ret=ret_code))
+		return ret_code
+	# Script code goes here, jobs still pending a while after upload were lost by their worker process (restart)
+	upload_jobs = WorkoutUploadJobModel.get_stale_pending(dt.datetime.utcnow() - dt.timedelta(minutes=stale_minutes))
+	print(str(dt.datetime.utcnow()), "Found {0} pending workout upload job(s)".format(len(upload_jobs)))
+	for upload_job in upload_jobs:
+		process_workout_upload_job(upload_job.id)
+		print(str(dt.datetime.utcnow()), "Processed workout upload job {0}: {1}".format(upload_job.id, upload_job.status))
+	# End of script code
+	return _commit_script_execution(script_entry, ret_code)
+
+
+def script_name_pending_workouts(script_name):
+	script_entry,ret_code = _init_script_execution(script_name)
+	if script_entry is None:
+		print(str(dt.datetime.utcnow()), "Script init failed: {name!r},{ret!r}".format(name=script_name,ret=ret_code))
+		return ret_code
+	# Script code goes here
+	num_named = _name_all_pending_workouts()
+	print(str(dt.datetime.utcnow()), "Named {0} workout(s), geocode cache: {1}".format(num_named, geocode_cache.get_stats()))
+	# End of script code
+	return _commit_script_execution(script_entry, ret_code)
+
+
+def script_import_workout_directory(script_name, username, directory, category_name, num_processes=None,
+		batch_size=WORKOUT_IMPORT_DEFAULT_BATCH_SIZE, restart=False):
+	script_entry,ret_code = _init_script_execution(script_name)
+	if script_entry is None:
+		print(str(dt.datetime.utcnow()), "Script init failed: {name!r},{ret!r}".format(name=script_name,ret=ret_code))
+		return ret_code
+	# Script code goes here, progress is checkpointed with each batch so an interrupted import resumes where it stopped
+	user = User.find_by_username(username)
+	category = WorkoutCategoryModel.find_by_name(category_name)
+	if user is None or user.profile is None or category is None:
+		print(str(dt.datetime.utcnow()), "Profile {0} or workout category {1} not found".format(username, category_name))
+		return _commit_script_execution(script_entry, 1)
+
+	profile = user.profile
+	directory = path.abspath(directory)
+	checkpoint = script_entry.get_checkpoint()
+	if checkpoint is not None and not restart:
+		if checkpoint["directory"] != directory or checkpoint["profileId"] != profile.id or checkpoint["categoryId"] != category.id:
+			print(str(dt.datetime.utcnow()), "Import of {0} is not completed, resume it or start over with --restart".format(checkpoint["directory"]))
+			return _commit_script_execution(script_entry, 1)
+		print(str(dt.datetime.utcnow()), "Resuming import from file {0}".format(checkpoint["nextFile"] + 1))
+	else:
+		checkpoint = { 'directory': directory, 'profileId': profile.id, 'categoryId': category.id, 'importId': uuid4().hex[:12],
+			'nextFile': 0, 'numImported': 0, 'numFailed': 0 }
+
+	relative_paths = find_workout_files(directory, current_app.config["ALLOWED_UPLOAD_EXTENSIONS"])
+	print(str(dt.datetime.utcnow()), "Found {0} workout file(s) in {1}".format(len(relative_paths), directory))
+	filepath_prefix = path.join(current_app.config["GPX_UPLOAD_DIR"], secure_filename("{0}_import_{1}".format(profile.username, checkpoint["importId"])))
+	get_target_filepath = lambda num, extension: "{0}_{1}.{2}".format(filepath_prefix, num, extension)
+	pool_size = get_archive_pool_size(num_processes)
+	executor = ProcessPoolExecutor(max_workers=pool_size) if pool_size > 0 else None
+
+	try:
+		while checkpoint["nextFile"] < len(relative_paths):
+			first_file = checkpoint["nextFile"]
+			parsed_files = parse_workout_files(directory, relative_paths[first_file:first_file + batch_size], get_target_filepath, first_file, executor)
+			rows = [get_workout_row(profile.id, category, summary, filepath) for _, filepath, summary, _ in parsed_files if filepath is not None]
+			for relative_path, _, _, error in parsed_files:
+				if error is not None:
+					print(str(dt.datetime.utcnow()), "Skipped {0}: {1}".format(relative_path, error))
+			try:
+				insert_workout_rows(rows)
+				checkpoint["nextFile"] = first_file + len(parsed_files)
+				checkpoint["numImported"] += len(rows)
+				checkpoint["numFailed"] += len(parsed_files) - len(rows)
+				script_entry.set_checkpoint(checkpoint)
+				script_entry.save() # the rows and the checkpoint are committed together
+			except:
+				db.session.rollback()
+				for row in rows:
+					remove_uploaded_file(row['resource_path'])
+				print(str(dt.datetime.utcnow()), "Failed to save workouts of files {0} to {1}, run again to resume".format(first_file + 1, first_file + len(parsed_files)))
+				return _commit_script_execution(script_entry, 1)
+			print(str(dt.datetime.utcnow()), "Imported {0} of {1} file(s)".format(checkpoint["nextFile"], len(relative_paths)))
+	finally:
+		if executor is not None:
+			executor.shutdown()
+
+	try:
+		num_goals = add_imported_workouts_to_goals(profile, filepath_prefix)
+		script_entry.set_checkpoint(None)
+		script_entry.save()
+	except:
+		db.session.rollback()
+		print(str(dt.datetime.utcnow()), "Failed to update goals, run again to retry")
+		return _commit_script_execution(script_entry, 1)
+	print(str(dt.datetime.utcnow()), "Imported {0} workout(s), {1} file(s) failed, updated {2} goal(s)".format(checkpoint["numImported"], checkpoint["numFailed"], num_goals))
+	# End of script code
+	return _commit_script_execution(script_entry, ret_code)
+
+
+def _name_all_pending_workouts():
+	'''Names pending workouts batch by batch until none remain, those where the lookup failed are left for the next run'''
+	total_named = 0
+	workouts = WorkoutModel.get_pending_names(WORKOUT_NAMING_BATCH_SIZE)
+	while len(workouts) > 0:
+		last_id = workouts[-1].id
+		total_named += name_workouts(workouts)
+		workouts = WorkoutModel.get_pending_names(WORKOUT_NAMING_BATCH_SIZE, last_id)
+	return total_named
+
 def _init_script_execution(script_name):
 	script_entry = ScriptModel.find_by_name(script_name)
 	if script_entry is None:
@@ -107,12 +241,11 @@ def _create_workout_from_polar_exercise(profile_id, exercise_json, fit_path):
 		db.session.rollback()
 		new_workout = None
 	
-	# if we have valid workout, try save and parse of FIT file if available
+	# if we have valid workout, use the totals of the FIT file if available, its track is stored by the end of the import
 	if new_workout is not None and fit_path is not None:
-		new_workout.register_extended_data()
-		parsed_summary = new_workout.extended_summary
+		parsed_summary = load_workout_summary(fit_path)
 		if parsed_summary is not None:	
-			new_workout.name = get_autogenerated_workout_name(parsed_summary.latitude, parsed_summary.longitude, new_workout.category_name)
+			new_workout.set_pending_name(parsed_summary.latitude, parsed_summary.longitude) # named in one batch by the end of the import
 			new_workout.duration = parsed_summary.duration
 
 			if category.supports_gps_data:
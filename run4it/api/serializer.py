@@ -0,0 +1,88 @@
+"""Fast serialization of API responses"""
+import json
+import math
+from collections.abc import Mapping
+from flask import current_app, make_response
+from marshmallow import Schema, fields, missing
+try:
+	import orjson
+except ImportError: # optional, the standard library encoder is used without it
+	orjson = None
+
+# field types that are serialized by a plain conversion of their (non-None) value
+FAST_FIELD_CONVERSIONS = {
+	fields.Integer: int,
+	fields.Float: float,
+	fields.String: str,
+}
+
+
+class FiniteFloat(fields.Float):
+	'''Float dumped as None where it is NaN or infinite (no position), JSON has no value for these'''
+	def _serialize(self, value, attr, obj, **kwargs):
+		value = super()._serialize(value, attr, obj, **kwargs)
+		return value if value is None or math.isfinite(value) else None
+
+
+class FastDumpSchema(Schema):
+	'''Schema that compiles a value getter for each dump field once, and dumps with these instead of
+	going through the generic field machinery for every value. Output is the same as for Schema.
+	Fields without a fast getter (nested, custom fields etc.) are serialized by the field as usual.'''
+
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		self._dump_getters = None
+
+	def _serialize(self, obj, *, many=False):
+		if many and obj is not None:
+			return [self._serialize(item) for item in obj]
+		if self._dump_getters is None:
+			self._dump_getters = [(field.data_key if field.data_key is not None else attr_name, self._compile_getter(attr_name, field))
+				for attr_name, field in self.dump_fields.items()]
+
+		ret = dict()
+		for key, get_value in self._dump_getters:
+			value = get_value(obj)
+			if value is not missing:
+				ret[key] = value
+		return ret
+
+	def _compile_getter(self, attr_name, field):
+		attribute = field.attribute if field.attribute is not None else attr_name
+		convert = FAST_FIELD_CONVERSIONS.get(type(field))
+		if type(field) is fields.DateTime and field.format not in fields.DateTime.SERIALIZATION_FUNCS:
+			convert = lambda value, datetime_format=field.format: value.strftime(datetime_format)
+		elif type(field) is fields.Boolean:
+			convert = lambda value: field._serialize(value, attr_name, None)
+
+		if convert is None or field.default is not missing or "." in attribute or getattr(field, "as_string", False):
+			return lambda obj: field.serialize(attr_name, obj, accessor=self.get_attribute)
+
+		def get_value(obj):
+			value = obj.get(attribute, missing) if isinstance(obj, Mapping) else getattr(obj, attribute, missing)
+			if value is None or value is missing:
+				return value
+			return convert(value)
+		return get_value
+
+
+def dumps(data):
+	'''Encodes data as a JSON string, with orjson when available'''
+	if orjson is not None:
+		try:
+			return orjson.dumps(data).decode('utf-8')
+		except TypeError: # types orjson does not know
+			pass
+	return json.dumps(data)
+
+
+def output_json(data, code, headers=None):
+	'''Representation of application/json responses, replaces the one of flask-restful'''
+	settings = current_app.config.get('RESTFUL_JSON', {})
+	if len(settings) > 0: # explicit encoder settings are only supported by the standard library encoder
+		dumped = json.dumps(data, **settings)
+	else:
+		dumped = dumps(data)
+	response = make_response(dumped + "\n", code)
+	response.headers.extend(headers or {})
+	return response
@@ -1,5 +1,8 @@
-from .model import WorkoutCategory as WorkoutCategoryModel, Workout as WorkoutModel
+from .model import (WorkoutCategory as WorkoutCategoryModel, Workout as WorkoutModel, WorkoutUploadJob as WorkoutUploadJobModel,
+                    GeoCodeCacheEntry as GeoCodeCacheEntryModel)
 from .resource import (ProfileWorkoutList as ProfileWorkoutListResource,
                         ProfileWorkout as ProfileWorkoutResource,
                         ProfileWorkoutGpx as ProfileWorkoutGpxResource,
+                        ProfileWorkoutUploadJob as ProfileWorkoutUploadJobResource,
+                        ProfileWorkoutArchive as ProfileWorkoutArchiveResource,
                         WorkoutCategoryList as WorkoutCategoryListResource)
@@ -0,0 +1,135 @@
+"""Import of zip archives of workout files, with the files parsed by a pool of worker processes"""
+import zipfile
+import multiprocessing
+from os import path, cpu_count, remove
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .model import load_workout_file
+from .track import track_distance
+
+ARCHIVE_COPY_CHUNK_BYTES = 1024 * 1024
+ARCHIVE_DEFAULT_MAX_FILES = 1000
+ARCHIVE_DEFAULT_MAX_FILE_BYTES = 64 * 1024 * 1024 # uncompressed size of each workout file in an archive
+ARCHIVE_IGNORED_DIRECTORIES = ("__MACOSX/",) # resource forks added by the macOS archiver
+ARCHIVE_FILE_CREATED = "created"
+ARCHIVE_FILE_FAILED = "failed"
+ARCHIVE_FILE_SKIPPED = "skipped"
+ARCHIVE_POOL_START_METHODS = ("forkserver", "spawn") # workers are not forked from the (threaded) web worker
+
+
+class ArchiveFileTooLarge(Exception):
+	pass
+
+
+def get_archive_pool_size(num_processes=None):
+	'''Worker processes parsing the files of an archive, one per CPU unless set (0 parses in the request)'''
+	if num_processes is None:
+		return cpu_count() or 1
+	return max(num_processes, 0)
+
+
+def get_archive_pool_context():
+	'''Start method of the worker processes, a fork of a threaded process can hold locks taken by its other threads'''
+	available_methods = multiprocessing.get_all_start_methods()
+	return multiprocessing.get_context(next(method for method in ARCHIVE_POOL_START_METHODS if method in available_methods))
+
+
+def init_archive_worker(distance_model, device_metrics):
+	'''Worker processes are not forked, so they get the track settings of the app here'''
+	track_distance.set_model(distance_model)
+	track_distance.device_metrics = device_metrics
+
+
+def get_archive_entry_extension(entry_name):
+	filename = path.basename(entry_name)
+	return filename.rsplit('.', 1)[1].lower() if "." in filename else ""
+
+
+def copy_archive_entry(archive, entry, filepath, max_bytes):
+	'''Copies an entry to a file a chunk at a time, the size in its header is not trusted'''
+	num_bytes = 0
+	try:
+		with archive.open(entry) as entry_file, open(filepath, 'wb') as target_file:
+			while True:
+				chunk = entry_file.read(ARCHIVE_COPY_CHUNK_BYTES)
+				if len(chunk) == 0:
+					break
+				num_bytes += len(chunk)
+				if num_bytes > max_bytes:
+					raise ArchiveFileTooLarge()
+				target_file.write(chunk)
+	except:
+		try:
+			remove(filepath)
+		except OSError:
+			pass
+		raise
+
+
+def extract_workout_files(archive_filepath, get_target_filepath, allowed_extensions,
+		max_files=ARCHIVE_DEFAULT_MAX_FILES, max_file_bytes=ARCHIVE_DEFAULT_MAX_FILE_BYTES):
+	'''Yields (entry name, extracted filepath, None) for each workout file in the archive, in archive order,
+	or (entry name, None, reason) for entries that are not imported. Entries are extracted one at a time,
+	to get_target_filepath(entry number, extension), so the archive is never held in memory.'''
+	with zipfile.ZipFile(archive_filepath) as archive:
+		num_files = 0
+		for entry in archive.infolist():
+			if entry.is_dir() or entry.filename.startswith(ARCHIVE_IGNORED_DIRECTORIES) or path.basename(entry.filename).startswith("."):
+				continue
+			extension = get_archive_entry_extension(entry.filename)
+			if extension not in allowed_extensions:
+				yield entry.filename, None, "Not a workout file."
+				continue
+			if num_files >= max_files:
+				yield entry.filename, None, "Too many files in archive."
+				continue
+			if entry.file_size > max_file_bytes:
+				yield entry.filename, None, "Workout file too large."
+				continue
+
+			filepath = get_target_filepath(num_files, extension)
+			try:
+				copy_archive_entry(archive, entry, filepath, max_file_bytes)
+			except ArchiveFileTooLarge:
+				yield entry.filename, None, "Workout file too large."
+				continue
+			except (OSError, zipfile.BadZipFile, NotImplementedError, RuntimeError): # corrupt, unsupported compression or encrypted
+				yield entry.filename, None, "Workout file could not be read."
+				continue
+			num_files += 1
+			yield entry.filename, filepath, None
+
+
+def parse_workout_file_summary(filepath):
+	'''Parses a workout file and stores its track, returns its summary or None. Run in the worker processes,
+	only the summary is sent back, the track is read from the store when the workout is requested.'''
+	try:
+		_, _, summary = load_workout_file(filepath)
+	except Exception:
+		return None
+	return summary
+
+
+def get_parsed_summary(future):
+	try:
+		return future.result()
+	except Exception: # worker process died
+		return None
+
+
+def parse_workout_file_summaries(filepaths, num_processes):
+	'''Yields (filepath, summary) for each of filepaths as its file is parsed, in num_processes processes.
+	Each file is handed to the pool as soon as filepaths yields it, and summaries are yielded as they are done,
+	so extracting, parsing and saving overlap. Without processes the files are parsed in order.'''
+	if num_processes <= 0:
+		for filepath in filepaths:
+			yield filepath, parse_workout_file_summary(filepath)
+		return
+	with ProcessPoolExecutor(max_workers=num_processes, mp_context=get_archive_pool_context(), initializer=init_archive_worker,
+			initargs=(track_distance.model, track_distance.device_metrics)) as executor:
+		pending = {}
+		for filepath in filepaths:
+			pending[executor.submit(parse_workout_file_summary, filepath)] = filepath
+			for future in [future for future in pending if future.done()]:
+				yield pending.pop(future), get_parsed_summary(future)
+		for future in as_completed(list(pending)):
+			yield pending.pop(future), get_parsed_summary(future)
@@ -0,0 +1,386 @@
+"""Benchmarks of the workout file parsers and the track pipeline, compared to a stored baseline"""
+import gc
+import json
+import shutil
+import struct
+import platform
+import threading
+import tracemalloc
+import datetime as dt
+from os import path, sysconf
+from time import perf_counter
+import numpy as np
+from marshmallow import Schema, fields
+from run4it.api.serializer import dumps
+from .fit import FIT_EPOCH, FIT_MESG_RECORD
+from .track import SPLIT_DISTANCE_M, TRACK_DISTANCE_MODELS, TRACK_DISTANCE_GEODESIC, track_distance
+from .pipeline import TRACK_CHUNK_POINTS, collect_points, get_track_points
+from .schema import WorkoutExtendedTrackDataPoint, dump_track_data, workout_schema
+from .model import Workout, WorkoutCategory, WORKOUT_FILE_DECODERS
+from .cache import track_cache
+
+BENCHMARK_FILES = ("test.gpx", "test_garmin.gpx", "test.tcx", "test_garmin.tcx", "test_garmin.fit", "test_polar.fit")
+BENCHMARK_SYNTHETIC_EXTENSIONS = ("gpx", "tcx", "fit")
+BENCHMARK_STAGES = ("parse", "trim", "metrics", "serialize")
+BENCHMARK_DETAIL_STAGES = ("load", "reload", "dump") # ProfileWorkout.get: parse and store, read the store, dump as JSON
+BENCHMARK_SERIALIZATION_STAGES = ("nested", "columns", "json", "fast") # marshmallow List(Nested) and dump_track_data, json and fast encode
+BENCHMARK_DEFAULT_REPEAT = 5
+BENCHMARK_DEFAULT_SYNTHETIC_POINTS = 50000
+BENCHMARK_DEFAULT_THRESHOLD = 0.25 # a stage slower than its baseline by this fraction is a regression
+BENCHMARK_MIN_REGRESSION_SECONDS = 0.002 # smaller differences are timer noise
+BENCHMARK_MIN_REGRESSION_BYTES = 64 * 1024 # smaller differences are allocator noise
+BENCHMARK_RSS_SAMPLE_SECONDS = 0.001
+BENCHMARK_BASELINE_VERSION = 1
+SYNTHETIC_START_TIME = dt.datetime(2020, 6, 1, 6, 0, 0)
+SYNTHETIC_START_POSITION = (63.43049, 10.39506)
+SYNTHETIC_IDLE_POINTS = 30 # standing still at both ends, for the trim stage to remove
+
+
+def read_track_points(filepath):
+	'''Returns the TrackPoints of the (first) track of a workout file as decoded, before sanitizing and trimming'''
+	decode, _ = WORKOUT_FILE_DECODERS[filepath.rsplit('.', 1)[1].lower()]
+	return collect_points(decode(filepath))
+
+
+def trim_track_points(points):
+	'''Sanitize and trim stages of the ingest pipeline, for decoded points'''
+	return get_track_points(points.get_chunks(TRACK_CHUNK_POINTS))
+
+
+def get_best_time(function, repeat):
+	'''Returns (fastest time in seconds of repeat runs, result of the last run)'''
+	best_seconds = None
+	for _ in range(repeat):
+		start = perf_counter()
+		result = function()
+		seconds = perf_counter() - start
+		best_seconds = seconds if best_seconds is None else min(best_seconds, seconds)
+	return best_seconds, result
+
+
+def benchmark_file(filepath, repeat=BENCHMARK_DEFAULT_REPEAT):
+	'''Times each stage of the pipeline for a workout file, the input of a stage is the output of the stage before it'''
+	parse_seconds, points = get_best_time(lambda: read_track_points(filepath), repeat)
+	trim_seconds, trimmed_points = get_best_time(lambda: trim_track_points(points), repeat)
+	metrics_seconds, (track_data, _, _) = get_best_time(lambda: trimmed_points.get_track_data(SPLIT_DISTANCE_M), repeat)
+	serialize_seconds, _ = get_best_time(lambda: dumps(dump_track_data(track_data)), repeat)
+
+	stages = {}
+	for stage, seconds, num_points in [("parse", parse_seconds, len(points)), ("trim", trim_seconds, len(points)),
+			("metrics", metrics_seconds, len(trimmed_points)), ("serialize", serialize_seconds, len(track_data))]:
+		stages[stage] = { 'seconds': seconds, 'pointsPerSecond': num_points / seconds if seconds > 0 else 0.0 }
+	return { 'points': len(points), 'stages': stages }
+
+
+class NestedTrackSchema(Schema):
+	'''How trackData was dumped before dump_track_data, point by point'''
+	trackData = fields.List(fields.Nested(WorkoutExtendedTrackDataPoint))
+
+
+def serialization_benchmark_file(filepath, repeat=BENCHMARK_DEFAULT_REPEAT):
+	'''Times dumping the track data of a workout file with marshmallow List(Nested) and with dump_track_data,
+	and encoding the dump with json and with the fast encoder. sameOutput tells if both dumps are equal.'''
+	track_data, _, _ = trim_track_points(read_track_points(filepath)).get_track_data(SPLIT_DISTANCE_M)
+	track_points = list(track_data)
+	nested_schema = NestedTrackSchema()
+	nested_seconds, nested_dump = get_best_time(lambda: nested_schema.dump({ 'trackData': track_points }), repeat)
+	columns_seconds, columns_dump = get_best_time(lambda: dump_track_data(track_data), repeat)
+	json_seconds, _ = get_best_time(lambda: json.dumps(nested_dump), repeat)
+	fast_seconds, _ = get_best_time(lambda: dumps(nested_dump), repeat)
+
+	stages = {}
+	for stage, seconds in zip(BENCHMARK_SERIALIZATION_STAGES, (nested_seconds, columns_seconds, json_seconds, fast_seconds)):
+		stages[stage] = { 'seconds': seconds, 'pointsPerSecond': len(track_data) / seconds if seconds > 0 else 0.0 }
+	return { 'points': len(track_data), 'stages': stages, 'sameOutput': columns_dump == nested_dump['trackData'] }
+
+
+def get_synthetic_track(num_points, seed=0):
+	'''A run with one point per second as (times, latitudes, longitudes, elevations, heart rates), standing still at both ends'''
+	random = np.random.RandomState(seed)
+	num_idle = min(SYNTHETIC_IDLE_POINTS, num_points // 4)
+	steps = np.zeros(num_points) # m/s, so meters between points
+	steps[num_idle:num_points - num_idle] = np.clip(3.0 + np.cumsum(random.normal(0.0, 0.05, num_points - 2 * num_idle)), 1.5, 5.0)
+	headings = np.cumsum(random.normal(0.0, 0.05, num_points))
+
+	latitudes = SYNTHETIC_START_POSITION[0] + np.cumsum(steps * np.cos(headings)) / 111320.0
+	longitudes = SYNTHETIC_START_POSITION[1] + np.cumsum(steps * np.sin(headings)) / (111320.0 * np.cos(np.radians(SYNTHETIC_START_POSITION[0])))
+	elevations = np.round(50.0 + np.cumsum(random.normal(0.0, 0.3, num_points)), 1)
+	heart_rates = np.clip(np.round(140 + np.cumsum(random.normal(0.0, 0.5, num_points))), 90, 190).astype(np.int32)
+	times = [SYNTHETIC_START_TIME + dt.timedelta(seconds=second) for second in range(num_points)]
+	return times, np.round(latitudes, 6), np.round(longitudes, 6), elevations, heart_rates
+
+
+def write_synthetic_track(filepath, num_points, seed=0):
+	'''Writes a synthetic track as GPX, TCX or FIT, by the extension of filepath'''
+	times, latitudes, longitudes, elevations, heart_rates = get_synthetic_track(num_points, seed)
+	extension = filepath.rsplit('.', 1)[1].lower()
+	if extension == "fit":
+		_write_synthetic_fit(filepath, times, latitudes, longitudes, elevations, heart_rates)
+		return
+
+	with open(filepath, "w", encoding="utf-8") as track_file:
+		if extension == "gpx":
+			track_file.write('<?xml version="1.0" encoding="UTF-8"?><gpx xmlns="http://www.topografix.com/GPX/1/1" version="1.1" creator="run4it"><trk><trkseg>\n')
+			for time, latitude, longitude, elevation in zip(times, latitudes.tolist(), longitudes.tolist(), elevations.tolist()):
+				track_file.write('<trkpt lat="{0}" lon="{1}"><ele>{2}</ele><time>{3}Z</time></trkpt>\n'.format(latitude, longitude, elevation, time.isoformat()))
+			track_file.write('</trkseg></trk></gpx>\n')
+		else:
+			track_file.write('<?xml version="1.0" encoding="UTF-8"?><TrainingCenterDatabase xmlns="http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2">')
+			track_file.write('<Activities><Activity Sport="Running"><Lap StartTime="{0}Z"><Track>\n'.format(times[0].isoformat()))
+			for time, latitude, longitude, elevation, heart_rate in zip(times, latitudes.tolist(), longitudes.tolist(), elevations.tolist(), heart_rates.tolist()):
+				track_file.write('<Trackpoint><Time>{0}Z</Time><Position><LatitudeDegrees>{1}</LatitudeDegrees><LongitudeDegrees>{2}</LongitudeDegrees></Position>'.format(
+					time.isoformat(), latitude, longitude))
+				track_file.write('<AltitudeMeters>{0}</AltitudeMeters><HeartRateBpm><Value>{1}</Value></HeartRateBpm></Trackpoint>\n'.format(elevation, heart_rate))
+			track_file.write('</Track></Lap></Activity></Activities></TrainingCenterDatabase>\n')
+
+
+def _write_synthetic_fit(filepath, times, latitudes, longitudes, elevations, heart_rates):
+	# one record definition (timestamp, position_lat, position_long, altitude, heart_rate) and a record per point
+	definition = struct.pack('<BBBHB', 0x40, 0, 0, FIT_MESG_RECORD, 5) + bytes([253, 4, 0x86, 0, 4, 0x85, 1, 4, 0x85, 2, 2, 0x84, 3, 1, 0x02])
+	record = struct.Struct('<BIiiHB')
+	semicircles = 2**31 / 180.0
+	data = bytearray(definition)
+	for time, latitude, longitude, elevation, heart_rate in zip(times, latitudes.tolist(), longitudes.tolist(), elevations.tolist(), heart_rates.tolist()):
+		data += record.pack(0, int((time - FIT_EPOCH).total_seconds()), int(round(latitude * semicircles)), int(round(longitude * semicircles)),
+			int(round((elevation + 500.0) * 5.0)), heart_rate)
+	with open(filepath, "wb") as fit_file:
+		fit_file.write(struct.pack('<BBHI4s', 12, 0x10, 2132, len(data), b'.FIT'))
+		fit_file.write(data)
+		fit_file.write(b'\0\0') # CRC, not checked by the decoder
+
+
+def get_benchmark_cases(data_dir, work_dir, synthetic_points=BENCHMARK_DEFAULT_SYNTHETIC_POINTS):
+	'''(case name, filepath) of the bundled workout files found in data_dir, and of synthetic tracks written to work_dir'''
+	cases = [(filename, path.join(data_dir, filename)) for filename in BENCHMARK_FILES if path.isfile(path.join(data_dir, filename))]
+	if synthetic_points > 0:
+		for extension in BENCHMARK_SYNTHETIC_EXTENSIONS:
+			filepath = path.join(work_dir, "synthetic_{0}.{1}".format(synthetic_points, extension))
+			write_synthetic_track(filepath, synthetic_points)
+			cases.append((path.basename(filepath), filepath))
+	return cases
+
+
+def run_benchmarks(data_dir, work_dir, repeat=BENCHMARK_DEFAULT_REPEAT, synthetic_points=BENCHMARK_DEFAULT_SYNTHETIC_POINTS, report=None):
+	'''Benchmarks the bundled workout files found in data_dir, and synthetic tracks written to work_dir.
+	Returns the results by case name, report(case name, result) is called as each case is done.'''
+	results = {}
+	for case_name, filepath in get_benchmark_cases(data_dir, work_dir, synthetic_points):
+		results[case_name] = benchmark_file(filepath, repeat)
+		if report is not None:
+			report(case_name, results[case_name])
+	return results
+
+
+def run_serialization_benchmarks(data_dir, work_dir, repeat=BENCHMARK_DEFAULT_REPEAT, synthetic_points=BENCHMARK_DEFAULT_SYNTHETIC_POINTS, report=None):
+	'''Benchmarks track data serialization on the same cases as run_benchmarks'''
+	results = {}
+	for case_name, filepath in get_benchmark_cases(data_dir, work_dir, synthetic_points):
+		results[case_name] = serialization_benchmark_file(filepath, repeat)
+		if report is not None:
+			report(case_name, results[case_name])
+	return results
+
+
+def compare_to_baseline(results, baseline_results, threshold=BENCHMARK_DEFAULT_THRESHOLD, min_difference=BENCHMARK_MIN_REGRESSION_SECONDS,
+		metric='seconds'):
+	'''Returns (case name, stage, baseline value, value) of each stage where metric is significantly above its baseline.
+	Cases and stages missing from either side are not compared.'''
+	regressions = []
+	for case_name, result in results.items():
+		baseline_result = baseline_results.get(case_name)
+		if baseline_result is None or baseline_result['points'] != result['points']:
+			continue
+		for stage, stage_result in result['stages'].items():
+			baseline_value = baseline_result['stages'].get(stage, {}).get(metric)
+			value = stage_result.get(metric)
+			if value is None or baseline_value is None:
+				continue
+			if value > baseline_value * (1.0 + threshold) and value - baseline_value > min_difference:
+				regressions.append((case_name, stage, baseline_value, value))
+	return regressions
+
+
+def get_rss_bytes():
+	'''Resident memory of the process, or None where /proc is not available'''
+	try:
+		with open("/proc/self/statm", "r") as statm_file:
+			return int(statm_file.read().split()[1]) * sysconf("SC_PAGE_SIZE")
+	except (OSError, ValueError, IndexError):
+		return None
+
+
+class RssSampler:
+	'''Samples resident memory in a thread while running, it includes what tracemalloc does not trace (like
+	the buffers of the XML parser) and what the allocator does not give back'''
+
+	def __init__(self, interval=BENCHMARK_RSS_SAMPLE_SECONDS):
+		self.interval = interval
+		self.start_bytes = None
+		self.peak_bytes = None
+		self.stopped = threading.Event()
+		self.thread = None
+
+	def __enter__(self):
+		self.start_bytes = self.peak_bytes = get_rss_bytes()
+		if self.start_bytes is not None:
+			self.thread = threading.Thread(target=self._sample, daemon=True)
+			self.thread.start()
+		return self
+
+	def __exit__(self, *args):
+		self.stopped.set()
+		if self.thread is not None:
+			self.thread.join()
+		self._update(get_rss_bytes())
+
+	@property
+	def peak_increase(self):
+		return self.peak_bytes - self.start_bytes if self.start_bytes is not None else None
+
+	def _sample(self):
+		while not self.stopped.wait(self.interval):
+			self._update(get_rss_bytes())
+
+	def _update(self, rss_bytes):
+		if rss_bytes is not None and self.peak_bytes is not None and rss_bytes > self.peak_bytes:
+			self.peak_bytes = rss_bytes
+
+
+def measure_memory(function):
+	'''Returns (result, memory) of function(), memory being the peak and retained traced bytes and the peak RSS increase.
+	Retained bytes are still allocated after the function returned, with its result alive. tracemalloc must be tracing.'''
+	gc.collect()
+	tracemalloc.reset_peak()
+	start_bytes, _ = tracemalloc.get_traced_memory()
+	with RssSampler() as rss:
+		result = function()
+	current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+	return result, { 'peakBytes': peak_bytes - start_bytes, 'retainedBytes': current_bytes - start_bytes, 'peakRssBytes': rss.peak_increase }
+
+
+def memory_benchmark_file(filepath, work_dir):
+	'''Measures memory of each stage of the pipeline for a workout file, and of requesting the workout details
+	(as ProfileWorkout.get) for a copy of the file in work_dir, first parsed and stored, then read from the store'''
+	detail_filepath = path.join(work_dir, "detail_" + path.basename(filepath))
+	shutil.copyfile(filepath, detail_filepath)
+	workout = Workout(1, WorkoutCategory("Running", True), "Running", SYNTHETIC_START_TIME, 0, 1, 0, detail_filepath, False)
+	stages = {}
+	was_tracing = tracemalloc.is_tracing()
+	if not was_tracing:
+		tracemalloc.start()
+	try:
+		points, stages['parse'] = measure_memory(lambda: read_track_points(filepath))
+		trimmed_points, stages['trim'] = measure_memory(lambda: trim_track_points(points))
+		(track_data, _, _), stages['metrics'] = measure_memory(lambda: trimmed_points.get_track_data(SPLIT_DISTANCE_M))
+		_, stages['serialize'] = measure_memory(lambda: dumps(dump_track_data(track_data)))
+		num_points = len(points)
+		del points, trimmed_points, track_data
+
+		track_cache.clear()
+		_, stages['load'] = measure_memory(workout.register_extended_data)
+		track_cache.clear()
+		_, stages['reload'] = measure_memory(workout.register_extended_data)
+		_, stages['dump'] = measure_memory(lambda: dumps(workout_schema.dump(workout)))
+	finally:
+		track_cache.clear()
+		if not was_tracing:
+			tracemalloc.stop()
+	return { 'points': num_points, 'stages': stages }
+
+
+def run_memory_benchmarks(data_dir, work_dir, synthetic_points=BENCHMARK_DEFAULT_SYNTHETIC_POINTS, report=None):
+	'''Measures memory for the same cases as run_benchmarks, returns the results by case name'''
+	results = {}
+	for case_name, filepath in get_benchmark_cases(data_dir, work_dir, synthetic_points):
+		results[case_name] = memory_benchmark_file(filepath, work_dir)
+		if report is not None:
+			report(case_name, results[case_name])
+	return results
+
+
+def distance_benchmark_file(filepath, repeat=BENCHMARK_DEFAULT_REPEAT):
+	'''Times each distance model over the segments of the trimmed track of a workout file. Its error against the
+	geodesic model is given for the longest segment error, and for the workout distance from the track metrics.'''
+	points = trim_track_points(read_track_points(filepath))
+	segments = (points.latitudes[:-1], points.longitudes[:-1], points.latitudes[1:], points.longitudes[1:])
+	geodesic_segments = TRACK_DISTANCE_MODELS[TRACK_DISTANCE_GEODESIC](*segments)
+	models = {}
+	current_model = track_distance.model
+	try:
+		for model, get_distances in TRACK_DISTANCE_MODELS.items():
+			seconds, model_segments = get_best_time(lambda: get_distances(*segments), repeat)
+			track_distance.set_model(model)
+			_, _, summary = points.get_track_data(SPLIT_DISTANCE_M)
+			models[model] = {
+				'seconds': seconds,
+				'pointsPerSecond': len(model_segments) / seconds if seconds > 0 else 0.0,
+				'maxErrorM': float(np.max(np.abs(model_segments - geodesic_segments))) if len(model_segments) > 0 else 0.0,
+				'distanceM': summary.distance if summary is not None else 0.0
+			}
+	finally:
+		track_distance.set_model(current_model)
+
+	for model_result in models.values():
+		model_result['distanceErrorM'] = model_result['distanceM'] - models[TRACK_DISTANCE_GEODESIC]['distanceM']
+	return { 'points': len(points), 'models': models }
+
+
+def run_distance_benchmarks(data_dir, work_dir, repeat=BENCHMARK_DEFAULT_REPEAT, synthetic_points=BENCHMARK_DEFAULT_SYNTHETIC_POINTS, report=None):
+	'''Benchmarks the distance models on the same cases as run_benchmarks'''
+	results = {}
+	for case_name, filepath in get_benchmark_cases(data_dir, work_dir, synthetic_points):
+		results[case_name] = distance_benchmark_file(filepath, repeat)
+		if report is not None:
+			report(case_name, results[case_name])
+	return results
+
+
+def read_baseline(filepath):
+	'''Returns the results stored in a baseline file, or None if there is none'''
+	if not path.isfile(filepath):
+		return None
+	with open(filepath, "r", encoding="utf-8") as baseline_file:
+		baseline = json.load(baseline_file)
+	if baseline.get('version') != BENCHMARK_BASELINE_VERSION:
+		raise ValueError("Unsupported benchmark baseline version {0}".format(baseline.get('version')))
+	return baseline['results']
+
+
+def write_baseline(filepath, results):
+	'''Stores results as the baseline, with the machine they were measured on (baselines only compare on the same one)'''
+	baseline = {
+		'version': BENCHMARK_BASELINE_VERSION,
+		'createdAt': dt.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S+00:00'),
+		'machine': '{0} {1}, Python {2}'.format(platform.system(), platform.machine(), platform.python_version()),
+		'results': results
+	}
+	with open(filepath, "w", encoding="utf-8") as baseline_file:
+		json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+
+
+def format_result(case_name, result):
+	'''One line per case: points, and seconds and points per second of each stage'''
+	stages = "  ".join("{0} {1:8.2f} ms {2:>10,.0f} pt/s".format(stage, result['stages'][stage]['seconds'] * 1000.0,
+		result['stages'][stage]['pointsPerSecond']) for stage in BENCHMARK_STAGES)
+	return "{0:<22} {1:>7} pts  {2}".format(case_name, result['points'], stages)
+
+
+def format_serialization_result(case_name, result):
+	'''One line per case: points, microseconds per point of each stage, and whether both dumps are equal'''
+	stages = "  ".join("{0} {1:6.2f} us/pt".format(stage, result['stages'][stage]['seconds'] * 1e6 / max(result['points'], 1))
+		for stage in BENCHMARK_SERIALIZATION_STAGES)
+	return "{0:<22} {1:>7} pts  {2}  {3}".format(case_name, result['points'], stages, "same output" if result['sameOutput'] else "OUTPUT DIFFERS")
+
+
+def format_memory_result(case_name, result):
+	'''One line per case: points, and peak/retained traced memory of each stage in KiB'''
+	stages = "  ".join("{0} {1:>8,.0f}/{2:<8,.0f}".format(stage, result['stages'][stage]['peakBytes'] / 1024.0,
+		result['stages'][stage]['retainedBytes'] / 1024.0) for stage in BENCHMARK_STAGES + BENCHMARK_DETAIL_STAGES)
+	return "{0:<22} {1:>7} pts  peak/retained KiB  {2}".format(case_name, result['points'], stages)
+
+
+def format_distance_result(case_name, result):
+	'''One line per case: points, and for each distance model its points per second, largest segment error and workout distance error in meters'''
+	models = "  ".join("{0} {1:>12,.0f} pt/s {2:7.3f} m {3:+8.1f} m".format(model, model_result['pointsPerSecond'],
+		model_result['maxErrorM'], model_result['distanceErrorM']) for model, model_result in result['models'].items())
+	return "{0:<22} {1:>7} pts  {2}".format(case_name, result['points'], models)
@@ -0,0 +1,118 @@
+"""Bulk import of workout files, with rows inserted in batches instead of one workout at a time"""
+import io
+import csv
+import math
+import shutil
+from os import path, walk, remove
+from run4it.app.database import db
+from .model import Workout
+from .archive import parse_workout_file_summary
+
+WORKOUT_IMPORT_DEFAULT_BATCH_SIZE = 500
+WORKOUT_IMPORT_COLUMNS = ('profile_id', 'category_id', 'name', 'start_at', 'distance', 'duration', 'climb',
+	'resource_path', 'edited', 'name_pending', 'start_latitude', 'start_longitude')
+
+
+def find_workout_files(directory, allowed_extensions):
+	'''Paths of the workout files in a directory tree relative to it, sorted so an import can resume after the last one done'''
+	relative_paths = []
+	for dirpath, dirnames, filenames in walk(directory):
+		dirnames[:] = [dirname for dirname in dirnames if not dirname.startswith(".")]
+		for filename in filenames:
+			if not filename.startswith(".") and "." in filename and filename.rsplit('.', 1)[1].lower() in allowed_extensions:
+				relative_paths.append(path.relpath(path.join(dirpath, filename), directory).replace(path.sep, "/"))
+	return sorted(relative_paths)
+
+
+def copy_workout_files(directory, relative_paths, get_target_filepath, first_num=0):
+	'''Copies the files to the upload directory, yields (relative path, copied filepath, None),
+	or (relative path, None, error) for files that could not be read'''
+	for num, relative_path in enumerate(relative_paths, first_num):
+		extension = relative_path.rsplit('.', 1)[1].lower()
+		target_filepath = get_target_filepath(num, extension)
+		try:
+			shutil.copyfile(path.join(directory, relative_path), target_filepath)
+		except OSError as e:
+			yield relative_path, None, str(e)
+			continue
+		yield relative_path, target_filepath, None
+
+
+def get_workout_row(profile_id, category, summary, filepath):
+	'''Column values of a new workout parsed from a file, as created by an upload'''
+	has_position = summary.latitude is not None and summary.longitude is not None and math.isfinite(summary.latitude) and math.isfinite(summary.longitude)
+	return {
+		'profile_id': profile_id,
+		'category_id': category.id,
+		'name': category.name,
+		'start_at': summary.time,
+		'distance': int(round(summary.distance)) if category.supports_gps_data else 0,
+		'duration': int(round(summary.duration)),
+		'climb': int(round(summary.elevation)) if category.supports_gps_data else 0,
+		'resource_path': filepath,
+		'edited': False,
+		'name_pending': True, # named by the workout_names script
+		'start_latitude': summary.latitude if has_position else None,
+		'start_longitude': summary.longitude if has_position else None
+	}
+
+
+def insert_workout_rows(rows):
+	'''Inserts workout rows in the transaction of the session, with COPY on PostgreSQL, otherwise with executemany'''
+	if len(rows) == 0:
+		return
+	connection = db.session.connection()
+	if connection.dialect.name == "postgresql":
+		buffer = io.StringIO()
+		writer = csv.writer(buffer)
+		for row in rows:
+			writer.writerow(["" if row[column] is None else row[column] for column in WORKOUT_IMPORT_COLUMNS])
+		buffer.seek(0)
+		cursor = connection.connection.cursor()
+		cursor.copy_expert("COPY {0} ({1}) FROM STDIN WITH (FORMAT csv)".format(Workout.__tablename__, ", ".join(WORKOUT_IMPORT_COLUMNS)), buffer)
+	else:
+		connection.execute(Workout.__table__.insert(), rows)
+
+
+def parse_workout_files(directory, relative_paths, get_target_filepath, first_num=0, executor=None):
+	'''Copies a batch of files to the upload directory and parses them, in the processes of executor if given.
+	Returns (relative path, copied filepath, summary, None) or (relative path, None, None, error) for each file,
+	in order. Copied files that could not be parsed are removed.'''
+	copied_files = list(copy_workout_files(directory, relative_paths, get_target_filepath, first_num))
+	filepaths = [filepath for _, filepath, _ in copied_files if filepath is not None]
+	try:
+		summaries = list(executor.map(parse_workout_file_summary, filepaths) if executor is not None else map(parse_workout_file_summary, filepaths))
+	except Exception: # worker process died
+		summaries = [None] * len(filepaths)
+	summaries = dict(zip(filepaths, summaries))
+
+	parsed_files = []
+	for relative_path, filepath, error in copied_files:
+		if filepath is not None and summaries[filepath] is None:
+			try:
+				remove(filepath)
+			except OSError:
+				pass
+			filepath, error = None, "Failed to parse workout file"
+		parsed_files.append((relative_path, filepath, summaries.get(filepath), error))
+	return parsed_files
+
+
+def add_imported_workouts_to_goals(profile, filepath_prefix):
+	'''Adds the workouts of an import, stored with filepath_prefix, to the goals of the profile once,
+	each goal is updated with the totals of its workouts. Returns the number of goals updated.'''
+	imported_workouts = db.session.query(Workout.category_id, Workout.start_at, Workout.distance, Workout.climb).filter(
+		Workout.profile_id==profile.id, Workout.resource_path.startswith(filepath_prefix, autoescape=True)).all()
+	if len(imported_workouts) == 0:
+		return 0
+
+	num_goals = 0
+	for goal in profile.goals.all():
+		if goal.category.workout_category is None:
+			continue
+		goal_workouts = [workout for workout in imported_workouts if workout.category_id == goal.category.workout_category.id
+			and goal.start_at <= workout.start_at and goal.end_at >= workout.start_at]
+		if len(goal_workouts) > 0:
+			goal.add_workout_totals(len(goal_workouts), sum(workout.distance for workout in goal_workouts), sum(workout.climb for workout in goal_workouts))
+			num_goals += 1
+	return num_goals
@@ -0,0 +1,105 @@
+import threading
+from os import path, stat
+from collections import OrderedDict
+from .track import TrackData
+
+TRACK_CACHE_DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+TRACK_CACHE_ENTRY_OVERHEAD_BYTES = 4096 # summary object, key and bookkeeping
+
+
+class TrackCache:
+	'''Per-process LRU cache of parsed workout files (track data, split data, summary).
+	Entries are keyed by (path, mtime, size, variant), so a changed file is parsed again, and the
+	total size of the cached arrays is kept within max_bytes by evicting the least recently used.'''
+
+	def __init__(self, max_bytes=TRACK_CACHE_DEFAULT_MAX_BYTES):
+		self.max_bytes = max_bytes
+		self.entries = OrderedDict()
+		self.current_bytes = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.lock = threading.Lock()
+
+	def init_app(self, app):
+		self.max_bytes = app.config.get("TRACK_CACHE_MAX_BYTES", TRACK_CACHE_DEFAULT_MAX_BYTES)
+		self.clear()
+
+	def get(self, filepath, parse_file, variant=None):
+		'''Returns parse_file(filepath), parsing only if the file is not already cached.
+		Different results from the same file (like levels of detail) are cached by variant.'''
+		try:
+			file_stat = stat(filepath)
+		except OSError: # nothing to cache, let the parser deal with it
+			return parse_file(filepath)
+
+		key = (path.abspath(filepath), file_stat.st_mtime_ns, file_stat.st_size, variant)
+		with self.lock:
+			entry = self.entries.get(key)
+			if entry is not None:
+				self.entries.move_to_end(key)
+				self.hits += 1
+				return entry[0]
+			self.misses += 1
+
+		value = parse_file(filepath) # parse without holding the lock
+		self._add(key, value, get_parsed_size(value))
+		return value
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+			self.current_bytes = 0
+			self.hits = 0
+			self.misses = 0
+			self.evictions = 0
+
+	def get_stats(self):
+		with self.lock:
+			return {
+				"entries": len(self.entries),
+				"bytes": self.current_bytes,
+				"maxBytes": self.max_bytes,
+				"hits": self.hits,
+				"misses": self.misses,
+				"evictions": self.evictions
+			}
+
+	def _add(self, key, value, size):
+		if size > self.max_bytes:
+			return
+		with self.lock:
+			if key in self.entries: # parsed concurrently by another thread
+				return
+			# older versions of the same file will never be requested again
+			for stale_key in [entry_key for entry_key in self.entries if entry_key[0] == key[0] and entry_key[1:3] != key[1:3]]:
+				self.current_bytes -= self.entries.pop(stale_key)[1]
+			self.entries[key] = (value, size)
+			self.current_bytes += size
+			while self.current_bytes > self.max_bytes:
+				_, (_, evicted_size) = self.entries.popitem(last=False)
+				self.current_bytes -= evicted_size
+				self.evictions += 1
+
+	def __repr__(self):
+		return '<TrackCache({entries!r}, {bytes!r}B)>'.format(entries=len(self.entries), bytes=self.current_bytes)
+
+
+def get_parsed_size(parsed):
+	'''Approximate memory used by (track data, split data, summary), or by cached bytes or TrackData (or None)'''
+	if isinstance(parsed, bytes):
+		return TRACK_CACHE_ENTRY_OVERHEAD_BYTES + len(parsed)
+	if parsed is None:
+		return TRACK_CACHE_ENTRY_OVERHEAD_BYTES
+	if isinstance(parsed, TrackData):
+		return TRACK_CACHE_ENTRY_OVERHEAD_BYTES + parsed.nbytes
+	track_data, split_data, _ = parsed
+	size = TRACK_CACHE_ENTRY_OVERHEAD_BYTES
+	if track_data is not None:
+		size += track_data.nbytes
+	if split_data is not None:
+		size += split_data.nbytes
+	return size
+
+
+track_cache = TrackCache()
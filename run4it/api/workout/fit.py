@@ -1,217 +1,372 @@
-from copy import copy as objcopy
+from array import array
 from os import path
-from geopy.distance import distance as geo_distance
-from math import sqrt, floor
-import fitparse
+from math import floor
+import mmap
+import struct
 import datetime as dt
-from .gpx import WorkoutDataPoint
+import numpy as np
+from .track import TrackPoints, TrackData, WorkoutDataPoint, SPLIT_DISTANCE_M, fill_missing_values
+from .pipeline import TRACK_CHUNK_POINTS, ingest_track
 
-SPEED_NO_MOVEMENT_LIMIT_M_PER_S = 0.5
-ELEVATION_GAIN_IGNORE_LIMIT_M = 0.1
-SPLIT_DISTANCE_M = 998 # in practice, we get approx ~1000m pr split
+FIT_EPOCH = dt.datetime(1989, 12, 31) # FIT timestamps are seconds since this time (UTC)
+FIT_SEMICIRCLES_TO_DEGREES = 180.0 / 2**31
+FIT_HEADER_MIN_SIZE = 12
+FIT_FIELD_TIMESTAMP = 253
+FIT_INVALID_TIMESTAMP = 0xFFFFFFFF
+
+FIT_MESG_RECORD = 20
+FIT_RECORD_FIELDS = {
+	253: 'timestamp',
+	0: 'position_lat', # semicircles
+	1: 'position_long', # semicircles
+	2: 'altitude', # 1/5 m, offset 500 m
+	78: 'enhanced_altitude', # 1/5 m, offset 500 m
+	3: 'heart_rate', # bpm
+	5: 'distance', # 1/100 m, cumulative
+	6: 'speed', # 1/1000 m/s
+	73: 'enhanced_speed', # 1/1000 m/s
+}
+
+FIT_RECORD_POSITION_FIELDS = { field_num: name for field_num, name in FIT_RECORD_FIELDS.items() if name.startswith('position_') }
+
+FIT_MESG_SESSION = 18
+FIT_SESSION_FIELDS = {
+	2: 'start_time',
+	3: 'start_position_lat', # semicircles
+	4: 'start_position_long', # semicircles
+	8: 'total_timer_time', # 1/1000 s, without pauses
+	9: 'total_distance', # 1/100 m
+	16: 'avg_heart_rate', # bpm
+	22: 'total_ascent', # m
+}
+
+FIT_MESG_LAP = 19
+FIT_LAP_FIELDS = {
+	253: 'timestamp', # end of the lap
+	2: 'start_time',
+	5: 'end_position_lat', # semicircles
+	6: 'end_position_long', # semicircles
+	7: 'total_elapsed_time', # 1/1000 s, including pauses
+	8: 'total_timer_time', # 1/1000 s, without pauses
+	9: 'total_distance', # 1/100 m
+	15: 'avg_heart_rate', # bpm
+	21: 'total_ascent', # m
+}
+
+# base type number: (struct format, size in bytes, invalid value)
+FIT_BASE_TYPES = {
+	0x00: ('B', 1, 0xFF), # enum
+	0x01: ('b', 1, 0x7F), # sint8
+	0x02: ('B', 1, 0xFF), # uint8
+	0x03: ('h', 2, 0x7FFF), # sint16
+	0x04: ('H', 2, 0xFFFF), # uint16
+	0x05: ('i', 4, 0x7FFFFFFF), # sint32
+	0x06: ('I', 4, 0xFFFFFFFF), # uint32
+	0x08: ('f', 4, None), # float32, invalid is NaN
+	0x09: ('d', 8, None), # float64, invalid is NaN
+	0x0A: ('B', 1, 0x00), # uint8z
+	0x0B: ('H', 2, 0x0000), # uint16z
+	0x0C: ('I', 4, 0x00000000), # uint32z
+	0x0D: ('B', 1, 0xFF), # byte
+	0x0E: ('q', 8, 0x7FFFFFFFFFFFFFFF), # sint64
+	0x0F: ('Q', 8, 0xFFFFFFFFFFFFFFFF), # uint64
+	0x10: ('Q', 8, 0x0000000000000000), # uint64z
+}
+
+
+def get_fit_track_points(records):
+	'''Returns TrackPoints of the records of a FIT file, or None if none has a time and a position or distance'''
+	timestamps = np.frombuffer(records['timestamp'], dtype=np.float64)
+	latitudes = np.frombuffer(records['position_lat'], dtype=np.float64)
+	longitudes = np.frombuffer(records['position_long'], dtype=np.float64)
+	altitudes = np.frombuffer(records['enhanced_altitude'], dtype=np.float64)
+	altitudes = np.where(np.isnan(altitudes), np.frombuffer(records['altitude'], dtype=np.float64), altitudes)
+	heart_rates = np.frombuffer(records['heart_rate'], dtype=np.float64)
+	distances = np.frombuffer(records['distance'], dtype=np.float64)
+	speeds = np.frombuffer(records['enhanced_speed'], dtype=np.float64)
+	speeds = np.where(np.isnan(speeds), np.frombuffer(records['speed'], dtype=np.float64), speeds)
+
+	# skip records without time, or without position and distance, like the pause/lap records some devices write.
+	# records with only a distance (like on a treadmill) are used if device metrics are
+	latitudes, longitudes = get_fit_positions(latitudes, longitudes)
+	valid = ~np.isnan(timestamps) & (~np.isnan(latitudes) | ~np.isnan(distances))
+	timestamps = timestamps[valid]
+	if len(timestamps) == 0:
+		return None
+
+	return TrackPoints(
+		FIT_EPOCH + dt.timedelta(seconds=timestamps[0]),
+		timestamps - timestamps[0],
+		latitudes[valid],
+		longitudes[valid],
+		fill_missing_values(np.round(altitudes[valid] / 5.0 - 500.0), 0.0),
+		np.nan_to_num(heart_rates[valid]).astype(np.int32),
+		get_fit_device_values(distances[valid], 100.0),
+		get_fit_device_values(speeds[valid], 1000.0))
+
+
+def get_fit_device_values(values, scale):
+	'''Values recorded by the device, in meters or m/s, or None if there are none'''
+	if np.all(np.isnan(values)):
+		return None
+	return values / scale
+
+
+def get_fit_positions(latitudes, longitudes):
+	'''Positions in decimal degrees from semicircles, NaN where there is no position'''
+	has_position = ~(np.isnan(latitudes) | np.isnan(longitudes) | ((latitudes == 0) & (longitudes == 0)))
+	return (np.where(has_position, np.round(latitudes * FIT_SEMICIRCLES_TO_DEGREES, 6), np.nan),
+		np.where(has_position, np.round(longitudes * FIT_SEMICIRCLES_TO_DEGREES, 6), np.nan))
+
+
+def get_fit_session_summary(sessions, summary=None):
+	'''Summary of the totals the device recorded in the session messages, starting with the first session.
+	Totals not recorded are taken from summary, as computed from the records; without it, None is returned.
+	The duration is the time the timer ran, without pauses, so the average speed is the one of the activity
+	(the durations of the track data are the time elapsed since its first point).'''
+	start_times = np.frombuffer(sessions['start_time'], dtype=np.float64)
+	if len(start_times) == 0 or np.isnan(start_times[0]):
+		return summary
+	durations = np.frombuffer(sessions['total_timer_time'], dtype=np.float64) / 1000.0
+	distances = np.frombuffer(sessions['total_distance'], dtype=np.float64) / 100.0
+	ascents = np.frombuffer(sessions['total_ascent'], dtype=np.float64)
+	if summary is None and (np.isnan(durations).any() or np.isnan(distances).any() or np.isnan(ascents).any()):
+		return None
+
+	duration = float(np.sum(durations)) if not np.isnan(durations).any() else summary.duration
+	distance = float(np.sum(distances)) if not np.isnan(distances).any() else summary.distance
+	elevation = float(np.sum(ascents)) if not np.isnan(ascents).any() else summary.elevation
+	latitudes, longitudes = get_fit_positions(np.frombuffer(sessions['start_position_lat'], dtype=np.float64)[:1],
+		np.frombuffer(sessions['start_position_long'], dtype=np.float64)[:1])
+	latitude, longitude = float(latitudes[0]), float(longitudes[0])
+	if np.isnan(latitude) and summary is not None:
+		latitude, longitude = summary.latitude, summary.longitude
+	# average of the sessions with heart rate, weighted by their duration
+	heart_rates = np.frombuffer(sessions['avg_heart_rate'], dtype=np.float64)
+	has_heart_rate = ~np.isnan(heart_rates) & ~np.isnan(durations) & (durations > 0)
+	if np.any(has_heart_rate):
+		heart_bpm = float(np.average(heart_rates[has_heart_rate], weights=durations[has_heart_rate]))
+	else:
+		heart_bpm = summary.heart_bpm if summary is not None else 0
+
+	avg_speed_kmh = 3.6 * distance / duration if duration > 0 else 0.0
+	return WorkoutDataPoint(latitude, longitude, elevation, FIT_EPOCH + dt.timedelta(seconds=start_times[0]),
+		duration, distance, avg_speed_kmh, heart_bpm)
+
+
+def get_fit_laps(laps):
+	'''Laps as recorded by the device, as TrackData like the splits, or None if there are none.
+	Elevations are the total ascent of each lap, positions are where it ended (NaN if not recorded, dumped as null
+	by dump_track_data), and durations are the time the timer ran (without pauses) as for the session summary.'''
+	timestamps = np.frombuffer(laps['timestamp'], dtype=np.float64)
+	elapsed_durations = np.frombuffer(laps['total_elapsed_time'], dtype=np.float64) / 1000.0
+	timer_durations = np.frombuffer(laps['total_timer_time'], dtype=np.float64) / 1000.0
+	durations = np.where(np.isnan(timer_durations), elapsed_durations, timer_durations)
+	start_times = np.frombuffer(laps['start_time'], dtype=np.float64)
+	start_times = np.where(np.isnan(start_times), timestamps - elapsed_durations, start_times)
+	valid = ~np.isnan(timestamps) & ~np.isnan(durations) & ~np.isnan(start_times)
+	if not np.any(valid):
+		return None
+
+	start_time = float(np.min(start_times[valid]))
+	durations = durations[valid]
+	distances = np.frombuffer(laps['total_distance'], dtype=np.float64)[valid] / 100.0
+	latitudes, longitudes = get_fit_positions(np.frombuffer(laps['end_position_lat'], dtype=np.float64)[valid],
+		np.frombuffer(laps['end_position_long'], dtype=np.float64)[valid])
+	with np.errstate(invalid='ignore', divide='ignore'):
+		speeds = np.where(durations > 0, 3.6 * distances / durations, 0.0)
+	return TrackData(FIT_EPOCH + dt.timedelta(seconds=start_time), timestamps[valid] - start_time, latitudes, longitudes,
+		np.nan_to_num(np.frombuffer(laps['total_ascent'], dtype=np.float64)[valid]).astype(np.int32),
+		durations, distances, speeds,
+		np.nan_to_num(np.frombuffer(laps['avg_heart_rate'], dtype=np.float64)[valid]).astype(np.int32))
+
+
+def read_fit_summary(filename):
+	'''Summary of the session messages of a FIT file, or None if the device did not record its totals.
+	Only the sessions and the positions of the records are decoded, the start is the first position
+	recorded if the session has none.'''
+	decoder = FitDecoder({ FIT_MESG_SESSION: FIT_SESSION_FIELDS, FIT_MESG_RECORD: FIT_RECORD_POSITION_FIELDS })
+	messages = decoder.decode(filename)
+	summary = get_fit_session_summary(messages[FIT_MESG_SESSION])
+	if summary is not None and np.isnan(summary.latitude):
+		records = messages[FIT_MESG_RECORD]
+		latitudes, longitudes = get_fit_positions(np.frombuffer(records['position_lat'], dtype=np.float64),
+			np.frombuffer(records['position_long'], dtype=np.float64))
+		position_idx = np.flatnonzero(~np.isnan(latitudes))
+		if len(position_idx) > 0:
+			summary.latitude, summary.longitude = float(latitudes[position_idx[0]]), float(longitudes[position_idx[0]])
+	return summary
+
+
+def read_fit_laps(filename):
+	'''Laps recorded in a FIT file as TrackData, or None. Only the lap messages are decoded.'''
+	decoder = FitDecoder({ FIT_MESG_LAP: FIT_LAP_FIELDS })
+	return get_fit_laps(decoder.decode(filename)[FIT_MESG_LAP])
+
+
+class FitTrack:
+	'''Decode stage of the ingest pipeline for a FIT file. Records and sessions are decoded column by column from the
+	memory-mapped file in one pass, iterating passes the points on a chunk at a time, and get_summary puts the session
+	totals in the summary computed by the pipeline.'''
+
+	def __init__(self, filename):
+		messages = FitDecoder({ FIT_MESG_RECORD: FIT_RECORD_FIELDS, FIT_MESG_SESSION: FIT_SESSION_FIELDS }).decode(filename)
+		self.points = get_fit_track_points(messages[FIT_MESG_RECORD])
+		self.sessions = messages[FIT_MESG_SESSION]
+
+	def __iter__(self):
+		if self.points is not None:
+			yield from self.points.get_chunks(TRACK_CHUNK_POINTS)
+
+	def get_summary(self, summary):
+		return get_fit_session_summary(self.sessions, summary)
+
+
+def decode_fit_track(filename):
+	return FitTrack(filename)
+
+
+def parse_fit_file(filename, split_distance=SPLIT_DISTANCE_M):
+	'''Returns (track data, split data, summary) of a FIT file, or (None, None, None)'''
+	return ingest_track(decode_fit_track(filename), split_distance)
 
 
 class FitParser:
 	def __init__(self, filename):
 		self.fit_filepath = None
-		self.fit_data = []
+		self.fit_data = (None, None, None)
 		if filename is not None and len(filename) > 0:
 			self.fit_filepath = filename
 			try:
-				fit_file = fitparse.FitFile(self.fit_filepath)
-				for record in fit_file.get_messages("record"):
-					point = self._get_record_data(record)
-					if point is not None:
-						self.fit_data.append(point)
+				self.fit_data = parse_fit_file(self.fit_filepath)
 			except:
-				self.fit_data = None
-		if self.get_num_of_tracks() > 0:
-			self._strip_ends_for_no_movement_tracks()
+				self.fit_data = (None, None, None)
 
 	def get_num_of_tracks(self):
-		if self.fit_data is not None:
-			return len(self.fit_data)
+		track_data, _, _ = self.fit_data
+		if track_data is not None:
+			return len(track_data)
 		else:
 			return 0
 	
 	def get_track_data(self):
 		if self.get_num_of_tracks() > 0:
-			track_data = list()
-			split_data = list()
-			summary = None
-			cumulative_duration = 0.0
-			cumulative_distance = 0.0
-			cumulative_elevation_gain = 0.0
-			cumulative_heart_bpm = 0.0
-			heart_rate_points = 0
-			start_dist_current_split = 0
-			start_dur_current_split = 0
-			start_ele_current_split = 0
-
-			for idx in range(len(self.fit_data)):
-				if idx == 0:
-					point = self.fit_data[idx]
-					if point['heart_rate'] > 0:
-						cumulative_heart_bpm += point['heart_rate']
-						heart_rate_points += 1
-					track_data.append(WorkoutDataPoint(
-						point["latitude"],
-						point["longitude"],
-						point["elevation"],
-						point["time"],
-						0, 0, 0,
-						point['heart_rate']))
-					start_ele_current_split = point["elevation"]
-				else:
-					point = self.fit_data[idx]
-					previous_point = self.fit_data[idx-1]
-					# duration
-					time_diff = round((point['time'] - previous_point['time']).total_seconds(), 1)
-					cumulative_duration += time_diff
-					# distance
-					elevation_diff = floor(point['elevation'] - previous_point['elevation'])
-					distance_diff_2d = geo_distance((previous_point['latitude'], previous_point['longitude']), (point['latitude'], point['longitude'])).m
-					cumulative_distance += sqrt(distance_diff_2d**2 + (elevation_diff)**2)
-					# heart rate
-					if point['heart_rate'] > 0:
-						cumulative_heart_bpm += point['heart_rate']
-						heart_rate_points += 1
-					# speed & elevation gain, slightly averaged
-					avg_speed_kmh = 0
-					if idx > 4:
-						previous_point5 = self.fit_data[idx-5]
-						speed_elevation_diff = floor(point['elevation'] - previous_point5['elevation'])
-						speed_time_diff = round((point['time'] - previous_point5['time']).total_seconds(), 1)
-						speed_dist_diff_2d = geo_distance((previous_point5['latitude'], previous_point5['longitude']), (point['latitude'], point['longitude'])).m
-						speed_dist_diff_3d = sqrt(speed_dist_diff_2d**2 + (speed_elevation_diff)**2)
-						if (speed_elevation_diff / 5) > ELEVATION_GAIN_IGNORE_LIMIT_M:
-							cumulative_elevation_gain += (speed_elevation_diff / 5)
-						if speed_time_diff > 0:
-							avg_speed_kmh = 3.6 * speed_dist_diff_3d / speed_time_diff
-					# add record										
-					track_data.append(WorkoutDataPoint(
-						point["latitude"],
-						point["longitude"],
-						point["elevation"],
-						point["time"],
-						cumulative_duration,
-						cumulative_distance,
-						avg_speed_kmh,
-						point['heart_rate']))
-					# splits
-					if cumulative_distance-start_dist_current_split >= SPLIT_DISTANCE_M or idx == (len(self.fit_data)-1):
-						split_point = objcopy(track_data[-1])
-						split_point.distance -= start_dist_current_split
-						split_point.duration -= start_dur_current_split
-						split_point.elevation -= start_ele_current_split
-						if split_point.duration > 0:
-							split_point.average_speed = 3.6 * split_point.distance / split_point.duration
-						else:
-							split_point.average_speed = 0.0
-						split_data.append(split_point)
-						start_dist_current_split = cumulative_distance
-						start_dur_current_split = cumulative_duration
-						start_ele_current_split = track_data[-1].elevation
-					# hack to set speed for first records
-					if idx == 5:
-						track_data[0].average_speed = track_data[5].average_speed
-						track_data[1].average_speed = track_data[5].average_speed
-						track_data[2].average_speed = track_data[5].average_speed
-						track_data[3].average_speed = track_data[5].average_speed
-						track_data[4].average_speed = track_data[5].average_speed
-
-			# summary
-			if len(track_data) > 0:
-				# summary contains: start lat./long., total elevation gain, total duration, total distance, avg speed
-				first_point = track_data[0]
-				last_point = track_data[-1]
-				total_avg_speed_kmh = 3.6 * last_point.distance / last_point.duration
-				avg_heart_rate = 0
-				if heart_rate_points > 0:
-					avg_heart_rate = cumulative_heart_bpm / heart_rate_points
-				summary = WorkoutDataPoint(first_point.latitude, first_point.longitude, cumulative_elevation_gain, first_point.time, last_point.duration, last_point.distance, total_avg_speed_kmh, avg_heart_rate)
-
-			return track_data, split_data, summary
-		
+			return self.fit_data
 		else: # no tracks
 			return None, None, None
 
-
-	def _strip_ends_for_no_movement_tracks(self):
-		if self.get_num_of_tracks() > 0:
-			num_points = len(self.fit_data)
-			start_idx = self._find_movement_start(self.fit_data)
-			end_idx = self._find_movement_end(self.fit_data)
-
-			if end_idx <= start_idx:
-				self.fit_data = []
-			if end_idx < (num_points - 1):
-				self.fit_data = self.fit_data[:end_idx]
-			if start_idx > 0:
-				self.fit_data = self.fit_data[start_idx:]
-
-
-	def _find_movement_start(self, points):
-		i=1
-		while i < len(points):
-			p1 = self.fit_data[i-1]
-			p2 = self.fit_data[i]
-			time = (p2["time"] - p1["time"]).total_seconds()
-			dist = geo_distance((p1["latitude"], p1["longitude"]),(p2["latitude"], p2["longitude"])).m
-			if time>0:
-				speed = dist/time
-				if speed > SPEED_NO_MOVEMENT_LIMIT_M_PER_S:
-					break
-			i+=1
-		return i-1
-
-
-	def _find_movement_end(self, points):
-		i=len(points)-1
-		while i > 0:
-			p1 = self.fit_data[i-1]
-			p2 = self.fit_data[i]
-			time = (p2["time"] - p1["time"]).total_seconds()
-			dist = geo_distance((p1["latitude"], p1["longitude"]),(p2["latitude"], p2["longitude"])).m
-			if time>0:
-				speed = dist/time
-				if speed > SPEED_NO_MOVEMENT_LIMIT_M_PER_S:
-					break
-			i-=1
-		return i
-
-
-	def _get_record_data(self, record):
-		ret_data = {"latitude": 0.0, "longitude": 0.0, "elevation": 0.0, "time": None, "heart_rate": 0 }
-
-		# loop through data, and save the items we need
-		for data in record:
-			if data.name == "position_lat" and data.value is not None:
-				if data.units == "semicircles":
-					ret_data["latitude"] = round(float(data.value * 180 / 2**31), 6)
-				elif data.units == "degrees":
-					ret_data["latitude"] = round(float(data.value), 6)
-			elif data.name == "position_long" and data.value is not None and data.units == "semicircles":
-				if data.units == "semicircles":
-					ret_data["longitude"] = round(float(data.value * 180 / 2**31), 6)
-				elif data.units == "degrees":
-					ret_data["longitude"] = round(float(data.value), 6)
-			elif data.name == "altitude" and data.value is not None and data.units == "m":
-				ret_data["elevation"] = round(data.value)
-			elif data.name == "timestamp" and data.value is not None:
-				ret_data["time"] = data.value
-			elif data.name == "heart_rate" and data.value is not None:
-				ret_data["heart_rate"] = data.value
-
-		# Return if all data is found
-		if (ret_data["latitude"] == 0.0 and ret_data["longitude"] == 0.0) or ret_data["time"] is None:
-			return None
-		return ret_data
-
 	def __repr__(self):
 		return '<FitParser({file!r}, {tracks!r}>'.format(file=self.fit_filepath, tracks=self.get_num_of_tracks())
 
 
+class FitDecoder:
+	'''Decodes selected fields of selected messages from a memory-mapped FIT file.
+	Wanted fields are given as {global message number: {field number: name}}, and are
+	written to one typed array per field (NaN where the field is missing or invalid).
+	Everything else is skipped without being decoded.'''
+
+	def __init__(self, messages):
+		self.messages = messages
+		self.values = {mesg_num: {name: array('d') for name in fields.values()} for mesg_num, fields in messages.items()}
+
+	def decode(self, filename):
+		with open(filename, 'rb') as fit_file:
+			with mmap.mmap(fit_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+				offset = 0
+				while offset + FIT_HEADER_MIN_SIZE <= len(data): # chained FIT files follow each other
+					offset = self._decode_fit_file(data, offset)
+		return self.values
+
+	def _decode_fit_file(self, data, offset):
+		header_size = data[offset]
+		data_size, = struct.unpack_from('<I', data, offset + 4)
+		if header_size < FIT_HEADER_MIN_SIZE or data[offset + 8:offset + 12] != b'.FIT':
+			raise ValueError('Not a FIT file')
+
+		pos = offset + header_size
+		end = pos + data_size
+		if end > len(data):
+			raise ValueError('FIT file is truncated')
+
+		definitions = {}
+		last_timestamp = None
+		while pos < end:
+			record_header = data[pos]
+			pos += 1
+			timestamp = None
+
+			if record_header & 0x80: # compressed timestamp header, always a data message
+				local_mesg_type = (record_header >> 5) & 0x03
+				time_offset = record_header & 0x1F
+				if last_timestamp is not None: # without a full timestamp before it, the message has no time
+					timestamp = (last_timestamp & ~0x1F) + time_offset
+					if time_offset < (last_timestamp & 0x1F):
+						timestamp += 0x20 # rollover
+					last_timestamp = timestamp
+			elif record_header & 0x40: # definition message
+				local_mesg_type = record_header & 0x0F
+				definitions[local_mesg_type], pos = self._read_definition(data, pos, record_header & 0x20)
+				continue
+			else:
+				local_mesg_type = record_header & 0x0F
+
+			mesg_struct, timestamp_idx, columns = definitions[local_mesg_type]
+			values = mesg_struct.unpack_from(data, pos)
+			pos += mesg_struct.size
+			if timestamp_idx is not None and values[timestamp_idx] != FIT_INVALID_TIMESTAMP:
+				last_timestamp = values[timestamp_idx]
+			for field_num, column, value_idx, invalid in columns:
+				if field_num == FIT_FIELD_TIMESTAMP and timestamp is not None:
+					column.append(timestamp)
+				elif value_idx is None:
+					column.append(np.nan)
+				else:
+					value = values[value_idx]
+					column.append(np.nan if value == invalid or value != value else value) # value != value for NaN floats
+
+		return end + 2 # file CRC
+
+	def _read_definition(self, data, pos, has_developer_data):
+		endian = '>' if data[pos + 1] == 1 else '<'
+		mesg_num, = struct.unpack_from(endian + 'H', data, pos + 2)
+		num_fields = data[pos + 4]
+		pos += 5
+		fields = [(data[pos + i * 3], data[pos + i * 3 + 1], data[pos + i * 3 + 2]) for i in range(num_fields)]
+		pos += num_fields * 3
+		developer_data_size = 0
+		if has_developer_data:
+			num_developer_fields = data[pos]
+			pos += 1
+			developer_data_size = sum(data[pos + i * 3 + 1] for i in range(num_developer_fields))
+			pos += num_developer_fields * 3
+
+		return self._compile_definition(endian, mesg_num, fields, developer_data_size), pos
+
+	def _compile_definition(self, endian, mesg_num, fields, developer_data_size):
+		wanted_fields = self.messages.get(mesg_num, {})
+		mesg_format = endian
+		field_value_idx = {}
+		invalid_values = {}
+
+		for field_num, size, base_type in fields:
+			base_type_format = FIT_BASE_TYPES.get(base_type & 0x1F)
+			if base_type_format is not None and base_type_format[1] == size and (field_num in wanted_fields or field_num == FIT_FIELD_TIMESTAMP):
+				field_value_idx[field_num] = len(field_value_idx)
+				invalid_values[field_num] = base_type_format[2]
+				mesg_format += base_type_format[0]
+			else:
+				mesg_format += '{0}x'.format(size)
+		mesg_format += '{0}x'.format(developer_data_size)
+
+		timestamp_idx = field_value_idx.get(FIT_FIELD_TIMESTAMP)
+		columns = []
+		if mesg_num in self.values:
+			for field_num, name in wanted_fields.items():
+				columns.append((field_num, self.values[mesg_num][name], field_value_idx.get(field_num), invalid_values.get(field_num)))
+
+		return struct.Struct(mesg_format), timestamp_idx, columns
+
+
 if __name__ == "__main__":
 	current_path = path.abspath(path.dirname(__file__))
 	test_file_path1 = path.abspath(path.join(current_path, "..", "..", "..", "test_polar.fit"))
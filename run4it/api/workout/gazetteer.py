@@ -0,0 +1,169 @@
+"""Offline reverse geocoding with a local gazetteer (places dataset) in a KD-tree"""
+import csv
+import math
+import numpy as np
+
+GAZETTEER_LEAF_SIZE = 32 # points compared at once at the bottom of the tree
+GAZETTEER_DEFAULT_MAX_DISTANCE_KM = 25.0 # places further away are not used as name of a position
+GAZETTEER_INDEX_EXTENSION = ".npy"
+GAZETTEER_INDEX_DTYPE = np.dtype([('x', 'f8'), ('y', 'f8'), ('z', 'f8'), ('name', 'U64'), ('type', 'U16')])
+GEONAMES_POPULATED_PLACE_CLASS = "P"
+EARTH_RADIUS_KM = 6371.0088
+
+
+def get_unit_vectors(latitudes, longitudes):
+	'''Positions as points on the unit sphere, the chord between two points grows with their distance'''
+	latitudes = np.radians(np.asarray(latitudes, dtype=np.float64))
+	longitudes = np.radians(np.asarray(longitudes, dtype=np.float64))
+	cos_latitudes = np.cos(latitudes)
+	return np.column_stack((cos_latitudes * np.cos(longitudes), cos_latitudes * np.sin(longitudes), np.sin(latitudes)))
+
+
+def get_unit_vector(latitude, longitude):
+	latitude = math.radians(latitude)
+	longitude = math.radians(longitude)
+	return (math.cos(latitude) * math.cos(longitude), math.cos(latitude) * math.sin(longitude), math.sin(latitude))
+
+
+def read_places(filepath):
+	'''Returns (names, types, latitudes, longitudes) of a places dataset. Either a GeoNames dump (.txt), of which
+	populated places are used, or a CSV file with the columns name, type, latitude and longitude.'''
+	names, types, latitudes, longitudes = [], [], [], []
+	with open(filepath, newline='', encoding='utf-8') as places_file:
+		if filepath.lower().endswith(".txt"):
+			for row in csv.reader(places_file, delimiter='\t', quoting=csv.QUOTE_NONE):
+				if len(row) > 7 and row[6] == GEONAMES_POPULATED_PLACE_CLASS:
+					names.append(row[1])
+					types.append(row[7])
+					latitudes.append(float(row[4]))
+					longitudes.append(float(row[5]))
+		else:
+			for row in csv.DictReader(places_file):
+				names.append(row["name"])
+				types.append(row.get("type") or "")
+				latitudes.append(float(row["latitude"]))
+				longitudes.append(float(row["longitude"]))
+	return names, types, latitudes, longitudes
+
+
+def build_gazetteer_index(names, types, latitudes, longitudes):
+	'''Places as a structured array ordered as an implicit KD-tree: the node of the range [lo, hi) is the place at
+	its middle, which splits the rest on axis depth % 3 into [lo, mid) and [mid + 1, hi).
+	Ranges of up to GAZETTEER_LEAF_SIZE places are leaves.'''
+	points = get_unit_vectors(latitudes, longitudes)
+	order = np.arange(len(points))
+	ranges = [(0, len(points), 0)]
+	while len(ranges) > 0:
+		lo, hi, depth = ranges.pop()
+		if hi - lo <= GAZETTEER_LEAF_SIZE:
+			continue
+		mid = (lo + hi) // 2
+		axis = depth % 3
+		partition = np.argpartition(points[order[lo:hi], axis], mid - lo, kind='introselect')
+		order[lo:hi] = order[lo:hi][partition]
+		ranges.append((lo, mid, depth + 1))
+		ranges.append((mid + 1, hi, depth + 1))
+
+	index = np.empty(len(points), dtype=GAZETTEER_INDEX_DTYPE)
+	index['x'], index['y'], index['z'] = points[order, 0], points[order, 1], points[order, 2]
+	index['name'] = np.asarray(names, dtype='U64')[order]
+	index['type'] = np.asarray(types, dtype='U16')[order]
+	return index
+
+
+def write_gazetteer_index(dataset_filepath, index_filepath):
+	'''Builds the index of a places dataset and saves it, returns the number of places'''
+	if not index_filepath.lower().endswith(GAZETTEER_INDEX_EXTENSION):
+		raise ValueError("Gazetteer index must be a {0} file".format(GAZETTEER_INDEX_EXTENSION))
+	index = build_gazetteer_index(*read_places(dataset_filepath))
+	np.save(index_filepath, index, allow_pickle=False)
+	return len(index)
+
+
+class Gazetteer:
+	'''Nearest place of a position, from a places dataset or a prebuilt index (.npy) loaded at startup.
+	A prebuilt index is memory mapped, only the coordinates are copied into memory.'''
+
+	def __init__(self, max_distance_km=GAZETTEER_DEFAULT_MAX_DISTANCE_KM):
+		self.max_distance_km = max_distance_km
+		self.index = None
+		self.points = None
+
+	def init_app(self, app):
+		self.max_distance_km = app.config.get("GEOCODE_GAZETTEER_MAX_DISTANCE_KM", GAZETTEER_DEFAULT_MAX_DISTANCE_KM)
+		self.index = None
+		self.points = None
+		filepath = app.config.get("GEOCODE_GAZETTEER_PATH")
+		if filepath is not None and app.config.get("GEOCODE_PROVIDER") == "offline":
+			try:
+				self.load(filepath)
+			except (OSError, ValueError, KeyError) as e:
+				app.logger.warning("Unable to load gazetteer {0}: {1}".format(filepath, e))
+
+	def load(self, filepath):
+		if filepath.lower().endswith(GAZETTEER_INDEX_EXTENSION):
+			self.set_index(np.load(filepath, mmap_mode='r', allow_pickle=False))
+		else:
+			self.set_index(build_gazetteer_index(*read_places(filepath)))
+
+	def set_index(self, index):
+		self.index = index
+		self.points = np.column_stack((index['x'], index['y'], index['z']))
+
+	@property
+	def is_loaded(self):
+		return self.index is not None and len(self.index) > 0
+
+	def find_nearest(self, latitude, longitude):
+		'''Returns (name, type, distance in km) of the place nearest to the position, or None if there is none in range'''
+		if not self.is_loaded:
+			return None
+		point = get_unit_vector(latitude, longitude)
+		max_chord = 2.0 * np.sin(min(self.max_distance_km / EARTH_RADIUS_KM, np.pi) / 2.0)
+		best_distance_sq = max_chord * max_chord
+		best_idx = -1
+
+		points = self.points
+		ranges = [(0, len(points), 0, 0.0)]
+		while len(ranges) > 0:
+			lo, hi, depth, bound_sq = ranges.pop()
+			if bound_sq >= best_distance_sq:
+				continue
+			if hi - lo <= GAZETTEER_LEAF_SIZE:
+				differences = points[lo:hi] - point
+				distances_sq = np.einsum('ij,ij->i', differences, differences)
+				leaf_idx = int(np.argmin(distances_sq))
+				if distances_sq[leaf_idx] < best_distance_sq:
+					best_distance_sq = float(distances_sq[leaf_idx])
+					best_idx = lo + leaf_idx
+				continue
+			mid = (lo + hi) // 2
+			node_point = points[mid].tolist()
+			distance_sq = (node_point[0] - point[0])**2 + (node_point[1] - point[1])**2 + (node_point[2] - point[2])**2
+			if distance_sq < best_distance_sq:
+				best_distance_sq = distance_sq
+				best_idx = mid
+			axis_distance = point[depth % 3] - node_point[depth % 3]
+			far_bound_sq = max(bound_sq, axis_distance * axis_distance)
+			if axis_distance < 0.0: # nearest side is searched first, it is last on the stack
+				ranges.append((mid + 1, hi, depth + 1, far_bound_sq))
+				ranges.append((lo, mid, depth + 1, bound_sq))
+			else:
+				ranges.append((lo, mid, depth + 1, far_bound_sq))
+				ranges.append((mid + 1, hi, depth + 1, bound_sq))
+
+		if best_idx < 0:
+			return None
+		distance_km = 2.0 * np.arcsin(min(np.sqrt(best_distance_sq) / 2.0, 1.0)) * EARTH_RADIUS_KM
+		return str(self.index[best_idx]['name']), str(self.index[best_idx]['type']), distance_km
+
+	def get_name_of_place(self, latitude, longitude):
+		'''Name of the nearest place, or None if there is none in range'''
+		nearest = self.find_nearest(latitude, longitude)
+		return nearest[0] if nearest is not None else None
+
+	def __repr__(self):
+		return '<Gazetteer({places!r})>'.format(places=len(self.index) if self.index is not None else 0)
+
+
+gazetteer = Gazetteer()
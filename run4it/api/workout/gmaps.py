@@ -1,23 +1,153 @@
+import math
+import threading
+import datetime as dt
 import googlemaps
 from flask import current_app
+from run4it.app.database import db
+from .model import GeoCodeCacheEntry
+from .gazetteer import gazetteer
 
 
 ADDR_COMPONENT_TYPES_WITH_PLACE = ["postal_town", "neighborhood", "sublocality", "administrative_area_level_2", "administrative_area_level_1"]
+GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOCODE_CACHE_DEFAULT_PRECISION = 6 # geohash cells of about 1.2 x 0.6 km
+GEOCODE_CACHE_DEFAULT_TTL_DAYS = 180
+GEOCODE_PROVIDER_GOOGLE = "google"
+GEOCODE_PROVIDER_OFFLINE = "offline" # nearest place of the local gazetteer
+
+
+def get_geohash(latitude, longitude, precision):
+    '''Geohash of a position, each character makes the cell about 32 times smaller'''
+    latitude_range = [-90.0, 90.0]
+    longitude_range = [-180.0, 180.0]
+    geohash = ""
+    char_bits = 0
+    num_bits = 0
+    is_longitude_bit = True
+
+    while len(geohash) < precision:
+        value_range, value = (longitude_range, longitude) if is_longitude_bit else (latitude_range, latitude)
+        middle = (value_range[0] + value_range[1]) / 2
+        if value >= middle:
+            char_bits = char_bits * 2 + 1
+            value_range[0] = middle
+        else:
+            char_bits = char_bits * 2
+            value_range[1] = middle
+        is_longitude_bit = not is_longitude_bit
+        num_bits += 1
+        if num_bits == 5:
+            geohash += GEOHASH_BASE32[char_bits]
+            char_bits = 0
+            num_bits = 0
+
+    return geohash
+
+
+class GeoCodeCache:
+    '''Names of places by geohash cell, stored in the database for ttl_days.
+    Most workouts start from a few places, so most lookups are served without a request to Google.'''
+
+    def __init__(self, precision=GEOCODE_CACHE_DEFAULT_PRECISION, ttl_days=GEOCODE_CACHE_DEFAULT_TTL_DAYS):
+        self.precision = precision
+        self.ttl_days = ttl_days
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def init_app(self, app):
+        self.precision = app.config.get("GEOCODE_CACHE_PRECISION", GEOCODE_CACHE_DEFAULT_PRECISION)
+        self.ttl_days = app.config.get("GEOCODE_CACHE_TTL_DAYS", GEOCODE_CACHE_DEFAULT_TTL_DAYS)
+        self.reset_stats()
+
+    def get_name_of_place(self, latitude, longitude, lookup_name_of_place):
+        '''Returns the cached name of the place, or lookup_name_of_place(latitude, longitude) which is cached.
+        The lookup returns None on failure, an expired name is then better than none, otherwise None is returned.'''
+        geohash = get_geohash(latitude, longitude, self.precision)
+        entry = GeoCodeCacheEntry.find_by_geohash(geohash)
+        now = dt.datetime.utcnow()
+
+        if entry is not None and entry.expires_at > now:
+            self._count(is_hit=True)
+            return entry.place_name
+
+        self._count(is_hit=False)
+        place_name = lookup_name_of_place(latitude, longitude)
+        if place_name is None:
+            return entry.place_name if entry is not None else None
+
+        try:
+            if entry is None:
+                entry = GeoCodeCacheEntry(geohash, place_name, now + dt.timedelta(days=self.ttl_days))
+            else:
+                entry.place_name = place_name
+                entry.expires_at = now + dt.timedelta(days=self.ttl_days)
+            entry.save()
+        except: # stored by another worker at the same time
+            db.session.rollback()
+        return place_name
+
+    def get_stats(self):
+        with self.lock:
+            num_lookups = self.hits + self.misses
+            return {
+                "precision": self.precision,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": round(self.hits / num_lookups, 3) if num_lookups > 0 else 0.0
+            }
+
+    def reset_stats(self):
+        with self.lock:
+            self.hits = 0
+            self.misses = 0
+
+    def _count(self, is_hit):
+        with self.lock:
+            if is_hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+
+geocode_cache = GeoCodeCache()
 
 
 class GeoCodeLookup:
+    '''Name of the place of a position, from Google (cached) or from the local gazetteer, as set by GEOCODE_PROVIDER.
+    Positions without a gazetteer place in range are looked up with Google if GEOCODE_GOOGLE_FALLBACK is set.'''
     def __init__(self):
-        self.client = googlemaps.Client(key=current_app.config['GOOGLE_API_KEY'])
+        self.client = None # created on first request to Google, cached names do not need it
+        self.provider = current_app.config.get("GEOCODE_PROVIDER", GEOCODE_PROVIDER_GOOGLE)
+        self.google_fallback = current_app.config.get("GEOCODE_GOOGLE_FALLBACK", True)
     
     def get_name_of_place(self, latitude, longitude):
+        place_name = self.find_name_of_place(latitude, longitude)
+        return place_name if place_name is not None else ""
+
+    def find_name_of_place(self, latitude, longitude):
+        '''Name of the place, empty if it has none, or None if it could not be looked up'''
+        if latitude is None or longitude is None or not math.isfinite(latitude) or not math.isfinite(longitude):
+            return ""
+        if self.provider == GEOCODE_PROVIDER_OFFLINE:
+            place_name = gazetteer.get_name_of_place(latitude, longitude)
+            if place_name is not None:
+                return place_name
+            if not self.google_fallback:
+                return ""
+        return geocode_cache.get_name_of_place(latitude, longitude, self._lookup_name_of_place)
+
+    def _lookup_name_of_place(self, latitude, longitude):
+        '''Name of the place from Google, or None if the request failed'''
         location_tuple = (latitude, longitude)
-        address_components = None
         
         try:
+            if self.client is None:
+                self.client = googlemaps.Client(key=current_app.config['GOOGLE_API_KEY'])
             result = self.client.reverse_geocode(location_tuple)
             address_components = self._get_address_components(result)
         except:
-            pass
+            return None
 
         return self._find_place_in_address_components(address_components)
 
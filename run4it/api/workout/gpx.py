@@ -1,39 +1,65 @@
-from copy import copy as objcopy
 from os import path
-from geopy.distance import distance as geo_distance
-from math import sqrt, floor
-import gpxpy
-
+from math import floor
+import xml.etree.ElementTree as ElementTree
 import datetime as dt
-
-SPEED_NO_MOVEMENT_LIMIT_M_PER_S = 0.5
-ELEVATION_GAIN_IGNORE_LIMIT_M = 0.1
-SPLIT_DISTANCE_M = 998 # in practice, we get approx ~1000m pr split
-
-class WorkoutDataPoint:
-	
-	def __init__(self, latitude, longitude, elevation, time, duration, distance, avg_speed, heart_bpm=0):
-		self.latitude = round(latitude, 6) # decimal degrees
-		self.longitude = round(longitude, 6)  # decimal degrees
-		self.elevation = round(elevation, None) # meter
-		self.time = time
-		self.duration = round(duration, 1) # seconds
-		self.distance = round(distance, 1) # meters
-		self.average_speed = round(avg_speed, 1)
-		self.heart_bpm = round(heart_bpm, None)
-	
-	@property
-	def average_pace(self):
-		if self.average_speed > 0.0:
-			pace_float = 60.0 / self.average_speed
-			pace_min = floor(pace_float)
-			pace_sec = int((pace_float - pace_min) * 60)
-			return "{0:02d}:{1:02d}".format(pace_min, pace_sec)
-		else:
-			return ""
-
-	def __repr__(self):
-		return '<WorkoutDataPoint({time!r}s, {dist!r}m, {speed!r}kmh>'.format(time=self.duration, dist=self.distance, speed=self.average_speed)
+from .track import TrackPointsBuilder, SPLIT_DISTANCE_M, get_local_xml_tag, parse_xml_datetime
+from .pipeline import TRACK_CHUNK_POINTS, chunk_points, ingest_track
+
+
+def read_gpx_trackpoints(filename):
+	'''Yields (track_no, time, latitude, longitude, elevation) for each trkpt, using an incremental parser.
+	Tracks are numbered from 1; a track without points is yielded as (track_no, None, None, None, None).
+	Elements are discarded once read.'''
+	track_no = 0
+	track_has_points = False
+	segment = None
+	for event, elem in ElementTree.iterparse(filename, events=('start', 'end')):
+		tag = get_local_xml_tag(elem.tag)
+
+		if event == 'start':
+			if tag == 'trkseg':
+				segment = elem
+			elif tag == 'trk':
+				track_no += 1
+				track_has_points = False
+			continue
+
+		if tag == 'trkpt':
+			time = elevation = None
+			for child in elem:
+				child_tag = get_local_xml_tag(child.tag)
+				if child_tag == 'time':
+					time = parse_xml_datetime(child.text.strip())
+				elif child_tag == 'ele':
+					elevation = float(child.text)
+
+			if time is not None:
+				track_has_points = True
+				yield track_no, time, float(elem.get('lat')), float(elem.get('lon')), elevation
+
+			elem.clear()
+			if segment is not None:
+				segment.remove(elem)
+		elif tag == 'trkseg':
+			elem.clear()
+			segment = None
+		elif tag == 'trk':
+			if not track_has_points:
+				yield track_no, None, None, None, None
+			elem.clear()
+
+
+def decode_gpx_track(filename):
+	'''Decode stage of the ingest pipeline, yields the points of the first track of a GPX file in chunks'''
+	return chunk_points(read_gpx_first_track(filename))
+
+
+def read_gpx_first_track(filename):
+	for track_no, time, latitude, longitude, elevation in read_gpx_trackpoints(filename):
+		if track_no > 1:
+			break # the rest of the file is not parsed
+		if time is not None:
+			yield time, latitude, longitude, elevation, None
 
 
 class GpxParser:
@@ -46,152 +72,33 @@ class GpxParser:
 
 		if self.gpx_filepath is not None:
 			try:
-				gpx_file = open(self.gpx_filepath, 'r')
-				self.gpx_data = gpxpy.parse(gpx_file)
-				gpx_file.close()
+				self.gpx_data = self._read_tracks(self.gpx_filepath)
 			except:
 				self.gpx_data = None
 
-		if self.gpx_data is not None and len(self.gpx_data.tracks) == 0:
+		if self.gpx_data is not None and len(self.gpx_data) == 0:
 			self.gpx_data = None
 
 	def get_num_of_tracks(self):
 		if self.gpx_data is not None:
-			return len(self.gpx_data.tracks)
+			return len(self.gpx_data)
 		else:
 			return 0
 	
 	def get_track_data(self, track_no):
 		if track_no > 0 and track_no <= self.get_num_of_tracks():
-			track_raw_data = self.gpx_data.tracks[track_no - 1]
-			points = self._get_segments_points(track_raw_data.segments)
-			return self._process_track_points(points)
+			return ingest_track(self.gpx_data[track_no - 1].build().get_chunks(TRACK_CHUNK_POINTS), SPLIT_DISTANCE_M)
 		else:
 			return None, None, None
 
-	def _process_track_points(self, points):
-		track_data = list()
-		split_data = list()
-		summary = None
-		cumulative_duration = 0.0
-		cumulative_distance = 0.0
-		cumulative_elevation_gain = 0.0
-		start_dist_current_split = 0
-		start_dur_current_split = 0
-		start_ele_current_split = 0
-
-		for idx in range(len(points)):
-			if idx == 0:
-				track_data.append(WorkoutDataPoint(points[idx].latitude, points[idx].longitude, points[idx].elevation, points[idx].time, 0, 0, 0))
-				start_ele_current_split = track_data[0].elevation
-			else:
-				point = points[idx]
-				previous_point = points[idx-1]
-				# duration			
-				time_diff = round((point.time - previous_point.time).total_seconds(), 1)
-				cumulative_duration += time_diff		
-				# distance
-				elevation_diff = floor(point.elevation - previous_point.elevation)
-				distance_diff_2d = geo_distance((previous_point.latitude, previous_point.longitude), (point.latitude, point.longitude)).m
-				cumulative_distance += sqrt(distance_diff_2d**2 + (elevation_diff)**2)
-				# speed & elevation gain, slightly averaged
-				avg_speed_kmh = 0
-				if idx > 4:
-					previous_point5 = points[idx-5]
-					speed_elevation_diff = floor(point.elevation - previous_point5.elevation)
-					speed_time_diff = round((point.time - previous_point5.time).total_seconds(), 1)
-					speed_dist_diff_2d = geo_distance((previous_point5.latitude, previous_point5.longitude), (point.latitude, point.longitude)).m
-					speed_dist_diff_3d = sqrt(speed_dist_diff_2d**2 + (speed_elevation_diff)**2)
-					if (speed_elevation_diff / 5) > ELEVATION_GAIN_IGNORE_LIMIT_M:
-						cumulative_elevation_gain += (speed_elevation_diff / 5)
-					if speed_time_diff > 0:
-						avg_speed_kmh = 3.6 * speed_dist_diff_3d / speed_time_diff
-				# add record
-				track_data.append(WorkoutDataPoint(point.latitude, point.longitude, point.elevation, point.time, cumulative_duration, cumulative_distance, avg_speed_kmh))
-				# splits
-				if cumulative_distance-start_dist_current_split >= SPLIT_DISTANCE_M or idx == (len(points)-1):
-					split_point = objcopy(track_data[-1])
-					split_point.distance -= start_dist_current_split
-					split_point.duration -= start_dur_current_split
-					split_point.elevation -= start_ele_current_split
-					if split_point.duration > 0:
-						split_point.average_speed = 3.6 * split_point.distance / split_point.duration
-					else:
-						split_point.average_speed = 0.0
-					split_data.append(split_point)
-					start_dist_current_split = cumulative_distance
-					start_dur_current_split = cumulative_duration
-					start_ele_current_split = track_data[-1].elevation
-				
-				# hack to set speed for first records
-				if idx == 5:
-					track_data[0].average_speed = track_data[5].average_speed
-					track_data[1].average_speed = track_data[5].average_speed
-					track_data[2].average_speed = track_data[5].average_speed
-					track_data[3].average_speed = track_data[5].average_speed
-					track_data[4].average_speed = track_data[5].average_speed
-		# summary
-		if len(track_data) > 0:
-			# summary contains: start lat./long., total elevation gain, total duration, total distance, avg speed
-			first_point = points[0]
-			last_track_data = track_data[-1]
-			total_avg_speed_kmh = 3.6 * last_track_data.distance / last_track_data.duration
-			summary = WorkoutDataPoint(first_point.latitude, first_point.longitude, cumulative_elevation_gain, first_point.time, last_track_data.duration, last_track_data.distance, total_avg_speed_kmh)
-		
-		return track_data, split_data, summary
-
-
-
-	def _get_segments_points(self, segments_raw_data):
-		return_points = []
-		for segment_raw_data in segments_raw_data:
-			segment_points = segment_raw_data.points
-			return_points += segment_points
-		
-		# remove points in both ends of array if movement is very low
-		start_idx = self._find_movement_start(return_points)
-		end_idx = self._find_movement_end(return_points)
-		num_points = len(return_points)
-
-		if end_idx <= start_idx:
-			return_points = []
-
-		if end_idx < (num_points-1):
-			return_points = return_points[:end_idx]
-
-		if start_idx > 0:
-			return_points = return_points[start_idx:]
-
-		return return_points
-	
-	def _find_movement_start(self, points):
-		i=1
-		while i < len(points):
-			p1 = points[i-1]
-			p2 = points[i]
-			dist = geo_distance((p1.latitude, p1.longitude),(p2.latitude,p2.longitude)).m
-			time = (p2.time - p1.time).total_seconds()
-			if time>0:
-				speed = dist/time
-				if speed > SPEED_NO_MOVEMENT_LIMIT_M_PER_S:
-					break
-			i+=1
-		return i-1
-	
-	def _find_movement_end(self, points):
-		i=len(points)-1
-		while i > 0:
-			p1 = points[i-1]
-			p2 = points[i]
-			dist = geo_distance((p1.latitude, p1.longitude),(p2.latitude,p2.longitude)).m
-			time = (p2.time - p1.time).total_seconds()
-			if time>0:
-				speed = dist/time
-				if speed > SPEED_NO_MOVEMENT_LIMIT_M_PER_S:
-					break
-			i-=1
-
-		return i
+	def _read_tracks(self, filename):
+		tracks = []
+		for track_no, time, latitude, longitude, elevation in read_gpx_trackpoints(filename):
+			if track_no > len(tracks):
+				tracks.append(TrackPointsBuilder())
+			if time is not None:
+				tracks[-1].add(time, latitude, longitude, elevation, None) # segments of a track are joined
+		return tracks
 
 	def __repr__(self):
 		return '<GpxParser({file!r}, {tracks!r}>'.format(file=self.gpx_filepath, tracks=self.get_num_of_tracks())
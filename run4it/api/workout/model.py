@@ -1,10 +1,29 @@
+import math
+import json
 import ntpath
+import datetime as dt
 from math import floor
 from sqlalchemy import and_
-from run4it.app.database import Column, SurrogatePK, reference_col, relationship, db
-from .gpx import GpxParser
-from .tcx import TcxParser
-from .fit import FitParser
+from run4it.app.database import Column, SurrogatePK, TimestampedModel, reference_col, relationship, db
+from .gpx import decode_gpx_track
+from .tcx import decode_tcx_track, SPLIT_DISTANCE_M as TCX_SPLIT_DISTANCE_M
+from .fit import decode_fit_track, read_fit_summary, read_fit_laps
+from .track import SPLIT_DISTANCE_M
+from .pipeline import ingest_track
+from .cache import track_cache
+from .store import read_track_store, write_track_store
+from .simplify import simplify_track_data, TRACK_SIMPLIFY_MAP
+
+WORKOUT_JOB_PENDING = "pending"
+WORKOUT_JOB_PROCESSING = "processing"
+WORKOUT_JOB_COMPLETED = "completed"
+WORKOUT_JOB_FAILED = "failed"
+# decode stage and split distance of each workout file format, by extension
+WORKOUT_FILE_DECODERS = {
+	"gpx": (decode_gpx_track, SPLIT_DISTANCE_M),
+	"tcx": (decode_tcx_track, TCX_SPLIT_DISTANCE_M),
+	"fit": (decode_fit_track, SPLIT_DISTANCE_M),
+}
 
 
 def is_filename_extension_of_type(filename, extension):
@@ -13,6 +32,48 @@ def is_filename_extension_of_type(filename, extension):
 	else:
 		return False
 
+def parse_workout_file(filepath):
+	'''Returns (track data, split data, summary) from a GPX, TCX or FIT file, or (None, None, None).
+	The file is read in one pass through the stages of the ingest pipeline, only the first track is used.'''
+	for extension, (decode, split_distance) in WORKOUT_FILE_DECODERS.items():
+		if is_filename_extension_of_type(filepath, extension):
+			try:
+				return ingest_track(decode(filepath), split_distance)
+			except Exception:
+				return None, None, None
+	return None, None, None
+
+def load_workout_file(filepath):
+	'''Returns (track data, split data, summary) from the stored track of a workout file,
+	the file is parsed and its track stored if this has not been done before'''
+	parsed = read_track_store(filepath)
+	if parsed is None:
+		parsed = parse_workout_file(filepath)
+		write_track_store(filepath, parsed)
+	return parsed
+
+def load_workout_summary(filepath):
+	'''Returns the summary of a workout file, from the totals recorded by the device without processing the track
+	if the file has them, otherwise as load_workout_file does'''
+	if is_filename_extension_of_type(filepath, "fit"):
+		try:
+			summary = read_fit_summary(filepath)
+		except Exception:
+			summary = None
+		if summary is not None:
+			return summary
+	_, _, summary = load_workout_file(filepath)
+	return summary
+
+def load_workout_laps(filepath):
+	'''Returns the laps recorded by the device in a workout file as TrackData, or None'''
+	if not is_filename_extension_of_type(filepath, "fit"):
+		return None
+	try:
+		return read_fit_laps(filepath)
+	except Exception:
+		return None
+
 class WorkoutCategory(SurrogatePK, db.Model):
 	__tablename__ = 'workout_categories'
 	id = Column(db.Integer, primary_key=True, index=True)
@@ -39,6 +100,9 @@ class Workout(SurrogatePK, db.Model):
 	climb = Column(db.Integer, nullable=False)
 	resource_path = Column(db.String(255), unique=True, nullable=True)
 	edited = Column(db.Boolean, nullable=False)
+	name_pending = Column(db.Boolean, nullable=False, default=False) # category name is a placeholder until the place is looked up
+	start_latitude = Column(db.Float, nullable=True)
+	start_longitude = Column(db.Float, nullable=True)
 
 	category_id = reference_col('workout_categories', nullable=False)
 	category = relationship('WorkoutCategory')
@@ -47,26 +111,30 @@ class Workout(SurrogatePK, db.Model):
 	def __init__(self, profile_id, category, name, start_at, distance, duration, climb, resource_path=None, edited=False):
 		db.Model.__init__(self, profile_id=profile_id, category=category, name=name, start_at=start_at, distance=distance, duration=duration, climb=climb, resource_path=resource_path, edited=edited)
 
-	def register_extended_data(self):
+	def register_extended_data(self, max_points=None, simplify_method=TRACK_SIMPLIFY_MAP, from_distance=None, to_distance=None, from_duration=None, to_duration=None):
 		self.extended_track_data = None
 		self.extended_split_data = None
 		self.extended_summary = None
-		# parse file if it exists
-		if is_filename_extension_of_type(self.resource_path, "gpx"):
-			gpx = GpxParser(self.resource_path)
-			if gpx.get_num_of_tracks() > 0:
-				self.extended_track_data, self.extended_split_data, self.extended_summary = gpx.get_track_data(1) # we only expect one track per file
-		elif is_filename_extension_of_type(self.resource_path, "tcx"):
-			tcx = TcxParser(self.resource_path)
-			if tcx.get_num_of_tracks() > 0:
-				self.extended_track_data, self.extended_split_data, self.extended_summary = tcx.get_track_data()
-		elif is_filename_extension_of_type(self.resource_path, "fit"):
-			fit = FitParser(self.resource_path)
-			if fit.get_num_of_tracks() > 0:
-				self.extended_track_data, self.extended_split_data, self.extended_summary = fit.get_track_data()
+		self.extended_lap_data = None
+		# load track of file if it exists, files do not change after upload so the result is cached
+		if self.resource_path is not None and self.resource_path != "":
+			self.extended_track_data, self.extended_split_data, self.extended_summary = track_cache.get(self.resource_path, load_workout_file)
+			self.extended_lap_data = track_cache.get(self.resource_path, load_workout_laps, "laps")
+			if self.extended_track_data is not None:
+				self.extended_track_data = self.extended_track_data.get_range(from_distance, to_distance, from_duration, to_duration)
+			# reduced level of detail is cached separately, for each level (and range)
+			if max_points is not None and self.extended_track_data is not None and len(self.extended_track_data) > max_points:
+				self.extended_track_data, _, _ = track_cache.get(self.resource_path,
+					lambda filepath: self._get_simplified_extended_data(max_points, simplify_method),
+					(max_points, simplify_method, from_distance, to_distance, from_duration, to_duration))
 		if not self.category.supports_gps_data:
 			self.extended_track_data = None
 			self.extended_split_data = None
+			self.extended_lap_data = None
+
+	def _get_simplified_extended_data(self, max_points, simplify_method):
+		simplified_track_data = simplify_track_data(self.extended_track_data, max_points, simplify_method)
+		return simplified_track_data, self.extended_split_data, self.extended_summary
 
 	@property
 	def resource_file(self):
@@ -102,6 +170,18 @@ class Workout(SurrogatePK, db.Model):
 		else:
 			return ""
 
+	def set_pending_name(self, latitude, longitude):
+		'''Names the workout by its category until the place of its start position is looked up'''
+		self.name = self.category.name
+		self.name_pending = True
+		has_position = latitude is not None and longitude is not None and math.isfinite(latitude) and math.isfinite(longitude)
+		self.start_latitude = latitude if has_position else None
+		self.start_longitude = longitude if has_position else None
+
+	@classmethod
+	def get_pending_names(cls, limit, after_id=0):
+		return cls.query.filter(cls.name_pending==True, cls.id > after_id).order_by(cls.id.asc()).limit(limit).all()
+
 	@classmethod
 	def get_workouts_for_goal(cls, goal):
 		if goal.category.workout_category is not None:
@@ -119,3 +199,76 @@ class Workout(SurrogatePK, db.Model):
 		return '<Workout({name!r},{distance!r}m)>'.format(
 			name=self.name,
 			distance=self.distance)
+
+
+class WorkoutUploadJob(SurrogatePK, TimestampedModel):
+	'''Uploaded workout file waiting for, or done with, processing in the background'''
+	__tablename__ = 'workout_upload_jobs'
+	status = Column(db.String(16), nullable=False, index=True)
+	progress = Column(db.Integer, nullable=False)
+	message = Column(db.String(255), nullable=True)
+	filepath = Column(db.String(255), nullable=False)
+	archive_results = Column(db.Text, nullable=True) # JSON results of the files of an archive, when the job imports one
+
+	category_id = reference_col('workout_categories', nullable=False)
+	category = relationship('WorkoutCategory')
+	profile_id = reference_col('user_profiles', nullable=False, index=True)
+	workout_id = reference_col('workouts', nullable=True)
+	workout = relationship('Workout')
+
+	def __init__(self, profile_id, category, filepath):
+		db.Model.__init__(self, profile_id=profile_id, category=category, filepath=filepath, status=WORKOUT_JOB_PENDING, progress=0)
+
+	def set_status(self, status, progress, message=None):
+		self.status = status
+		self.progress = progress
+		self.message = message
+		self.updated_at = dt.datetime.utcnow()
+
+	@property
+	def is_archive(self):
+		return self.filepath.lower().endswith(".zip")
+
+	@property
+	def archive_import(self):
+		return json.loads(self.archive_results) if self.archive_results is not None else None
+
+	def set_archive_import(self, archive_import):
+		self.archive_results = json.dumps(archive_import) if archive_import is not None else None
+
+	def claim(self):
+		'''Marks a pending job as processing, returns False if another worker got to it first'''
+		num_claimed = WorkoutUploadJob.query.filter_by(id=self.id, status=WORKOUT_JOB_PENDING).update(
+			{ 'status': WORKOUT_JOB_PROCESSING, 'updated_at': dt.datetime.utcnow() }, synchronize_session=False)
+		db.session.commit()
+		return num_claimed == 1
+
+	@classmethod
+	def find_for_profile(cls, profile_id, job_id):
+		# jobs are updated by the workers, so the row is always read again
+		return cls.query.populate_existing().filter_by(id=job_id, profile_id=profile_id).first()
+
+	@classmethod
+	def get_stale_pending(cls, updated_before):
+		return cls.query.filter(and_(cls.status==WORKOUT_JOB_PENDING, cls.updated_at < updated_before)).order_by(cls.id.asc()).all()
+
+	def __repr__(self):
+		return '<WorkoutUploadJob({id!r},{status!r})>'.format(id=self.id, status=self.status)
+
+
+class GeoCodeCacheEntry(SurrogatePK, db.Model):
+	'''Name of the place of a geohash cell, as found by reverse geocoding'''
+	__tablename__ = 'geocode_cache'
+	geohash = Column(db.String(12), nullable=False, unique=True, index=True)
+	place_name = Column(db.String(128), nullable=False) # empty if the lookup found no place
+	expires_at = Column(db.DateTime, nullable=False)
+
+	def __init__(self, geohash, place_name, expires_at):
+		db.Model.__init__(self, geohash=geohash, place_name=place_name, expires_at=expires_at)
+
+	@classmethod
+	def find_by_geohash(cls, geohash):
+		return cls.query.filter_by(geohash=geohash).first()
+
+	def __repr__(self):
+		return '<GeoCodeCacheEntry({geohash!r},{place_name!r})>'.format(geohash=self.geohash, place_name=self.place_name)
@@ -0,0 +1,153 @@
+"""Ingest of workout files as a pipeline of generator stages, run in one forward pass over the points of a track:
+decode, sanitize, trim, collect, metrics. Stages pass the points on in chunks of TrackPoints that share the start
+time of the track, so each stage works on arrays while only a chunk of the file is held between two stages.
+A file format only needs a decode stage, yielding the chunks of its (first) track. A decode stage with a
+get_summary(summary) method can replace the computed summary with the totals recorded in the file."""
+import datetime as dt
+import numpy as np
+from .track import TrackPoints, TrackPointsBuilder, SPLIT_DISTANCE_M, get_moving_pairs, fill_missing_values, track_distance
+
+TRACK_CHUNK_POINTS = 1024
+
+
+def chunk_points(points, chunk_size=TRACK_CHUNK_POINTS):
+	'''Decode stage helper, yields points given one by one as (time, latitude, longitude, elevation, heart_bpm)
+	or with the distance and speed recorded by the device added, as chunks of up to chunk_size points.
+	Values not found are None.'''
+	chunk = TrackPointsBuilder()
+	for point in points:
+		chunk.add(*point)
+		if len(chunk) == chunk_size:
+			yield chunk.build(fill_elevations=False)
+			chunk = TrackPointsBuilder(chunk.start_time)
+	if len(chunk) > 0:
+		yield chunk.build(fill_elevations=False)
+
+
+def sanitize_points(chunks, device_metrics=None):
+	'''Points without elevation get the elevation of the previous point, then points without position are dropped.
+	With device metrics (track_distance.device_metrics if not given), distance and speed recorded by the device are
+	passed on, and points without position are kept if the device recorded their distance, at the previous position.
+	Values missing before the first one are filled in when the track is collected.'''
+	if device_metrics is None:
+		device_metrics = track_distance.device_metrics
+	previous_elevation = previous_latitude = previous_longitude = np.nan
+	for chunk in chunks:
+		latitudes, longitudes, elevations = chunk.latitudes, chunk.longitudes, chunk.elevations
+		device_distances, device_speeds = (chunk.device_distances, chunk.device_speeds) if device_metrics else (None, None)
+		if np.isnan(elevations).any():
+			elevations = fill_forward(elevations, previous_elevation)
+		if len(elevations) > 0:
+			previous_elevation = elevations[-1]
+
+		with_position = ~np.isnan(latitudes) & ~np.isnan(longitudes)
+		kept = with_position
+		if device_distances is not None and not np.all(with_position):
+			latitudes = fill_forward(np.where(with_position, latitudes, np.nan), previous_latitude)
+			longitudes = fill_forward(np.where(with_position, longitudes, np.nan), previous_longitude)
+			kept = with_position | ~np.isnan(device_distances)
+		if np.any(with_position):
+			last_position_idx = np.flatnonzero(with_position)[-1]
+			previous_latitude, previous_longitude = latitudes[last_position_idx], longitudes[last_position_idx]
+
+		chunk = TrackPoints(chunk.start_time, chunk.time_offsets, latitudes, longitudes, elevations, chunk.heart_rates, device_distances, device_speeds)
+		if not np.all(kept):
+			chunk = chunk.view(np.flatnonzero(kept))
+		if len(chunk) > 0:
+			yield chunk
+
+
+def trim_no_movement(chunks):
+	'''Drops the points in both ends of the track where movement is very low, as TrackPoints.strip_no_movement does.
+	Leading points are dropped as they arrive, only the last one is kept to pair with the next chunk. Points from the
+	last moving point on are held back until movement resumes, and dropped at the end of the track.'''
+	held = [] # points not passed on yet
+	previous = None # last point of the previous chunk, to test movement to the first point of a chunk
+	is_started = False
+	for chunk in chunks:
+		if len(chunk) == 0:
+			continue
+		moving_idx = get_moving_indices(chunk, previous)
+		previous = chunk.view(slice(-1, None))
+
+		if len(moving_idx) == 0:
+			if is_started:
+				held.append(chunk)
+			else:
+				held = [previous]
+			continue
+
+		start = 0
+		if not is_started:
+			is_started = True
+			if moving_idx[0] > 0: # movement starts within the chunk, the point before it is dropped if held
+				held = []
+				start = moving_idx[0] - 1
+		yield from held
+		if moving_idx[-1] > start:
+			yield chunk.view(slice(start, moving_idx[-1]))
+		held = [chunk.view(slice(moving_idx[-1], None))]
+
+	# the last moving point is dropped, unless it is the last point, as it always has been
+	if is_started and sum(len(chunk) for chunk in held) == 1:
+		yield from held
+
+
+def collect_points(chunks):
+	'''Joins the chunks of a track into TrackPoints, with times relative to its first point'''
+	chunks = [chunk for chunk in chunks if len(chunk) > 0]
+	if len(chunks) == 0:
+		return TrackPoints(None, [], [], [], [], [])
+
+	time_offsets = np.concatenate([chunk.time_offsets for chunk in chunks])
+	start_time = chunks[0].start_time + dt.timedelta(seconds=time_offsets[0])
+	# positions are only missing where the device recorded the distance, before the first position (or all of them)
+	return TrackPoints(start_time, time_offsets - time_offsets[0],
+		fill_missing_values(np.concatenate([chunk.latitudes for chunk in chunks]), np.nan),
+		fill_missing_values(np.concatenate([chunk.longitudes for chunk in chunks]), np.nan),
+		fill_missing_values(np.concatenate([chunk.elevations for chunk in chunks]), 0.0),
+		np.concatenate([chunk.heart_rates for chunk in chunks]),
+		join_device_column(chunks, 'device_distances'),
+		join_device_column(chunks, 'device_speeds'))
+
+
+def get_track_points(chunks):
+	'''TrackPoints of the decoded chunks of a track, sanitized and trimmed'''
+	return collect_points(trim_no_movement(sanitize_points(chunks)))
+
+
+def ingest_track(chunks, split_distance=SPLIT_DISTANCE_M):
+	'''Returns (track data, split data, summary) of the decoded chunks of a track, or (None, None, None) if no point is left'''
+	points = get_track_points(chunks)
+	if len(points) == 0:
+		return None, None, None
+	track_data, split_data, summary = points.get_track_data(split_distance)
+	get_summary = getattr(chunks, 'get_summary', None)
+	if get_summary is not None:
+		summary = get_summary(summary)
+	return track_data, split_data, summary
+
+
+def get_moving_indices(chunk, previous=None):
+	'''Indices of the points of a chunk that are the second point of a moving pair, the first point of the chunk is
+	paired with previous'''
+	if previous is None:
+		return np.flatnonzero(get_moving_pairs(chunk.latitudes, chunk.longitudes, chunk.time_offsets, chunk.device_distances)) + 1
+	moving = get_moving_pairs(np.concatenate((previous.latitudes, chunk.latitudes)), np.concatenate((previous.longitudes, chunk.longitudes)),
+		np.concatenate((previous.time_offsets, chunk.time_offsets)), join_device_column([previous, chunk], 'device_distances'))
+	return np.flatnonzero(moving)
+
+
+def join_device_column(chunks, column):
+	'''Joined values of a device column of chunks, NaN for chunks without it, None if no chunk has it'''
+	if all(getattr(chunk, column) is None for chunk in chunks):
+		return None
+	return np.concatenate([np.full(len(chunk), np.nan) if getattr(chunk, column) is None else getattr(chunk, column) for chunk in chunks])
+
+
+def fill_forward(values, previous=np.nan):
+	'''Replaces NaN values with the previous valid value, starting from previous'''
+	values = np.concatenate(([previous], values))
+	valid_idx = np.where(~np.isnan(values), np.arange(len(values)), 0)
+	np.maximum.accumulate(valid_idx, out=valid_idx)
+	return values[valid_idx][1:]
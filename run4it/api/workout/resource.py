@@ -1,18 +1,36 @@
-from os import path, rename, remove
+import zipfile
+from os import path, rename, remove, stat
 import pytz
 import datetime as dt
-from flask import current_app
+from uuid import uuid4
+from flask import current_app, Response, g, url_for
 from flask_restful import request, Resource
 from flask_apispec import marshal_with
 from flask_jwt_extended import jwt_required
 from webargs.flaskparser import use_kwargs
 from werkzeug.utils import secure_filename
 from run4it.api.templates import report_error_and_abort
+from run4it.api.serializer import dumps
+from run4it.api.conditional import (get_rows_etag, get_conditional_headers, get_not_modified_response,
+	get_reference_cache_control)
 from run4it.api.profile.auth_helper import get_auth_profile_or_abort
 from run4it.app.database import db
-from .model import Workout, WorkoutCategory as WorkoutCategoryModel
-from .schema import workout_schema, workouts_schema, workout_update_schema, workout_categories_schema
-from .gmaps import GeoCodeLookup
+from run4it.app.jobs import background_jobs
+from .model import (Workout, WorkoutCategory as WorkoutCategoryModel, WorkoutUploadJob,
+	WORKOUT_JOB_PROCESSING, WORKOUT_JOB_COMPLETED, WORKOUT_JOB_FAILED)
+from .schema import (workout_schema, workouts_schema, workout_update_schema, workout_categories_schema, workout_track_schema,
+	workout_stream_schema, workout_upload_schema, workout_upload_job_schema, workout_archive_import_schema, dump_track_data)
+from .gmaps import GeoCodeLookup, geocode_cache, get_geohash
+from .archive import (extract_workout_files, parse_workout_file_summaries, get_archive_pool_size, ARCHIVE_FILE_CREATED,
+	ARCHIVE_FILE_FAILED, ARCHIVE_FILE_SKIPPED, ARCHIVE_DEFAULT_MAX_FILES, ARCHIVE_DEFAULT_MAX_FILE_BYTES)
+from .store import rename_track_store, remove_track_store
+from .simplify import TRACK_SIMPLIFY_MAP
+
+TRACK_STREAM_CHUNK_POINTS = 500 # trackData points serialized at a time when streaming
+WORKOUT_JOB_PROGRESS_STARTED = 10
+WORKOUT_JOB_PROGRESS_PARSED = 50
+WORKOUT_NAMING_BATCH_SIZE = 100
+WORKOUT_ARCHIVE_DEFAULT_BATCH_SIZE = 50 # workouts of an archive created per transaction
 
 
 def is_valid_workout_filename(filename):
@@ -35,21 +53,62 @@ def save_uploaded_file_or_abort(uploaded_file, profile_name):
 	return filepath
 
 
-def get_autogenerated_workout_name(latitude, longitude, category_name):
-	try:
-		print("get_autogenerated_workout_name, {0},{1}".format(latitude, longitude))
-		geoLookupClient = GeoCodeLookup()
-		place_name = geoLookupClient.get_name_of_place(latitude, longitude)
-		print("place_name:", place_name)
-		if place_name != "":
-			return "{0} {1}".format(place_name, category_name)
-		else:
-			return category_name
-	except Exception as e:
-		print(e)
+def get_autogenerated_workout_name(place_name, category_name):
+	if place_name != "":
+		return "{0} {1}".format(place_name, category_name)
+	else:
 		return category_name
 
 
+def name_pending_workouts(max_workouts=WORKOUT_NAMING_BATCH_SIZE):
+	'''Names the first max_workouts pending workouts, returns the number named'''
+	return name_workouts(Workout.get_pending_names(max_workouts))
+
+
+def name_workouts(workouts):
+	'''Replaces the placeholder names of pending workouts by the place they started from, returns the number named.
+	Each geohash cell is looked up once per batch, workouts renamed by the user are no longer pending and keep their name.'''
+	if len(workouts) == 0:
+		return 0
+
+	geocode_lookup = GeoCodeLookup()
+	place_names = {}
+	named = []
+	renamed = []
+	for workout in workouts:
+		if workout.name != workout.category_name: # renamed, or moved to another category, since it was created
+			renamed.append((workout.id, workout.name))
+			continue
+		if workout.start_latitude is None or workout.start_longitude is None:
+			place_name = ""
+		else:
+			cell = get_geohash(workout.start_latitude, workout.start_longitude, geocode_cache.precision)
+			if cell not in place_names:
+				place_names[cell] = geocode_lookup.find_name_of_place(workout.start_latitude, workout.start_longitude)
+			place_name = place_names[cell]
+		if place_name is not None: # else the lookup failed, it is tried again by the next pass
+			named.append((workout.id, workout.category_name, get_autogenerated_workout_name(place_name, workout.category_name)))
+
+	num_named = 0
+	try:
+		for workout_id, name in renamed:
+			Workout.query.filter_by(id=workout_id, name_pending=True, name=name).update({ 'name_pending': False }, synchronize_session=False)
+		for workout_id, placeholder_name, name in named: # only if the placeholder is still there
+			num_named += Workout.query.filter_by(id=workout_id, name_pending=True, name=placeholder_name).update(
+				{ 'name': name, 'name_pending': False }, synchronize_session=False)
+		db.session.commit()
+	except:
+		db.session.rollback()
+		return 0
+	return num_named
+
+
+def request_workout_naming():
+	'''Names new workouts in the background, without it they are named by the workout_names script'''
+	if current_app.config.get("WORKOUT_NAMING_IN_BACKGROUND", True):
+		background_jobs.submit(name_pending_workouts)
+
+
 def rename_uploaded_file(tmp_filepath, profile_name, workout_id):
 	# no try/except intentionally here, as we call this within a try block, and want to crash if rename fails :o)
 	filepath = ""
@@ -59,6 +118,7 @@ def rename_uploaded_file(tmp_filepath, profile_name, workout_id):
 		filename = "{0}_workout_{1}.{2}".format(profile_name, workout_id, extension)
 		filepath = path.join(current_app.config["GPX_UPLOAD_DIR"], filename)
 		rename(tmp_filepath, filepath)
+		rename_track_store(tmp_filepath, filepath)
 
 	return filepath
 
@@ -69,12 +129,32 @@ def remove_uploaded_file(filepath):
 			remove(filepath)
 		except:
 			pass
+		remove_track_store(filepath)
+
+def generate_workout_json(workout_json, track_data):
+	'''Yields the dumped workout as JSON, followed by its track data, a chunk of points at a time'''
+	header_json = dumps(workout_json)
+	yield header_json[:-1] + (', ' if len(workout_json) > 0 else '') + '"trackData": ['
+	for chunk_start in range(0, len(track_data), TRACK_STREAM_CHUNK_POINTS):
+		chunk = track_data.select(slice(chunk_start, chunk_start + TRACK_STREAM_CHUNK_POINTS))
+		yield (', ' if chunk_start > 0 else '') + dumps(dump_track_data(chunk))[1:-1]
+	yield ']}'
+
+def get_workout_file_version(filepath):
+	'''Modification time and size of the workout file, the extended data is parsed from it'''
+	if filepath is None:
+		return None
+	try:
+		file_stat = stat(filepath)
+	except OSError:
+		return None
+	return (file_stat.st_mtime_ns, file_stat.st_size)
 
-def add_workout_data_to_goals(profile, workout):
+def add_workout_data_to_goals(profile, workout, commit=True):
 	goals = profile.get_active_goals(workout.start_at) # active 'as-we-speak'
 	if goals is not None:
 		for goal in goals:
-			goal.update_from_workout(workout)
+			goal.update_from_workout(workout, commit)
 
 def remove_workout_data_from_goals(profile, workout):
 	goals = profile.get_active_goals(workout.start_at) # active 'as-we-speak'
@@ -82,6 +162,195 @@ def remove_workout_data_from_goals(profile, workout):
 		for goal in goals:
 			goal.remove_from_workout(workout)
 
+def create_workout_from_file(profile, category, tmp_filepath, report_progress=None):
+	'''Parses an uploaded workout file and saves it as a new workout of the profile.
+	Returns (workout, None, None), or (None, http code, error) with the file removed if it failed.'''
+	# create object with temporary data and use it to parse workout file
+	new_workout = Workout(profile.id, category, category.name, dt.datetime.utcnow(), 0, 1, 0, tmp_filepath, False)
+	new_workout.register_extended_data()
+	parsed_summary = new_workout.extended_summary
+	
+	if parsed_summary is None:
+		remove_uploaded_file(tmp_filepath)
+		db.session.rollback()
+		return None, 422, "Failed to parse uploaded file"
+
+	if report_progress is not None:
+		report_progress(WORKOUT_JOB_PROGRESS_PARSED)
+	
+	new_workout.set_pending_name(parsed_summary.latitude, parsed_summary.longitude)
+	new_workout.start_at = parsed_summary.time
+	new_workout.duration = parsed_summary.duration
+
+	if category.supports_gps_data:
+		new_workout.distance = parsed_summary.distance
+		new_workout.climb = parsed_summary.elevation
+
+	workout_filepath = None
+	try:
+		new_workout.save()
+		workout_filepath = rename_uploaded_file(tmp_filepath, profile.username, new_workout.id)
+		new_workout.resource_path = workout_filepath
+		new_workout.save()
+		add_workout_data_to_goals(profile, new_workout)
+	except:
+		remove_uploaded_file(tmp_filepath)
+		remove_uploaded_file(workout_filepath)
+		db.session.rollback()
+		return None, 500, "Unable to create workout from file."
+
+	return new_workout, None, None
+
+def save_archive_workouts(profile, category, parsed_files):
+	'''Creates the workouts of parsed archive files [(result, tmp filepath, summary)] in one transaction,
+	with their data added to the goals of the profile. Returns the number of workouts created.'''
+	workouts = []
+	workout_filepaths = []
+	try:
+		for _, tmp_filepath, summary in parsed_files:
+			workout = Workout(profile.id, category, category.name, summary.time, 0, summary.duration, 0, tmp_filepath, False)
+			workout.set_pending_name(summary.latitude, summary.longitude)
+			if category.supports_gps_data:
+				workout.distance = summary.distance
+				workout.climb = summary.elevation
+			db.session.add(workout)
+			workouts.append(workout)
+		db.session.flush() # ids of the workouts name their files
+		for workout, (_, tmp_filepath, _) in zip(workouts, parsed_files):
+			workout.resource_path = rename_uploaded_file(tmp_filepath, profile.username, workout.id)
+			workout_filepaths.append(workout.resource_path)
+			add_workout_data_to_goals(profile, workout, commit=False) # committed with the batch
+		db.session.commit()
+	except:
+		db.session.rollback()
+		for result, tmp_filepath, _ in parsed_files:
+			remove_uploaded_file(tmp_filepath)
+			result['message'] = "Unable to create workout from file."
+		for workout_filepath in workout_filepaths:
+			remove_uploaded_file(workout_filepath)
+		return 0
+
+	for workout, (result, _, _) in zip(workouts, parsed_files):
+		result['status'] = ARCHIVE_FILE_CREATED
+		result['workout_id'] = workout.id
+	return len(workouts)
+
+def import_workout_archive(profile, category, archive_filepath):
+	'''Creates workouts from the workout files of a zip archive, returns the result of each file in archive order.
+	Files are parsed in parallel by worker processes, and their workouts created in batched transactions.'''
+	config = current_app.config
+	tmp_prefix = path.join(config["GPX_UPLOAD_DIR"], secure_filename("{0}_{1}".format(profile.username, uuid4().hex)))
+	batch_size = config.get("WORKOUT_ARCHIVE_BATCH_SIZE", WORKOUT_ARCHIVE_DEFAULT_BATCH_SIZE)
+	results = []
+	results_by_filepath = {}
+
+	def get_extracted_filepaths():
+		extracted_files = extract_workout_files(archive_filepath, lambda num, extension: "{0}_{1}.{2}".format(tmp_prefix, num, extension),
+			config["ALLOWED_UPLOAD_EXTENSIONS"], config.get("WORKOUT_ARCHIVE_MAX_FILES", ARCHIVE_DEFAULT_MAX_FILES),
+			config.get("WORKOUT_ARCHIVE_MAX_FILE_BYTES", ARCHIVE_DEFAULT_MAX_FILE_BYTES))
+		for entry_name, filepath, skip_reason in extracted_files:
+			result = { 'file': entry_name, 'status': ARCHIVE_FILE_SKIPPED, 'message': skip_reason, 'workout_id': None }
+			results.append(result)
+			if filepath is not None:
+				result['status'] = ARCHIVE_FILE_FAILED # until its workout is created
+				results_by_filepath[filepath] = result
+				archive_positions[filepath] = len(archive_positions)
+				yield filepath
+
+	def save_parsed_files(parsed_files): # parsed as they completed, created in archive order within the batch
+		parsed_files.sort(key=lambda parsed_file: archive_positions[parsed_file[1]])
+		return save_archive_workouts(profile, category, parsed_files)
+
+	num_created = 0
+	parsed_files = []
+	archive_positions = {}
+	for filepath, summary in parse_workout_file_summaries(get_extracted_filepaths(), get_archive_pool_size(config.get("WORKOUT_ARCHIVE_PROCESSES"))):
+		if summary is None:
+			results_by_filepath[filepath]['message'] = "Failed to parse uploaded file"
+			remove_uploaded_file(filepath)
+			continue
+		parsed_files.append((results_by_filepath[filepath], filepath, summary))
+		if len(parsed_files) >= batch_size:
+			num_created += save_parsed_files(parsed_files)
+			parsed_files = []
+	if len(parsed_files) > 0:
+		num_created += save_parsed_files(parsed_files)
+
+	if num_created > 0:
+		request_workout_naming()
+	return results
+
+def get_archive_import_summary(results):
+	return {
+		'num_created': sum(1 for result in results if result['status'] == ARCHIVE_FILE_CREATED),
+		'num_failed': sum(1 for result in results if result['status'] == ARCHIVE_FILE_FAILED),
+		'num_skipped': sum(1 for result in results if result['status'] == ARCHIVE_FILE_SKIPPED),
+		'files': results
+	}
+
+def remove_archive_file(archive_filepath):
+	try:
+		remove(archive_filepath)
+	except OSError:
+		pass
+
+def process_workout_archive_job(job):
+	'''Creates the workouts of the archive of a claimed upload job, the result of each file is kept with the job'''
+	from run4it.api.profile.model import Profile # the profile model depends on this package
+	results, error_message = None, None
+	try:
+		job.set_status(WORKOUT_JOB_PROCESSING, WORKOUT_JOB_PROGRESS_STARTED)
+		job.save()
+		results = import_workout_archive(Profile.get_by_id(job.profile_id), job.category, job.filepath)
+	except zipfile.BadZipFile:
+		error_message = "Workout archive could not be read."
+	except:
+		db.session.rollback()
+		error_message = "Unable to import workout archive."
+	finally:
+		remove_archive_file(job.filepath)
+
+	if results is None:
+		job.set_status(WORKOUT_JOB_FAILED, 100, error_message)
+	else:
+		job.set_archive_import(get_archive_import_summary(results))
+		job.set_status(WORKOUT_JOB_COMPLETED, 100)
+	job.save()
+
+def process_workout_upload_job(job_id):
+	'''Creates the workout, or the workouts of the archive, of an upload job, run by the background workers'''
+	from run4it.api.profile.model import Profile # the profile model depends on this package
+	job = WorkoutUploadJob.get_by_id(job_id)
+	if job is None or not job.claim():
+		return
+
+	if job.is_archive:
+		process_workout_archive_job(job)
+		return
+
+	def report_progress(progress):
+		job.set_status(WORKOUT_JOB_PROCESSING, progress)
+		job.save()
+
+	try:
+		report_progress(WORKOUT_JOB_PROGRESS_STARTED)
+		profile = Profile.get_by_id(job.profile_id)
+		new_workout, _, error_message = create_workout_from_file(profile, job.category, job.filepath, report_progress)
+	except:
+		db.session.rollback()
+		remove_uploaded_file(job.filepath)
+		new_workout, error_message = None, "Unable to create workout from file."
+
+	if new_workout is None:
+		job.set_status(WORKOUT_JOB_FAILED, 100, error_message)
+	else:
+		job.workout = new_workout
+		job.set_status(WORKOUT_JOB_COMPLETED, 100)
+	job.save()
+
+	if new_workout is not None:
+		request_workout_naming()
+
 class ProfileWorkoutList(Resource):
 	@jwt_required
 	@use_kwargs(workout_schema, error_status_code = 422, locations={"query"})
@@ -131,17 +400,29 @@ class ProfileWorkoutList(Resource):
 
 class ProfileWorkout(Resource):
 	@jwt_required
+	@use_kwargs(workout_track_schema, error_status_code = 422, locations={"query"})
 	@marshal_with(workout_schema)
-	def get(self, username, workout_id):
+	def get(self, username, workout_id, max_points=None, simplify_method=TRACK_SIMPLIFY_MAP, from_distance=None, to_distance=None, from_duration=None, to_duration=None, stream=False):
 		profile = get_auth_profile_or_abort(username, "workout")
 		workout = profile.get_workout_by_id(workout_id)
 
 		if workout is None:
 			report_error_and_abort(404, "workout", "Workout not found.")
 
+		# the representation depends on the rows, the workout file and the query (level of detail, range)
+		etag = get_rows_etag([workout, workout.category], get_workout_file_version(workout.resource_path), request.query_string)
+		not_modified_response = get_not_modified_response(etag)
+		if not_modified_response is not None:
+			return not_modified_response
+		headers = get_conditional_headers(etag)
+
 		if workout.category.supports_gps_data:
-			workout.register_extended_data()
-		return workout
+			workout.register_extended_data(max_points, simplify_method, from_distance, to_distance, from_duration, to_duration)
+			g.compressed_response_path = workout.resource_path # compressed response is cached with the parsed file
+
+		if stream and getattr(workout, "extended_track_data", None) is not None:
+			return Response(generate_workout_json(workout_stream_schema.dump(workout), workout.extended_track_data), mimetype='application/json', headers=headers)
+		return workout, 200, headers
 
 	@jwt_required
 	@use_kwargs(workout_update_schema, error_status_code = 422)
@@ -176,6 +457,7 @@ class ProfileWorkout(Resource):
 
 		# update category
 		workout.category = category
+		workout.name_pending = False # a name or category set by the user is never replaced by the looked up name
 		workout.name = name
 		workout.start_at = utc_start_at
 		workout.distance = distance
@@ -196,10 +478,12 @@ class ProfileWorkout(Resource):
 
 		return workout, 200
 
-class ProfileWorkoutGpx(Resource): # both TCX and GPX are supported
+class ProfileWorkoutGpx(Resource): # GPX, TCX and FIT are supported
 	@jwt_required
+	@use_kwargs(workout_upload_schema, error_status_code = 422, locations={"query"})
 	@marshal_with(workout_schema)
-	def post(self, username, category_id):
+	@marshal_with(workout_upload_job_schema, code=202)
+	def post(self, username, category_id, background=False):
 		profile = get_auth_profile_or_abort(username, "workout")
 		category = WorkoutCategoryModel.get_by_id(category_id)
 
@@ -214,42 +498,89 @@ class ProfileWorkoutGpx(Resource): # both TCX and GPX are supported
 		if not is_valid_workout_filename(uploaded_file.filename):
 			report_error_and_abort(422, "workout", "Workout filename invalid.")
 
+		if background: # stored files are processed by the background workers, they may wait in line
+			tmp_filepath = save_uploaded_file_or_abort(uploaded_file, "{0}_{1}".format(profile.username, uuid4().hex))
+			try:
+				new_job = WorkoutUploadJob(profile.id, category, tmp_filepath)
+				new_job.save()
+			except:
+				remove_uploaded_file(tmp_filepath)
+				db.session.rollback()
+				report_error_and_abort(500, "workout", "Unable to create workout upload job.")
+			background_jobs.submit(process_workout_upload_job, new_job.id)
+			job_url = url_for("{0}.{1}".format(request.blueprint, ProfileWorkoutUploadJob.endpoint), username=username, job_id=new_job.id)
+			return new_job, 202, {'Location': job_url}
+
 		tmp_filepath = save_uploaded_file_or_abort(uploaded_file, profile.username)
+		new_workout, error_code, error_message = create_workout_from_file(profile, category, tmp_filepath)
 
-		# create object with temporary data and use it to parse workout file
-		new_workout = Workout(profile.id, category, category.name, dt.datetime.utcnow(), 0, 1, 0, tmp_filepath, False)
-		new_workout.register_extended_data()
-		parsed_summary = new_workout.extended_summary
-		
-		if parsed_summary is None:
-			remove_uploaded_file(tmp_filepath)
-			db.session.rollback()
-			report_error_and_abort(422, "workout", "Failed to parse uploaded file")
-		
-		new_workout.name = get_autogenerated_workout_name(parsed_summary.latitude, parsed_summary.longitude, new_workout.category_name)
-		new_workout.start_at = parsed_summary.time
-		new_workout.duration = parsed_summary.duration
+		if new_workout is None:
+			report_error_and_abort(error_code, "workout", error_message)
+
+		request_workout_naming()
+		return new_workout, 200, {'Location': '{}/{}'.format(request.path, new_workout.id)}
+
+class ProfileWorkoutUploadJob(Resource):
+	@jwt_required
+	@marshal_with(workout_upload_job_schema)
+	def get(self, username, job_id):
+		profile = get_auth_profile_or_abort(username, "workout")
+		job = WorkoutUploadJob.find_for_profile(profile.id, job_id)
+
+		if job is None:
+			report_error_and_abort(404, "workout", "Workout upload job not found.")
+
+		return job
+
+class ProfileWorkoutArchive(Resource): # zip archives of GPX, TCX and FIT files
+	@jwt_required
+	@use_kwargs(workout_upload_schema, error_status_code = 422, locations={"query"})
+	@marshal_with(workout_archive_import_schema)
+	@marshal_with(workout_upload_job_schema, code=202)
+	def post(self, username, category_id, background=False):
+		profile = get_auth_profile_or_abort(username, "workout")
+		category = WorkoutCategoryModel.get_by_id(category_id)
+
+		if category is None:
+			report_error_and_abort(422, "workout", "Workout category not found")
+
+		if request.files is None or len(request.files) != 1 or "archive" not in request.files:
+			report_error_and_abort(422, "workout", "Workout archive not provided.")
+
+		uploaded_file = request.files["archive"]
+
+		if not uploaded_file.filename.lower().endswith(".zip"):
+			report_error_and_abort(422, "workout", "Workout archive filename invalid.")
 
-		if category.supports_gps_data:
-			new_workout.distance = parsed_summary.distance
-			new_workout.climb = parsed_summary.elevation
+		archive_filepath = save_uploaded_file_or_abort(uploaded_file, "{0}_{1}".format(profile.username, uuid4().hex))
+
+		if background: # imported by the background workers, the results of the files are kept with the job
+			try:
+				new_job = WorkoutUploadJob(profile.id, category, archive_filepath)
+				new_job.save()
+			except:
+				remove_archive_file(archive_filepath)
+				db.session.rollback()
+				report_error_and_abort(500, "workout", "Unable to create workout upload job.")
+			background_jobs.submit(process_workout_upload_job, new_job.id)
+			job_url = url_for("{0}.{1}".format(request.blueprint, ProfileWorkoutUploadJob.endpoint), username=username, job_id=new_job.id)
+			return new_job, 202, {'Location': job_url}
 
-		workout_filepath = None
 		try:
-			new_workout.save()
-			workout_filepath = rename_uploaded_file(tmp_filepath, profile.username, new_workout.id)
-			new_workout.resource_path = workout_filepath
-			new_workout.save()
-			add_workout_data_to_goals(profile, new_workout)
-		except:
-			remove_uploaded_file(tmp_filepath)
-			remove_uploaded_file(workout_filepath)
-			db.session.rollback()
-			report_error_and_abort(500, "workout", "Unable to create workout from file.")
+			results = import_workout_archive(profile, category, archive_filepath)
+		except zipfile.BadZipFile:
+			report_error_and_abort(422, "workout", "Workout archive could not be read.")
+		finally:
+			remove_archive_file(archive_filepath)
 
-		return new_workout, 200, {'Location': '{}/{}'.format(request.path, new_workout.id)}
+		return get_archive_import_summary(results)
 
 class WorkoutCategoryList(Resource):
 	@marshal_with(workout_categories_schema)
-	def get(self):			
-		return WorkoutCategoryModel.query.order_by(WorkoutCategoryModel.name.asc()).all()
+	def get(self):
+		categories = WorkoutCategoryModel.query.order_by(WorkoutCategoryModel.name.asc()).all()
+		etag = get_rows_etag(categories)
+		not_modified_response = get_not_modified_response(etag, cache_control=get_reference_cache_control())
+		if not_modified_response is not None:
+			return not_modified_response
+		return categories, 200, get_conditional_headers(etag, cache_control=get_reference_cache_control())
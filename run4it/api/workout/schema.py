@@ -1,9 +1,35 @@
+import math
+import numpy as np
 from marshmallow import Schema, validate, fields
-		
+from run4it.api.serializer import FastDumpSchema, FiniteFloat
+from .simplify import TRACK_SIMPLIFY_MAP, TRACK_SIMPLIFY_METHODS
 
-class WorkoutExtendedTrackDataPoint(Schema):
-	latitude = fields.Float(dump_only=True, required=True)
-	longitude = fields.Float(dump_only=True, required=True)
+
+def get_finite_values(values):
+	'''Column as a list, with None where it is NaN or infinite (no position), JSON has no value for these'''
+	if np.isfinite(values).all():
+		return values.tolist()
+	return [value if math.isfinite(value) else None for value in values.tolist()]
+
+def dump_track_data(track_data):
+	'''TrackData as a list of dicts, with the same keys as WorkoutExtendedTrackDataPoint, built column by column'''
+	return [{ 'latitude': latitude, 'longitude': longitude, 'elevation': elevation, 'duration': duration, 'distance': distance,
+		'speed': speed, 'pace': pace, 'heartBpm': heart_bpm }
+		for latitude, longitude, elevation, duration, distance, speed, pace, heart_bpm in zip(
+			get_finite_values(track_data.latitudes), get_finite_values(track_data.longitudes), get_finite_values(track_data.elevations),
+			get_finite_values(track_data.durations), get_finite_values(track_data.distances), get_finite_values(track_data.speeds),
+			track_data.get_paces(), track_data.heart_rates.tolist())]
+
+class WorkoutTrackDataField(fields.Field):
+	'''Dumps TrackData without creating an object per point'''
+	def _serialize(self, value, attr, obj, **kwargs):
+		if value is None:
+			return None
+		return dump_track_data(value)
+
+class WorkoutExtendedTrackDataPoint(FastDumpSchema):
+	latitude = FiniteFloat(dump_only=True, required=True)
+	longitude = FiniteFloat(dump_only=True, required=True)
 	elevation = fields.Integer(dump_only=True, required=True)
 	duration = fields.Float(dump_only=True, required=True)
 	distance = fields.Float(dump_only=True, required=True)
@@ -11,7 +37,7 @@ class WorkoutExtendedTrackDataPoint(Schema):
 	pace = fields.Str(attribute='average_pace', dump_only=True, required=True)
 	heartBpm = fields.Int(attribute='heart_bpm', dump_only=True, required=True)
 
-class WorkoutSchema(Schema):
+class WorkoutSchema(FastDumpSchema):
 	limit = fields.Int(load_only=True, validate=[validate.Range(min=1, max=999)])
 	offset = fields.Int(load_only=True, validate=[validate.Range(min=0)])
 	goalID = fields.Int(attribute='goal_id', load_only=True, validate=[validate.Range(min=0)])
@@ -26,14 +52,27 @@ class WorkoutSchema(Schema):
 	categoryName = fields.Str(attribute='category_name', dump_only=True, required=True)
 	averageSpeed = fields.Float(attribute='average_speed', dump_only=True, required=True)
 	averagePace = fields.Str(attribute='average_pace', dump_only=True, required=True)
-	trackData = fields.List(fields.Nested(WorkoutExtendedTrackDataPoint), attribute='extended_track_data', dump_only=True, required=False)
-	trackSplits = fields.List(fields.Nested(WorkoutExtendedTrackDataPoint), attribute='extended_split_data', dump_only=True, required=False)
+	trackData = WorkoutTrackDataField(attribute='extended_track_data', dump_only=True, required=False)
+	trackSplits = WorkoutTrackDataField(attribute='extended_split_data', dump_only=True, required=False)
+	trackLaps = WorkoutTrackDataField(attribute='extended_lap_data', dump_only=True, required=False) # as recorded by the device
 	trackSummary = fields.Nested(WorkoutExtendedTrackDataPoint, attribute='extended_summary', dump_only=True, required=False)
 
 	class Meta:
 		strict = True
 		datetimeformat = '%Y-%m-%dT%H:%M:%S+00:00' # note: sets timezone to UTC, should only be used on dump
 
+class WorkoutTrackSchema(Schema):
+	maxPoints = fields.Int(attribute='max_points', load_only=True, validate=[validate.Range(min=2)])
+	simplify = fields.Str(attribute='simplify_method', load_only=True, missing=TRACK_SIMPLIFY_MAP, validate=[validate.OneOf(TRACK_SIMPLIFY_METHODS)])
+	fromDistance = fields.Float(attribute='from_distance', load_only=True, validate=[validate.Range(min=0)])
+	toDistance = fields.Float(attribute='to_distance', load_only=True, validate=[validate.Range(min=0)])
+	fromDuration = fields.Float(attribute='from_duration', load_only=True, validate=[validate.Range(min=0)])
+	toDuration = fields.Float(attribute='to_duration', load_only=True, validate=[validate.Range(min=0)])
+	stream = fields.Bool(load_only=True, missing=False)
+
+	class Meta:
+		strict = True
+
 class WorkoutUpdateSchema(Schema):
 	name = fields.Str(required=True, validate=[validate.Length(min=0, max=128)])
 	startAt = fields.DateTime(attribute='start_at', required=True)
@@ -46,7 +85,50 @@ class WorkoutUpdateSchema(Schema):
 	class Meta:
 		strict = True
 
-class WorkoutCategorySchema(Schema):
+class WorkoutUploadSchema(Schema):
+	background = fields.Bool(load_only=True, missing=False)
+
+	class Meta:
+		strict = True
+
+
+class WorkoutArchiveFileSchema(FastDumpSchema):
+	file = fields.Str(dump_only=True, required=True)
+	status = fields.Str(dump_only=True, required=True)
+	message = fields.Str(dump_only=True, required=False)
+	workoutId = fields.Int(attribute='workout_id', dump_only=True, required=False)
+
+	class Meta:
+		strict = True
+
+
+class WorkoutArchiveImportSchema(FastDumpSchema):
+	numCreated = fields.Int(attribute='num_created', dump_only=True, required=True)
+	numFailed = fields.Int(attribute='num_failed', dump_only=True, required=True)
+	numSkipped = fields.Int(attribute='num_skipped', dump_only=True, required=True)
+	files = fields.Nested(WorkoutArchiveFileSchema, many=True, dump_only=True, required=True)
+
+	class Meta:
+		strict = True
+
+
+class WorkoutUploadJobSchema(FastDumpSchema):
+	id = fields.Int(dump_only=True, required=True)
+	status = fields.Str(dump_only=True, required=True)
+	progress = fields.Int(dump_only=True, required=True)
+	message = fields.Str(dump_only=True, required=False)
+	categoryName = fields.Str(attribute='category.name', dump_only=True, required=True)
+	createdAt = fields.DateTime(attribute='created_at', dump_only=True, required=True)
+	updatedAt = fields.DateTime(attribute='updated_at', dump_only=True, required=True)
+	workout = fields.Nested(WorkoutSchema, dump_only=True, required=False)
+	archive = fields.Nested(WorkoutArchiveImportSchema, attribute='archive_import', dump_only=True, required=False)
+
+	class Meta:
+		strict = True
+		datetimeformat = '%Y-%m-%dT%H:%M:%S+00:00' # note: sets timezone to UTC, should only be used on dump
+
+
+class WorkoutCategorySchema(FastDumpSchema):
 	id = fields.Int(required=True, dump_only=True)
 	name = fields.Str(required=True, dump_only=True)
 	supportsGpsData = fields.Bool(attribute='supports_gps_data', required=True, dump_only=True)
@@ -55,6 +137,11 @@ class WorkoutCategorySchema(Schema):
 		strict = True
 
 workout_schema = WorkoutSchema()
+workout_stream_schema = WorkoutSchema(exclude=('trackData',)) # trackData is streamed separately
 workouts_schema = WorkoutSchema(many=True)
 workout_update_schema = WorkoutUpdateSchema()
+workout_track_schema = WorkoutTrackSchema()
 workout_categories_schema = WorkoutCategorySchema(many=True)
+workout_upload_schema = WorkoutUploadSchema()
+workout_upload_job_schema = WorkoutUploadJobSchema()
+workout_archive_import_schema = WorkoutArchiveImportSchema()
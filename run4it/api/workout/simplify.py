@@ -0,0 +1,99 @@
+import numpy as np
+
+TRACK_SIMPLIFY_MAP = "map" # keep the shape of the route (Douglas-Peucker on position)
+TRACK_SIMPLIFY_SPEED = "speed" # keep the shape of the series (largest-triangle-three-buckets over duration)
+TRACK_SIMPLIFY_ELEVATION = "elevation"
+TRACK_SIMPLIFY_HEART_RATE = "heartRate"
+TRACK_SIMPLIFY_SERIES_COLUMNS = {
+	TRACK_SIMPLIFY_SPEED: 'speeds',
+	TRACK_SIMPLIFY_ELEVATION: 'elevations',
+	TRACK_SIMPLIFY_HEART_RATE: 'heart_rates',
+}
+TRACK_SIMPLIFY_METHODS = [TRACK_SIMPLIFY_MAP] + list(TRACK_SIMPLIFY_SERIES_COLUMNS.keys())
+EARTH_RADIUS_M = 6371008.8
+
+
+def simplify_track_data(track_data, max_points, method=TRACK_SIMPLIFY_MAP):
+	'''Returns track_data reduced to at most max_points points, keeping its shape for the given method'''
+	if track_data is None or max_points is None or len(track_data) <= max_points:
+		return track_data
+	if method == TRACK_SIMPLIFY_MAP and np.isnan(track_data.latitudes).any():
+		method = TRACK_SIMPLIFY_SPEED # no route to keep the shape of, like on a treadmill
+	if method == TRACK_SIMPLIFY_MAP:
+		indices = get_douglas_peucker_indices(track_data.latitudes, track_data.longitudes, max_points)
+	else:
+		series = getattr(track_data, TRACK_SIMPLIFY_SERIES_COLUMNS[method])
+		indices = get_lttb_indices(track_data.durations, series, max_points)
+	return track_data.select(indices)
+
+
+def get_douglas_peucker_indices(latitudes, longitudes, max_points):
+	'''Indices of the max_points most significant points of a route, in order.
+	A single Douglas-Peucker pass ranks every point by the tolerance at which it would be kept,
+	so taking the highest ranked points equals Douglas-Peucker with the matching tolerance.'''
+	num_points = len(latitudes)
+	if num_points <= max_points:
+		return np.arange(num_points)
+
+	# local equirectangular projection in meters is precise enough for a workout
+	y = np.radians(latitudes) * EARTH_RADIUS_M
+	x = np.radians(longitudes) * EARTH_RADIUS_M * np.cos(np.radians(np.nanmean(latitudes)))
+
+	significance = np.zeros(num_points)
+	significance[0] = significance[-1] = np.inf
+	segments = [(0, num_points - 1, np.inf)]
+	while len(segments) > 0:
+		start, end, parent_significance = segments.pop()
+		if end - start < 2:
+			continue
+		distances = _get_segment_distances(x[start + 1:end], y[start + 1:end], x[start], y[start], x[end], y[end])
+		split_idx = start + 1 + int(np.argmax(distances))
+		# a point is never more significant than the point that made it a segment end
+		split_significance = min(float(distances[split_idx - start - 1]), parent_significance)
+		significance[split_idx] = split_significance
+		segments.append((start, split_idx, split_significance))
+		segments.append((split_idx, end, split_significance))
+
+	kept = np.argsort(-significance, kind='stable')[:max_points]
+	return np.sort(kept)
+
+
+def get_lttb_indices(x, y, max_points):
+	'''Indices of max_points points of the series y(x), chosen by largest-triangle-three-buckets'''
+	num_points = len(x)
+	if num_points <= max_points:
+		return np.arange(num_points)
+	if max_points < 3:
+		return np.array([0, num_points - 1])[:max_points]
+
+	x = np.asarray(x, dtype=np.float64)
+	y = np.asarray(y, dtype=np.float64)
+	indices = np.zeros(max_points, dtype=np.intp)
+	indices[-1] = num_points - 1
+	# first and last point are kept, the points between are split into max_points-2 buckets
+	bucket_edges = np.linspace(1, num_points - 1, max_points - 1).astype(np.intp)
+
+	selected = 0
+	for bucket in range(max_points - 2):
+		bucket_start, bucket_end = bucket_edges[bucket], bucket_edges[bucket + 1]
+		next_start, next_end = bucket_edges[bucket + 1], (bucket_edges[bucket + 2] if bucket + 2 < len(bucket_edges) else num_points)
+		next_x = np.mean(x[next_start:next_end])
+		next_y = np.mean(y[next_start:next_end])
+		# area of triangle (selected point, candidate, average of next bucket), times two
+		areas = np.abs((x[selected] - next_x) * (y[bucket_start:bucket_end] - y[selected])
+			- (x[selected] - x[bucket_start:bucket_end]) * (next_y - y[selected]))
+		selected = bucket_start + int(np.argmax(areas))
+		indices[bucket + 1] = selected
+
+	return indices
+
+
+def _get_segment_distances(x, y, start_x, start_y, end_x, end_y):
+	segment_x = end_x - start_x
+	segment_y = end_y - start_y
+	segment_length_sq = segment_x**2 + segment_y**2
+	if segment_length_sq > 0.0:
+		t = np.clip(((x - start_x) * segment_x + (y - start_y) * segment_y) / segment_length_sq, 0.0, 1.0)
+	else:
+		t = np.zeros(len(x))
+	return np.hypot(x - (start_x + t * segment_x), y - (start_y + t * segment_y))
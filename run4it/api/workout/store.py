@@ -0,0 +1,146 @@
+import struct
+import zlib
+import datetime as dt
+import numpy as np
+from os import path, stat, rename, remove, replace
+from .track import TrackData, WorkoutDataPoint
+
+TRACK_STORE_EXTENSION = "trk"
+TRACK_STORE_MAGIC = b'R4TK'
+TRACK_STORE_VERSION = 2 # 2: start time of the track stored apart from the summary start time
+TRACK_STORE_EPOCH = dt.datetime(1970, 1, 1)
+# magic, version, source file mtime (ns), source file size, track start time and summary start time (us since epoch),
+# number of points, number of splits. The summary may start before the track, when it is recorded by the device.
+TRACK_STORE_HEADER = struct.Struct('<4sBqqqqII')
+# latitude, longitude, elevation, duration, distance, average speed, heart rate
+TRACK_STORE_SUMMARY = struct.Struct('<ddidddi')
+# TrackData columns of the track points, stored as delta encoded fixed-point integers: (column, scale, decoded type)
+TRACK_STORE_POINT_COLUMNS = (
+	('time_offsets', 1000000, np.float64), # microseconds
+	('latitudes', 1000000, np.float64), # 1e-6 degrees, as rounded by the track engine
+	('longitudes', 1000000, np.float64),
+	('elevations', 1, np.int32),
+	('durations', 10, np.float64), # 0.1 s
+	('distances', 10, np.float64), # 0.1 m
+	('speeds', 10, np.float64), # 0.1 km/h
+	('heart_rates', 1, np.int32),
+)
+# split values are unrounded, and there are few of them, so splits are stored as is
+TRACK_STORE_SPLIT_COLUMNS = (
+	('time_offsets', np.float64),
+	('latitudes', np.float64),
+	('longitudes', np.float64),
+	('elevations', np.int32),
+	('durations', np.float64),
+	('distances', np.float64),
+	('speeds', np.float64),
+	('heart_rates', np.int32),
+)
+TRACK_STORE_DELTA_TYPES = (np.int8, np.int16, np.int32, np.int64) # smallest one that holds all deltas is used
+
+
+def get_track_store_path(filepath):
+	return "{0}.{1}".format(filepath, TRACK_STORE_EXTENSION)
+
+
+def write_track_store(filepath, parsed):
+	'''Stores parsed (track data, split data, summary) of a workout file in a compact sidecar file.
+	Returns False if there is nothing to store or the store could not be written.
+	Tracks without positions (recorded on a treadmill) can not be delta encoded, they are parsed when requested.'''
+	track_data, split_data, summary = parsed
+	if track_data is None or split_data is None or summary is None:
+		return False
+	if not (np.all(np.isfinite(track_data.latitudes)) and np.all(np.isfinite(track_data.longitudes))):
+		return False
+
+	try:
+		file_stat = stat(filepath)
+		body = bytearray()
+		for column, scale, _ in TRACK_STORE_POINT_COLUMNS:
+			body += _encode_deltas(getattr(track_data, column), scale)
+		for column, column_type in TRACK_STORE_SPLIT_COLUMNS:
+			body += np.ascontiguousarray(getattr(split_data, column), dtype=column_type).tobytes()
+
+		header = TRACK_STORE_HEADER.pack(TRACK_STORE_MAGIC, TRACK_STORE_VERSION, file_stat.st_mtime_ns, file_stat.st_size,
+			_get_store_time(track_data.start_time), _get_store_time(summary.time), len(track_data), len(split_data))
+		header += TRACK_STORE_SUMMARY.pack(summary.latitude, summary.longitude, summary.elevation, summary.duration,
+			summary.distance, summary.average_speed, summary.heart_bpm)
+
+		store_filepath = get_track_store_path(filepath)
+		tmp_store_filepath = store_filepath + ".tmp"
+		with open(tmp_store_filepath, 'wb') as store_file:
+			store_file.write(header)
+			store_file.write(zlib.compress(bytes(body)))
+		replace(tmp_store_filepath, store_filepath) # readers in other processes never see a partial file
+		return True
+	except:
+		return False
+
+
+def read_track_store(filepath):
+	'''Returns stored (track data, split data, summary) for a workout file,
+	or None if there is no valid store for the current version of the file'''
+	try:
+		with open(get_track_store_path(filepath), 'rb') as store_file:
+			data = store_file.read()
+		magic, version, mtime_ns, size, start_time_us, summary_time_us, num_points, num_splits = TRACK_STORE_HEADER.unpack_from(data, 0)
+		file_stat = stat(filepath)
+		if magic != TRACK_STORE_MAGIC or version != TRACK_STORE_VERSION or mtime_ns != file_stat.st_mtime_ns or size != file_stat.st_size:
+			return None
+
+		latitude, longitude, elevation, duration, distance, average_speed, heart_bpm = TRACK_STORE_SUMMARY.unpack_from(data, TRACK_STORE_HEADER.size)
+		body = zlib.decompress(data[TRACK_STORE_HEADER.size + TRACK_STORE_SUMMARY.size:])
+		start_time = TRACK_STORE_EPOCH + dt.timedelta(microseconds=start_time_us)
+
+		offset = 0
+		point_columns = []
+		for _, scale, column_type in TRACK_STORE_POINT_COLUMNS:
+			values, offset = _decode_deltas(body, offset, num_points, scale, column_type)
+			point_columns.append(values)
+		split_columns = []
+		for _, column_type in TRACK_STORE_SPLIT_COLUMNS:
+			values = np.frombuffer(body, dtype=column_type, count=num_splits, offset=offset)
+			offset += values.nbytes
+			split_columns.append(values)
+
+		summary_time = TRACK_STORE_EPOCH + dt.timedelta(microseconds=summary_time_us)
+		summary = WorkoutDataPoint(latitude, longitude, elevation, summary_time, duration, distance, average_speed, heart_bpm)
+		return TrackData(start_time, *point_columns), TrackData(start_time, *split_columns), summary
+	except:
+		return None
+
+
+def rename_track_store(old_filepath, new_filepath):
+	if path.exists(get_track_store_path(old_filepath)):
+		rename(get_track_store_path(old_filepath), get_track_store_path(new_filepath))
+
+
+def remove_track_store(filepath):
+	try:
+		remove(get_track_store_path(filepath))
+	except:
+		pass
+
+
+def _get_store_time(time):
+	return (time - TRACK_STORE_EPOCH) // dt.timedelta(microseconds=1)
+
+
+def _encode_deltas(values, scale):
+	fixed_point = np.rint(np.asarray(values, dtype=np.float64) * scale).astype(np.int64)
+	deltas = np.diff(fixed_point, prepend=0)
+	max_delta = int(np.max(np.abs(deltas))) if len(deltas) > 0 else 0
+	for type_idx, delta_type in enumerate(TRACK_STORE_DELTA_TYPES):
+		if max_delta <= np.iinfo(delta_type).max:
+			return bytes([type_idx]) + deltas.astype(delta_type).tobytes()
+
+
+def _decode_deltas(body, offset, count, scale, column_type):
+	delta_type = TRACK_STORE_DELTA_TYPES[body[offset]]
+	deltas = np.frombuffer(body, dtype=delta_type, count=count, offset=offset + 1)
+	fixed_point = np.cumsum(deltas, dtype=np.int64)
+	if scale == 1:
+		values = fixed_point.astype(column_type)
+	else:
+		values = fixed_point / float(scale)
+	return values, offset + 1 + deltas.nbytes
@@ -0,0 +1,555 @@
+from array import array
+from math import floor
+import datetime as dt
+import numpy as np
+
+SPEED_NO_MOVEMENT_LIMIT_M_PER_S = 0.5
+ELEVATION_GAIN_IGNORE_LIMIT_M = 0.1
+SPLIT_DISTANCE_M = 998 # in practice, we get approx ~1000m pr split
+SPEED_WINDOW_POINTS = 5 # speed and elevation gain are averaged over this many points
+
+# WGS-84 ellipsoid, same as used by geopy's default (geodesic) distance
+WGS84_MAJOR_AXIS_M = 6378137.0
+WGS84_FLATTENING = 1 / 298.257223563
+WGS84_MINOR_AXIS_M = WGS84_MAJOR_AXIS_M * (1 - WGS84_FLATTENING)
+VINCENTY_MAX_ITERATIONS = 200
+VINCENTY_CONVERGENCE_LIMIT = 1e-12
+WGS84_ECCENTRICITY_SQ = WGS84_FLATTENING * (2 - WGS84_FLATTENING)
+EARTH_MEAN_RADIUS_M = 6371008.8 # radius of the sphere used by the haversine model
+TRACK_DISTANCE_GEODESIC = "geodesic"
+TRACK_DISTANCE_HAVERSINE = "haversine"
+TRACK_DISTANCE_FLAT = "flat"
+
+
+class WorkoutDataPoint:
+
+	def __init__(self, latitude, longitude, elevation, time, duration, distance, avg_speed, heart_bpm=0):
+		self.latitude = round(latitude, 6) # decimal degrees
+		self.longitude = round(longitude, 6)  # decimal degrees
+		self.elevation = round(elevation, None) # meter
+		self.time = time
+		self.duration = round(duration, 1) # seconds
+		self.distance = round(distance, 1) # meters
+		self.average_speed = round(avg_speed, 1)
+		self.heart_bpm = round(heart_bpm, None)
+
+	@property
+	def average_pace(self):
+		return get_pace(self.average_speed)
+
+	def __repr__(self):
+		return '<WorkoutDataPoint({time!r}s, {dist!r}m, {speed!r}kmh>'.format(time=self.duration, dist=self.distance, speed=self.average_speed)
+
+
+class TrackData:
+	'''Workout metrics for a track (or its splits) as parallel arrays, one entry per point.
+	Indexing returns a TrackDataPoint view, so no object is kept per point.'''
+
+	def __init__(self, start_time, time_offsets, latitudes, longitudes, elevations, durations, distances, speeds, heart_rates):
+		self.start_time = start_time
+		self.time_offsets = time_offsets # seconds from start_time
+		self.latitudes = latitudes # decimal degrees
+		self.longitudes = longitudes # decimal degrees
+		self.elevations = elevations # meter
+		self.durations = durations # seconds
+		self.distances = distances # meters
+		self.speeds = speeds # km/h
+		self.heart_rates = heart_rates
+
+	@classmethod
+	def empty(cls):
+		no_values = np.zeros(0)
+		no_int_values = np.zeros(0, dtype=np.int32)
+		return cls(None, no_values, no_values, no_values, no_int_values, no_values, no_values, no_values, no_int_values)
+
+	@property
+	def nbytes(self):
+		return sum(column.nbytes for column in (self.time_offsets, self.latitudes, self.longitudes, self.elevations,
+			self.durations, self.distances, self.speeds, self.heart_rates))
+
+	def select(self, indices):
+		'''Returns the points given by indices (slice or index array)'''
+		return TrackData(self.start_time, self.time_offsets[indices], self.latitudes[indices], self.longitudes[indices],
+			self.elevations[indices], self.durations[indices], self.distances[indices], self.speeds[indices], self.heart_rates[indices])
+
+	def get_range(self, from_distance=None, to_distance=None, from_duration=None, to_duration=None):
+		'''Returns the points within the given distance (m) and duration (s) ranges, limits included.
+		Distances and durations are cumulative, so the range is found by binary search, and returned as views.'''
+		start = 0
+		stop = len(self)
+		if from_distance is not None:
+			start = max(start, int(np.searchsorted(self.distances, from_distance, side='left')))
+		if to_distance is not None:
+			stop = min(stop, int(np.searchsorted(self.distances, to_distance, side='right')))
+		if from_duration is not None:
+			start = max(start, int(np.searchsorted(self.durations, from_duration, side='left')))
+		if to_duration is not None:
+			stop = min(stop, int(np.searchsorted(self.durations, to_duration, side='right')))
+		if start == 0 and stop == len(self):
+			return self
+		return self.select(slice(start, max(start, stop)))
+
+	def get_paces(self):
+		# speeds are rounded, so there are few distinct values, and each pace is formatted only once
+		unique_speeds, speed_indices = np.unique(self.speeds, return_inverse=True)
+		unique_paces = [get_pace(speed) for speed in unique_speeds.tolist()]
+		return [unique_paces[speed_idx] for speed_idx in speed_indices.tolist()]
+
+	def __len__(self):
+		return len(self.time_offsets)
+
+	def __getitem__(self, index):
+		if index < 0:
+			index += len(self)
+		if index < 0 or index >= len(self):
+			raise IndexError('TrackData index out of range')
+		return TrackDataPoint(self, index)
+
+	def __iter__(self):
+		for index in range(len(self)):
+			yield TrackDataPoint(self, index)
+
+	def __repr__(self):
+		return '<TrackData({points!r})>'.format(points=len(self))
+
+
+class TrackDataPoint:
+	'''A single point of TrackData, with the same attributes as WorkoutDataPoint'''
+	__slots__ = ('track_data', 'index')
+
+	def __init__(self, track_data, index):
+		self.track_data = track_data
+		self.index = index
+
+	@property
+	def latitude(self):
+		return float(self.track_data.latitudes[self.index])
+
+	@property
+	def longitude(self):
+		return float(self.track_data.longitudes[self.index])
+
+	@property
+	def elevation(self):
+		return int(self.track_data.elevations[self.index])
+
+	@property
+	def time(self):
+		return self.track_data.start_time + dt.timedelta(seconds=float(self.track_data.time_offsets[self.index]))
+
+	@property
+	def duration(self):
+		return float(self.track_data.durations[self.index])
+
+	@property
+	def distance(self):
+		return float(self.track_data.distances[self.index])
+
+	@property
+	def average_speed(self):
+		return float(self.track_data.speeds[self.index])
+
+	@property
+	def average_pace(self):
+		return get_pace(self.average_speed)
+
+	@property
+	def heart_bpm(self):
+		return int(self.track_data.heart_rates[self.index])
+
+	def __repr__(self):
+		return '<TrackDataPoint({time!r}s, {dist!r}m, {speed!r}kmh>'.format(time=self.duration, dist=self.distance, speed=self.average_speed)
+
+
+class TrackPoints:
+	'''Decoded track points as parallel arrays, as handed from the file parsers to the metrics engine.
+	Times are kept as offsets in seconds from start_time. Distance and speed recorded by the device
+	are None if the file has none, NaN for points without them.'''
+
+	def __init__(self, start_time, time_offsets, latitudes, longitudes, elevations, heart_rates=None, device_distances=None, device_speeds=None):
+		self.start_time = start_time
+		self.time_offsets = np.asarray(time_offsets, dtype=np.float64)
+		self.latitudes = np.asarray(latitudes, dtype=np.float64)
+		self.longitudes = np.asarray(longitudes, dtype=np.float64)
+		self.elevations = np.asarray(elevations, dtype=np.float64)
+		self.device_distances = None if device_distances is None else np.asarray(device_distances, dtype=np.float64) # cumulative meters
+		self.device_speeds = None if device_speeds is None else np.asarray(device_speeds, dtype=np.float64) # m/s
+
+		if heart_rates is None:
+			self.heart_rates = np.zeros(len(self.time_offsets), dtype=np.int32)
+		else:
+			self.heart_rates = np.asarray(heart_rates, dtype=np.int32)
+
+	@classmethod
+	def from_datetimes(cls, times, latitudes, longitudes, elevations, heart_rates=None):
+		start_time = times[0] if len(times) > 0 else None
+		time_offsets = [(time - start_time).total_seconds() for time in times]
+		return cls(start_time, time_offsets, latitudes, longitudes, elevations, heart_rates)
+
+	def __len__(self):
+		return len(self.time_offsets)
+
+	def slice(self, start, stop):
+		return self.select(slice(start, stop))
+
+	def view(self, indices):
+		'''Returns the points given by indices (slice or index array), with times relative to the same start_time'''
+		return TrackPoints(self.start_time, self.time_offsets[indices], self.latitudes[indices], self.longitudes[indices],
+			self.elevations[indices], self.heart_rates[indices], *self._select_device_columns(indices))
+
+	def get_chunks(self, chunk_size):
+		'''Yields the points as views of up to chunk_size points, as taken by the ingest pipeline'''
+		for start in range(0, len(self), chunk_size):
+			yield self.view(slice(start, start + chunk_size))
+
+	def select(self, indices):
+		'''Returns the points given by indices (slice or index array), with times relative to the first of them'''
+		time_offsets = self.time_offsets[indices]
+		if len(time_offsets) == 0:
+			return TrackPoints(None, [], [], [], [], [])
+
+		start_time = self.start_time + dt.timedelta(seconds=time_offsets[0])
+		return TrackPoints(start_time, time_offsets - time_offsets[0], self.latitudes[indices], self.longitudes[indices],
+			self.elevations[indices], self.heart_rates[indices], *self._select_device_columns(indices))
+
+	def strip_no_movement(self):
+		start, stop = find_movement_bounds(self.latitudes, self.longitudes, self.time_offsets, self.device_distances)
+		if start == 0 and stop == len(self):
+			return self
+		return self.slice(start, stop)
+
+	def get_track_data(self, split_distance=SPLIT_DISTANCE_M):
+		return process_track_points(self, split_distance)
+
+	def _select_device_columns(self, indices):
+		return [None if column is None else column[indices] for column in (self.device_distances, self.device_speeds)]
+
+	def __repr__(self):
+		return '<TrackPoints({points!r})>'.format(points=len(self))
+
+
+class TrackPointsBuilder:
+	'''Collects decoded points one by one into compact typed arrays'''
+
+	def __init__(self, start_time=None):
+		self.start_time = start_time
+		self.time_offsets = array('d')
+		self.latitudes = array('d')
+		self.longitudes = array('d')
+		self.elevations = array('d')
+		self.heart_rates = array('i')
+		self.device_distances = None # created by the first point with a value
+		self.device_speeds = None
+
+	def add(self, time, latitude, longitude, elevation, heart_bpm, device_distance=None, device_speed=None):
+		if self.start_time is None:
+			self.start_time = time
+		self.time_offsets.append((time - self.start_time).total_seconds())
+		self.latitudes.append(np.nan if latitude is None else latitude)
+		self.longitudes.append(np.nan if longitude is None else longitude)
+		self.elevations.append(np.nan if elevation is None else elevation)
+		self.heart_rates.append(0 if heart_bpm is None else heart_bpm)
+		if device_distance is not None or self.device_distances is not None:
+			self.device_distances = self._add_device_value(self.device_distances, device_distance)
+		if device_speed is not None or self.device_speeds is not None:
+			self.device_speeds = self._add_device_value(self.device_speeds, device_speed)
+
+	def __len__(self):
+		return len(self.time_offsets)
+
+	def build(self, fill_elevations=True):
+		# points without elevation get the elevation of the nearest previous point (or first point with elevation)
+		elevations = np.frombuffer(self.elevations)
+		if fill_elevations:
+			elevations = fill_missing_values(elevations, 0.0)
+		return TrackPoints(self.start_time, np.frombuffer(self.time_offsets), np.frombuffer(self.latitudes),
+			np.frombuffer(self.longitudes), elevations, np.frombuffer(self.heart_rates, dtype=np.int32),
+			*[None if column is None else np.frombuffer(column) for column in (self.device_distances, self.device_speeds)])
+
+	def _add_device_value(self, column, value):
+		if column is None:
+			column = array('d', [np.nan]) * (len(self.time_offsets) - 1)
+		column.append(np.nan if value is None else value)
+		return column
+
+
+def get_pace(speed_kmh):
+	'''Pace as "mm:ss" min/km, empty if not moving'''
+	if speed_kmh > 0.0:
+		pace_float = 60.0 / speed_kmh
+		pace_min = floor(pace_float)
+		pace_sec = int((pace_float - pace_min) * 60)
+		return "{0:02d}:{1:02d}".format(pace_min, pace_sec)
+	else:
+		return ""
+
+
+def fill_missing_values(values, default):
+	'''Replaces NaN values with the previous valid value, leading NaNs with the first valid value'''
+	valid = ~np.isnan(values)
+	if np.all(valid):
+		return values
+	if not np.any(valid):
+		return np.full(len(values), default)
+
+	valid_idx = np.where(valid, np.arange(len(values)), 0)
+	np.maximum.accumulate(valid_idx, out=valid_idx)
+	filled = values[valid_idx]
+	filled[:np.argmax(valid)] = values[np.argmax(valid)]
+	return filled
+
+
+def get_local_xml_tag(tag):
+	return tag.rsplit('}', 1)[-1] # strip namespace
+
+
+def parse_xml_datetime(time_str):
+	'''Parses xsd:dateTime as found in GPX/TCX files (YYYY-MM-DDThh:mm:ss[.fff][Z|+hh:mm]) to naive UTC'''
+	time = dt.datetime(int(time_str[0:4]), int(time_str[5:7]), int(time_str[8:10]), int(time_str[11:13]), int(time_str[14:16]), int(time_str[17:19]))
+	idx = 19
+	if len(time_str) > idx and time_str[idx] == '.':
+		idx += 1
+		fraction_start = idx
+		while idx < len(time_str) and time_str[idx].isdigit():
+			idx += 1
+		time = time.replace(microsecond=int(time_str[fraction_start:idx][:6].ljust(6, '0')))
+	timezone = time_str[idx:]
+	if timezone != '' and timezone != 'Z':
+		utc_offset = dt.timedelta(hours=int(timezone[1:3]), minutes=int(timezone[4:6]))
+		time = time - utc_offset if timezone[0] == '+' else time + utc_offset
+	return time
+
+
+def geodesic_distances(latitudes1, longitudes1, latitudes2, longitudes2):
+	'''Distance in meters between point pairs on the WGS-84 ellipsoid (Vincenty inverse formula, vectorized)'''
+	lat1 = np.radians(np.asarray(latitudes1, dtype=np.float64))
+	lat2 = np.radians(np.asarray(latitudes2, dtype=np.float64))
+	lon_diff = np.radians(np.asarray(longitudes2, dtype=np.float64) - np.asarray(longitudes1, dtype=np.float64))
+
+	if lon_diff.size == 0:
+		return np.zeros(lon_diff.shape)
+
+	reduced_lat1 = np.arctan((1 - WGS84_FLATTENING) * np.tan(lat1))
+	reduced_lat2 = np.arctan((1 - WGS84_FLATTENING) * np.tan(lat2))
+	sin_u1, cos_u1 = np.sin(reduced_lat1), np.cos(reduced_lat1)
+	sin_u2, cos_u2 = np.sin(reduced_lat2), np.cos(reduced_lat2)
+
+	lambda_ = lon_diff
+	with np.errstate(invalid='ignore', divide='ignore'):
+		for _ in range(VINCENTY_MAX_ITERATIONS):
+			sin_lambda, cos_lambda = np.sin(lambda_), np.cos(lambda_)
+			sin_sigma = np.sqrt((cos_u2 * sin_lambda)**2 + (cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lambda)**2)
+			cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lambda
+			sigma = np.arctan2(sin_sigma, cos_sigma)
+			sin_alpha = np.where(sin_sigma > 0.0, cos_u1 * cos_u2 * sin_lambda / sin_sigma, 0.0)
+			cos_sq_alpha = 1 - sin_alpha**2
+			cos_2sigma_m = np.where(cos_sq_alpha > 0.0, cos_sigma - 2 * sin_u1 * sin_u2 / cos_sq_alpha, 0.0)
+			c = WGS84_FLATTENING / 16 * cos_sq_alpha * (4 + WGS84_FLATTENING * (4 - 3 * cos_sq_alpha))
+			lambda_previous = lambda_
+			lambda_ = lon_diff + (1 - c) * WGS84_FLATTENING * sin_alpha * (
+				sigma + c * sin_sigma * (cos_2sigma_m + c * cos_sigma * (-1 + 2 * cos_2sigma_m**2)))
+			if np.nanmax(np.abs(lambda_ - lambda_previous)) <= VINCENTY_CONVERGENCE_LIMIT:
+				break
+
+	u_sq = cos_sq_alpha * (WGS84_MAJOR_AXIS_M**2 - WGS84_MINOR_AXIS_M**2) / WGS84_MINOR_AXIS_M**2
+	a = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+	b = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+	delta_sigma = b * sin_sigma * (cos_2sigma_m + b / 4 * (cos_sigma * (-1 + 2 * cos_2sigma_m**2)
+		- b / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma**2) * (-3 + 4 * cos_2sigma_m**2)))
+	return WGS84_MINOR_AXIS_M * a * (sigma - delta_sigma)
+
+
+def haversine_distances(latitudes1, longitudes1, latitudes2, longitudes2):
+	'''Distance in meters between point pairs on a sphere of the mean radius of the earth (haversine formula, vectorized)'''
+	lat1 = np.radians(np.asarray(latitudes1, dtype=np.float64))
+	lat2 = np.radians(np.asarray(latitudes2, dtype=np.float64))
+	lon_diff = np.radians(np.asarray(longitudes2, dtype=np.float64) - np.asarray(longitudes1, dtype=np.float64))
+	haversine = np.sin((lat2 - lat1) / 2.0)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(lon_diff / 2.0)**2
+	return 2.0 * EARTH_MEAN_RADIUS_M * np.arcsin(np.sqrt(np.minimum(haversine, 1.0)))
+
+
+def flat_distances(latitudes1, longitudes1, latitudes2, longitudes2):
+	'''Distance in meters between point pairs in a flat projection around each pair, scaled by the radii of curvature
+	of the WGS-84 ellipsoid at its mean latitude. Only for the short segments between track points.'''
+	lat1 = np.radians(np.asarray(latitudes1, dtype=np.float64))
+	lat2 = np.radians(np.asarray(latitudes2, dtype=np.float64))
+	lon_diff = np.asarray(longitudes2, dtype=np.float64) - np.asarray(longitudes1, dtype=np.float64)
+	lon_diff = np.radians((lon_diff + 180.0) % 360.0 - 180.0) # across the antimeridian
+	mean_lat = (lat1 + lat2) / 2.0
+	w = np.sqrt(1.0 - WGS84_ECCENTRICITY_SQ * np.sin(mean_lat)**2)
+	meridional_radius = WGS84_MAJOR_AXIS_M * (1.0 - WGS84_ECCENTRICITY_SQ) / w**3
+	normal_radius = WGS84_MAJOR_AXIS_M / w
+	return np.hypot((lat2 - lat1) * meridional_radius, lon_diff * normal_radius * np.cos(mean_lat))
+
+
+TRACK_DISTANCE_MODELS = {
+	TRACK_DISTANCE_GEODESIC: geodesic_distances,
+	TRACK_DISTANCE_HAVERSINE: haversine_distances,
+	TRACK_DISTANCE_FLAT: flat_distances,
+}
+
+
+class TrackDistance:
+	'''Distance model of the track metrics, as set by TRACK_DISTANCE_MODEL. Geodesic is exact, haversine and flat
+	are faster approximations, see flask benchmark --distance-models for their error on the bundled files.
+	With device_metrics (TRACK_DEVICE_METRICS), distance and speed recorded by the device are used where present.'''
+
+	def __init__(self, model=TRACK_DISTANCE_GEODESIC, device_metrics=False):
+		self.set_model(model)
+		self.device_metrics = device_metrics
+
+	def init_app(self, app):
+		self.set_model(app.config.get("TRACK_DISTANCE_MODEL", TRACK_DISTANCE_GEODESIC))
+		self.device_metrics = app.config.get("TRACK_DEVICE_METRICS", False)
+
+	def set_model(self, model):
+		if model not in TRACK_DISTANCE_MODELS:
+			raise ValueError("Unknown track distance model {0}, use one of {1}".format(model, ", ".join(TRACK_DISTANCE_MODELS)))
+		self.model = model
+		self.distances = TRACK_DISTANCE_MODELS[model]
+
+	def __call__(self, latitudes1, longitudes1, latitudes2, longitudes2):
+		return self.distances(latitudes1, longitudes1, latitudes2, longitudes2)
+
+	def __repr__(self):
+		return '<TrackDistance({model!r}, {device!r})>'.format(model=self.model, device=self.device_metrics)
+
+
+track_distance = TrackDistance()
+
+
+def get_segment_distances(latitudes, longitudes, elevation_diffs=None, device_distances=None, step=1):
+	'''Distances in meters from each point to the point step points after it, in 3D if elevation_diffs are given.
+	Where the device recorded the distance of both points, their difference is used, no distance is computed.'''
+	num_segments = max(len(latitudes) - step, 0)
+	if device_distances is None:
+		distances = np.empty(num_segments)
+		computed = np.ones(num_segments, dtype=bool)
+	else:
+		device_segments = device_distances[step:] - device_distances[:-step]
+		computed = np.isnan(device_segments)
+		distances = np.maximum(np.nan_to_num(device_segments), 0.0) # some devices restart their distance
+
+	if np.all(computed):
+		distances_2d = track_distance(latitudes[:-step], longitudes[:-step], latitudes[step:], longitudes[step:])
+	elif np.any(computed):
+		computed_idx = np.flatnonzero(computed)
+		distances_2d = track_distance(latitudes[computed_idx], longitudes[computed_idx], latitudes[computed_idx + step], longitudes[computed_idx + step])
+	else:
+		return distances
+	if elevation_diffs is not None:
+		distances_2d = np.sqrt(distances_2d**2 + elevation_diffs[computed]**2)
+	distances[computed] = distances_2d
+	return distances
+
+
+def get_moving_pairs(latitudes, longitudes, time_offsets, device_distances=None):
+	'''Returns for each pair of consecutive points whether there is movement between them'''
+	# positions that could not be read (NaN) do not contribute to movement
+	distances = np.nan_to_num(get_segment_distances(latitudes, longitudes, device_distances=device_distances), nan=0.0)
+	time_diffs = np.diff(time_offsets)
+	with np.errstate(invalid='ignore', divide='ignore'):
+		return (time_diffs > 0) & (distances / time_diffs > SPEED_NO_MOVEMENT_LIMIT_M_PER_S)
+
+
+def find_movement_bounds(latitudes, longitudes, time_offsets, device_distances=None):
+	'''Returns (start, stop) so that points[start:stop] excludes the points in both ends of the track where movement is very low'''
+	num_points = len(time_offsets)
+	if num_points < 2:
+		return 0, 0
+
+	moving_idx = np.flatnonzero(get_moving_pairs(latitudes, longitudes, time_offsets, device_distances)) + 1 # index of second point in moving pair
+	start = int(moving_idx[0]) - 1 if len(moving_idx) > 0 else num_points - 1
+	end = int(moving_idx[-1]) if len(moving_idx) > 0 else 0
+
+	if end <= start:
+		return 0, 0
+	if end < (num_points - 1):
+		return start, end # the last moving point is dropped, as it always has been
+	return start, num_points
+
+
+def process_track_points(points, split_distance=SPLIT_DISTANCE_M):
+	'''Computes (track_data, split_data, summary) for TrackPoints in batched operations'''
+	num_points = len(points)
+	if num_points == 0:
+		return TrackData.empty(), TrackData.empty(), None
+
+	latitudes = points.latitudes
+	longitudes = points.longitudes
+	elevations = points.elevations
+	heart_rates = points.heart_rates
+
+	# duration
+	cumulative_durations = np.zeros(num_points)
+	np.cumsum(np.round(np.diff(points.time_offsets), 1), out=cumulative_durations[1:])
+	# distance, as recorded by the device where it has
+	elevation_diffs = np.floor(np.diff(elevations))
+	cumulative_distances = np.zeros(num_points)
+	np.cumsum(get_segment_distances(latitudes, longitudes, elevation_diffs, points.device_distances), out=cumulative_distances[1:])
+	# speed & elevation gain, slightly averaged
+	avg_speeds_kmh = np.zeros(num_points)
+	cumulative_elevation_gain = 0.0
+	w = SPEED_WINDOW_POINTS
+	if num_points > w:
+		speed_elevation_diffs = np.floor(elevations[w:] - elevations[:-w])
+		speed_time_diffs = np.round(points.time_offsets[w:] - points.time_offsets[:-w], 1)
+		speed_dist_diffs_3d = get_segment_distances(latitudes, longitudes, speed_elevation_diffs, points.device_distances, w)
+		elevation_gains = speed_elevation_diffs / w
+		cumulative_elevation_gain = float(np.sum(elevation_gains[elevation_gains > ELEVATION_GAIN_IGNORE_LIMIT_M]))
+		with np.errstate(invalid='ignore', divide='ignore'):
+			avg_speeds_kmh[w:] = np.where(speed_time_diffs > 0, 3.6 * speed_dist_diffs_3d / speed_time_diffs, 0.0)
+		# hack to set speed for first records
+		avg_speeds_kmh[:w] = round(avg_speeds_kmh[w], 1)
+	if points.device_speeds is not None:
+		avg_speeds_kmh = np.where(np.isnan(points.device_speeds), avg_speeds_kmh, 3.6 * points.device_speeds)
+
+	track_data = TrackData(points.start_time, points.time_offsets, np.round(latitudes, 6), np.round(longitudes, 6),
+		np.rint(elevations).astype(np.int32), np.round(cumulative_durations, 1), np.round(cumulative_distances, 1),
+		np.round(avg_speeds_kmh, 1), heart_rates)
+	split_data = _create_splits(track_data, cumulative_durations, cumulative_distances, split_distance)
+
+	# summary contains: start lat./long., total elevation gain, total duration, total distance, avg speed, avg heart rate
+	total_duration = float(track_data.durations[-1])
+	total_distance = float(track_data.distances[-1])
+	total_avg_speed_kmh = 3.6 * total_distance / total_duration if total_duration > 0 else 0.0
+	valid_heart_rates = heart_rates[heart_rates > 0]
+	avg_heart_rate = float(np.mean(valid_heart_rates)) if len(valid_heart_rates) > 0 else 0
+	summary = WorkoutDataPoint(float(latitudes[0]), float(longitudes[0]), cumulative_elevation_gain, points.start_time,
+		total_duration, total_distance, total_avg_speed_kmh, avg_heart_rate)
+
+	return track_data, split_data, summary
+
+
+def _create_splits(track_data, cumulative_durations, cumulative_distances, split_distance):
+	last_idx = len(track_data) - 1
+	split_end_indices = list()
+	split_start_idx = 0
+	while split_start_idx < last_idx:
+		split_start_idx = _find_split_end(cumulative_distances, split_start_idx, split_distance)
+		split_end_indices.append(split_start_idx)
+
+	ends = np.array(split_end_indices, dtype=np.intp)
+	starts = np.zeros(len(ends), dtype=np.intp)
+	starts[1:] = ends[:-1]
+
+	# split values are taken from the (rounded) end point, minus the (unrounded) values at the split start
+	durations = track_data.durations[ends] - cumulative_durations[starts]
+	distances = track_data.distances[ends] - cumulative_distances[starts]
+	with np.errstate(invalid='ignore', divide='ignore'):
+		speeds = np.where(durations > 0, 3.6 * distances / durations, 0.0)
+	return TrackData(track_data.start_time, track_data.time_offsets[ends], track_data.latitudes[ends], track_data.longitudes[ends],
+		track_data.elevations[ends] - track_data.elevations[starts], durations, distances, speeds, track_data.heart_rates[ends])
+
+
+def _find_split_end(cumulative_distances, split_start_idx, split_distance):
+	'''First index after split_start_idx where split_distance is covered, or the last index'''
+	last_idx = len(cumulative_distances) - 1
+	start_distance = cumulative_distances[split_start_idx]
+	idx = int(np.searchsorted(cumulative_distances, start_distance + split_distance, side='left'))
+	# searchsorted works on the sum, the split test on the difference; adjust for rounding at the boundary
+	while idx > split_start_idx + 1 and cumulative_distances[idx - 1] - start_distance >= split_distance:
+		idx -= 1
+	while idx <= last_idx and cumulative_distances[idx] - start_distance < split_distance:
+		idx += 1
+	return max(split_start_idx + 1, min(idx, last_idx))
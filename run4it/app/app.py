@@ -1,14 +1,19 @@
 """The app module, containing the app factory function."""
 from flask import Flask
-from .commands import clean, init_test_data, tests, script4it
+from .commands import clean, benchmark, build_gazetteer, init_test_data, tests, script4it
 from .extensions import jwt, db, migrate, mail, cors
+from .compression import response_compression
+from .jobs import background_jobs
 from run4it.api.discipline import DisciplineModel
 from run4it.api.goal import GoalModel, GoalCategoryModel
 from run4it.api.profile import Profile, ProfileWeightHistory
 from run4it.api.token import TokenRegistry
 from run4it.api.user import User, UserConfirmation
-from run4it.api.workout import WorkoutCategoryModel, WorkoutModel
-from run4it.api.workout.gmaps import GeoCodeLookup
+from run4it.api.workout import WorkoutCategoryModel, WorkoutModel, WorkoutUploadJobModel, GeoCodeCacheEntryModel
+from run4it.api.workout.gmaps import GeoCodeLookup, geocode_cache
+from run4it.api.workout.gazetteer import gazetteer
+from run4it.api.workout.cache import track_cache
+from run4it.api.workout.track import track_distance
 from run4it.api.polar import PolarUserModel, PolarWebhookExerciseModel
 from run4it.api.scripts import ScriptModel
 
@@ -31,10 +36,18 @@ def register_extensions(app):
 	migrate.init_app(app, db)
 	mail.init_app(app)
 	cors.init_app(app, origins=app.config.get('CORS_ORIGIN_WHITELIST', '*'))
+	track_cache.init_app(app)
+	track_distance.init_app(app)
+	geocode_cache.init_app(app)
+	gazetteer.init_app(app)
+	response_compression.init_app(app)
+	background_jobs.init_app(app)
 
 def register_commands(app):
 	"""Register shell commands"""
 	app.cli.add_command(clean)
+	app.cli.add_command(benchmark)
+	app.cli.add_command(build_gazetteer)
 	app.cli.add_command(init_test_data)
 	app.cli.add_command(tests)
 	app.cli.add_command(script4it)
@@ -56,7 +69,9 @@ def register_shell_context(app):
 			'UserConfirmation': UserConfirmation,
 			'Workout': WorkoutModel,
 			'WorkoutCategory': WorkoutCategoryModel,
+			'WorkoutUploadJob': WorkoutUploadJobModel,
 			'GeoCodeLookup': GeoCodeLookup,
+			'GeoCodeCacheEntry': GeoCodeCacheEntryModel,
             'PolarUser': PolarUserModel,
 			'PolarWebhookExercise': PolarWebhookExerciseModel,
 			'Script': ScriptModel
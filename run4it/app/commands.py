@@ -24,6 +24,33 @@ def token_cleanup():
 	from run4it.api.scripts import script_token_registry_purge as script_func
 	return script_func('token_cleanup')
 
+@script4it.command()
+@with_appcontext
+def workout_names():
+	"""Names new workouts by the place they started from"""
+	from run4it.api.scripts import script_name_pending_workouts as script_func
+	return script_func('workout_names')
+
+@script4it.command()
+@with_appcontext
+def workout_jobs():
+	"""Processes workout uploads left pending by their worker"""
+	from run4it.api.scripts import script_process_workout_upload_jobs as script_func
+	return script_func('workout_jobs')
+
+@script4it.command()
+@click.argument('username')
+@click.argument('directory', type=click.Path(exists=True, file_okay=False))
+@click.option('--category', 'category_name', default='Running', help='Workout category of the imported workouts')
+@click.option('--processes', 'num_processes', type=int, default=None, help='Processes parsing files, one per CPU by default')
+@click.option('--batch-size', type=int, default=500, help='Workouts inserted per transaction')
+@click.option('--restart', is_flag=True, help='Start over instead of resuming an interrupted import')
+@with_appcontext
+def workout_import(username, directory, category_name, num_processes, batch_size, restart):
+	"""Imports a directory tree of workout files for a profile"""
+	from run4it.api.scripts import script_import_workout_directory as script_func
+	return script_func('workout_import', username, directory, category_name, num_processes, batch_size, restart)
+
 
 
 @click.command()
@@ -41,6 +68,72 @@ def init_test_data():
 	exit(ret_code)
 
 
+@click.command()
+@click.argument('dataset_path', type=click.Path(exists=True, dir_okay=False))
+@click.argument('index_path', type=click.Path(dir_okay=False))
+def build_gazetteer(dataset_path, index_path):
+	"""Build the offline geocoding index (.npy) of a places dataset (GeoNames .txt or .csv)"""
+	from run4it.api.workout.gazetteer import write_gazetteer_index
+	num_places = write_gazetteer_index(dataset_path, index_path)
+	click.echo('Indexed {0} places in {1}'.format(num_places, index_path))
+
+
+@click.command()
+@click.option('--baseline', 'baseline_path', type=click.Path(dir_okay=False), default=None, help='Baseline (.json) to compare with, made on the same machine')
+@click.option('--save-baseline', is_flag=True, help='Store the results as the baseline instead of comparing')
+@click.option('--repeat', type=int, default=5, help='Runs of each stage, the fastest is used')
+@click.option('--synthetic-points', type=int, default=50000, help='Points of the synthetic tracks, 0 skips them')
+@click.option('--threshold', type=float, default=0.25, help='Slowdown (or memory increase) of a stage, as a fraction, that fails the run')
+@click.option('--memory', is_flag=True, help='Measure peak and retained memory of each stage instead of time')
+@click.option('--distance-models', is_flag=True, help='Compare throughput and error of the track distance models, without a baseline')
+@click.option('--serialization', is_flag=True, help='Time dumping and encoding the track data instead of the pipeline stages')
+def benchmark(baseline_path, save_baseline, repeat, synthetic_points, threshold, memory, distance_models, serialization):
+	"""Benchmark workout file parsing and track processing, fails on regressions against a baseline"""
+	import tempfile
+	from run4it.api.workout.benchmark import (run_benchmarks, run_memory_benchmarks, run_distance_benchmarks, run_serialization_benchmarks, read_baseline,
+		write_baseline, compare_to_baseline, format_result, format_memory_result, format_distance_result, format_serialization_result,
+		BENCHMARK_MIN_REGRESSION_SECONDS, BENCHMARK_MIN_REGRESSION_BYTES)
+	project_root = os.path.join(os.path.abspath(os.path.dirname(__file__)), os.pardir, os.pardir)
+	if distance_models:
+		with tempfile.TemporaryDirectory() as work_dir:
+			run_distance_benchmarks(project_root, work_dir, repeat, synthetic_points, lambda case_name, result: click.echo(format_distance_result(case_name, result)))
+		click.echo('Errors in meters against the geodesic model: largest segment error, workout distance error')
+		exit(0)
+	if baseline_path is None:
+		baseline_name = "benchmark_memory_baseline.json" if memory else "benchmark_serialization_baseline.json" if serialization else "benchmark_baseline.json"
+		baseline_path = os.path.join(project_root, baseline_name)
+
+	with tempfile.TemporaryDirectory() as work_dir:
+		if memory:
+			results = run_memory_benchmarks(project_root, work_dir, synthetic_points, lambda case_name, result: click.echo(format_memory_result(case_name, result)))
+		elif serialization:
+			results = run_serialization_benchmarks(project_root, work_dir, repeat, synthetic_points,
+				lambda case_name, result: click.echo(format_serialization_result(case_name, result)))
+		else:
+			results = run_benchmarks(project_root, work_dir, repeat, synthetic_points, lambda case_name, result: click.echo(format_result(case_name, result)))
+
+	if save_baseline:
+		write_baseline(baseline_path, results)
+		click.echo('Saved baseline {0}'.format(baseline_path))
+		exit(0)
+
+	baseline_results = read_baseline(baseline_path)
+	if baseline_results is None:
+		click.echo('No baseline {0}, store one with --save-baseline'.format(baseline_path))
+		exit(0)
+
+	if memory:
+		regressions = compare_to_baseline(results, baseline_results, threshold, BENCHMARK_MIN_REGRESSION_BYTES, 'peakBytes')
+		for case_name, stage, baseline_bytes, peak_bytes in regressions:
+			click.echo('REGRESSION {0} {1}: peak {2:,.0f} KiB, baseline {3:,.0f} KiB'.format(case_name, stage, peak_bytes / 1024.0, baseline_bytes / 1024.0))
+	else:
+		regressions = compare_to_baseline(results, baseline_results, threshold, BENCHMARK_MIN_REGRESSION_SECONDS)
+		for case_name, stage, baseline_seconds, seconds in regressions:
+			click.echo('REGRESSION {0} {1}: {2:.2f} ms, baseline {3:.2f} ms'.format(case_name, stage, seconds * 1000.0, baseline_seconds * 1000.0))
+	click.echo('{0} regression(s) against {1}'.format(len(regressions), baseline_path))
+	exit(1 if len(regressions) > 0 else 0)
+
+
 @click.command()
 @with_appcontext
 def clean():
@@ -71,7 +164,7 @@ def init_database_test_data():
 	from run4it.api.token import TokenRegistry  # noqa
 	from run4it.api.discipline import DisciplineModel # noqa
 	from run4it.api.goal import GoalModel, GoalCategoryModel # noqa
-	from run4it.api.workout import WorkoutCategoryModel, WorkoutModel #noqa
+	from run4it.api.workout import WorkoutCategoryModel, WorkoutModel, WorkoutUploadJobModel #noqa
 	from run4it.api.polar import PolarUserModel, PolarWebhookExerciseModel
 
 	# delete most stuff
@@ -107,6 +200,10 @@ def init_database_test_data():
 	if rows > 0:
 		print('Deleted {0} rows from GoalCategory table'.format(rows))
 	
+	rows = WorkoutUploadJobModel.query.delete(False)
+	if rows > 0:
+		print('Deleted {0} rows from WorkoutUploadJob table'.format(rows))
+
 	rows = WorkoutModel.query.delete(False)
 	if rows > 0:
 		print('Deleted {0} rows from Workout table'.format(rows))
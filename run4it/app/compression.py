@@ -0,0 +1,96 @@
+"""Negotiated compression of responses"""
+import gzip
+import hashlib
+import zlib
+from flask import request, g
+from run4it.api.workout.cache import track_cache
+try:
+	import brotli
+except ImportError: # optional, responses are only gzip compressed without it
+	brotli = None
+
+COMPRESSION_DEFAULT_MIN_SIZE_BYTES = 1024 # smaller responses are not worth compressing
+COMPRESSION_DEFAULT_GZIP_LEVEL = 6
+COMPRESSION_DEFAULT_BROTLI_QUALITY = 5
+COMPRESSION_MIMETYPES = { 'application/json', 'text/html', 'text/plain', 'text/css', 'application/javascript' }
+
+
+class ResponseCompression:
+	'''Compresses responses with gzip or brotli, as negotiated by Accept-Encoding.
+	A resource can set g.compressed_response_path to the workout file its response is derived from,
+	the compressed bytes are then cached in the track cache together with the parsed file.'''
+
+	def __init__(self, app=None):
+		self.min_size = COMPRESSION_DEFAULT_MIN_SIZE_BYTES
+		self.gzip_level = COMPRESSION_DEFAULT_GZIP_LEVEL
+		self.brotli_quality = COMPRESSION_DEFAULT_BROTLI_QUALITY
+		if app is not None:
+			self.init_app(app)
+
+	def init_app(self, app):
+		self.min_size = app.config.get("COMPRESSION_MIN_SIZE_BYTES", COMPRESSION_DEFAULT_MIN_SIZE_BYTES)
+		self.gzip_level = app.config.get("COMPRESSION_GZIP_LEVEL", COMPRESSION_DEFAULT_GZIP_LEVEL)
+		self.brotli_quality = app.config.get("COMPRESSION_BROTLI_QUALITY", COMPRESSION_DEFAULT_BROTLI_QUALITY)
+		app.after_request(self.after_request)
+
+	def get_encodings(self):
+		return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+	def after_request(self, response):
+		if response.status_code == 304: # stands for a representation that varies by encoding, as its 200 does
+			response.vary.add('Accept-Encoding')
+			return response
+		if response.status_code < 200 or response.status_code >= 300 or response.status_code == 204:
+			return response
+		if response.mimetype not in COMPRESSION_MIMETYPES or 'Content-Encoding' in response.headers:
+			return response
+
+		response.vary.add('Accept-Encoding')
+		encoding = request.accept_encodings.best_match(self.get_encodings())
+		if encoding is None:
+			return response
+
+		if response.is_streamed:
+			response.response = self._compress_stream(response.response, encoding)
+			response.headers.pop('Content-Length', None)
+		else:
+			data = response.get_data()
+			if len(data) < self.min_size:
+				return response
+			response.set_data(self._compress_cached(data, encoding))
+		response.headers['Content-Encoding'] = encoding
+		etag, is_weak = response.get_etag()
+		if etag is not None and not is_weak: # the compressed bytes differ, the validator of the content stays valid
+			response.set_etag(etag, weak=True)
+		return response
+
+	def compress(self, data, encoding):
+		if encoding == 'br':
+			return brotli.compress(data, quality=self.brotli_quality)
+		return gzip.compress(data, compresslevel=self.gzip_level)
+
+	def _compress_cached(self, data, encoding):
+		cache_path = g.get('compressed_response_path')
+		if cache_path is None:
+			return self.compress(data, encoding)
+		# the response also contains fields that may be edited, so it is identified by its content
+		variant = ('compressed', encoding, hashlib.sha1(data).digest())
+		return track_cache.get(cache_path, lambda filepath: self.compress(data, encoding), variant)
+
+	def _compress_stream(self, chunks, encoding):
+		if encoding == 'br':
+			compressor = brotli.Compressor(quality=self.brotli_quality)
+			compress_chunk, flush = compressor.process, compressor.finish
+		else:
+			compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31) # 31: gzip container
+			compress_chunk, flush = compressor.compress, compressor.flush
+		for chunk in chunks:
+			if isinstance(chunk, str):
+				chunk = chunk.encode('utf-8')
+			compressed = compress_chunk(chunk)
+			if len(compressed) > 0:
+				yield compressed
+		yield flush()
+
+
+response_compression = ResponseCompression()
@@ -31,7 +31,24 @@ class Config(object):
 		'http://10.0.0.3:4200',
 	]
 
-	ALLOWED_UPLOAD_EXTENSIONS = { 'gpx', 'tcx' }
+	ALLOWED_UPLOAD_EXTENSIONS = { 'gpx', 'tcx', 'fit' }
+	TRACK_CACHE_MAX_BYTES = 64 * 1024 * 1024 # parsed workout files kept in memory, per worker process
+	TRACK_DISTANCE_MODEL = os.environ.get("RUN4IT_TRACK_DISTANCE_MODEL", "geodesic") # geodesic | haversine | flat, stored tracks keep theirs
+	TRACK_DEVICE_METRICS = False # use distance and speed recorded by the device (TCX, FIT) where present, also for tracks without GPS
+	COMPRESSION_MIN_SIZE_BYTES = 1024 # responses are gzip/brotli compressed from this size
+	REFERENCE_DATA_MAX_AGE = 3600 # seconds browsers and proxies may keep category lists
+	GEOCODE_CACHE_PRECISION = 6 # geohash characters of the cells place names are cached for, 6 is about 1.2 x 0.6 km
+	GEOCODE_CACHE_TTL_DAYS = 180
+	GEOCODE_PROVIDER = os.environ.get("RUN4IT_GEOCODE_PROVIDER", "google") # google | offline
+	GEOCODE_GAZETTEER_PATH = os.environ.get("RUN4IT_GEOCODE_GAZETTEER_PATH") # places dataset (GeoNames .txt, .csv) or index built from one (.npy)
+	GEOCODE_GAZETTEER_MAX_DISTANCE_KM = 25.0
+	GEOCODE_GOOGLE_FALLBACK = True # look up positions without a gazetteer place with Google
+	WORKOUT_NAMING_IN_BACKGROUND = True # False leaves naming of new workouts to the workout_names script
+	BACKGROUND_JOB_WORKERS = 2 # threads per process processing uploaded workout files, 0 processes them in the request
+	WORKOUT_ARCHIVE_PROCESSES = None # processes parsing the files of an uploaded archive, None is one per CPU, 0 parses in the request
+	WORKOUT_ARCHIVE_BATCH_SIZE = 50 # workouts of an archive created per transaction
+	WORKOUT_ARCHIVE_MAX_FILES = 1000
+	WORKOUT_ARCHIVE_MAX_FILE_BYTES = 64 * 1024 * 1024 # uncompressed size of each file in an archive
 
 	POLAR_API_CLIENT_ID = os.environ.get("POLAR_API_CLIENT_ID", "polar_api_client_id")
 	POLAR_API_CLIENT_SECRET = os.environ.get("POLAR_API_CLIENT_SECRET", "polar_api_client_secret")
@@ -71,6 +88,8 @@ class TestConfig(Config):
 	MAIL_DEFAULT_SENDER = os.environ.get("RUN4IT_FASTMAIL_USERNAME", "nousefor@name.com")
 	GPX_UPLOAD_DIR = os.path.join(Config.PROJECT_ROOT, "uploads/gpx")
 	GOOGLE_API_KEY = "gmaps_api_key"
+	WORKOUT_NAMING_IN_BACKGROUND = False # tests name workouts explicitly
+	WORKOUT_ARCHIVE_PROCESSES = 2
 
 class ProductionConfig(Config):
 	"""Production Configuration"""
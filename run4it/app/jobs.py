@@ -0,0 +1,62 @@
+"""Background jobs run by a local pool of worker threads"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+BACKGROUND_JOBS_DEFAULT_WORKERS = 2
+
+
+class BackgroundJobs:
+	'''Runs functions in worker threads of this process, each inside an app context of the app.
+	There is no broker, the functions keep the state of their jobs in the database.
+	With zero workers, functions are run at once in the calling thread.'''
+
+	def __init__(self, app=None):
+		self.app = None
+		self.num_workers = BACKGROUND_JOBS_DEFAULT_WORKERS
+		self.executor = None
+		self.futures = set()
+		self.lock = threading.Lock()
+		if app is not None:
+			self.init_app(app)
+
+	def init_app(self, app):
+		self.shutdown()
+		self.app = app
+		self.num_workers = app.config.get("BACKGROUND_JOB_WORKERS", BACKGROUND_JOBS_DEFAULT_WORKERS)
+		if self.num_workers > 0:
+			self.executor = ThreadPoolExecutor(max_workers=self.num_workers, thread_name_prefix="run4it-job")
+
+	def submit(self, function, *args):
+		if self.executor is None:
+			self._run(function, *args)
+			return
+		future = self.executor.submit(self._run, function, *args)
+		with self.lock:
+			self.futures.add(future)
+		future.add_done_callback(self._remove_future)
+
+	def wait(self, timeout=None):
+		'''Waits until all submitted functions are done, returns False on timeout'''
+		with self.lock:
+			futures = list(self.futures)
+		_, not_done = wait(futures, timeout)
+		return len(not_done) == 0
+
+	def shutdown(self):
+		if self.executor is not None:
+			self.executor.shutdown(wait=True)
+			self.executor = None
+
+	def _run(self, function, *args):
+		with self.app.app_context(): # the session of the thread is removed when the context is popped
+			try:
+				function(*args)
+			except Exception:
+				self.app.logger.exception("Background job {0} failed".format(getattr(function, "__name__", function)))
+
+	def _remove_future(self, future):
+		with self.lock:
+			self.futures.discard(future)
+
+
+background_jobs = BackgroundJobs()
@@ -0,0 +1,71 @@
+import json
+import pytest
+import datetime as dt
+from marshmallow import Schema, fields
+from run4it.api.serializer import FastDumpSchema, FiniteFloat, dumps
+from run4it.api.api_v1 import ApiVersion
+
+
+class DumpedObject:
+	def __init__(self, **kwargs):
+		for key, value in kwargs.items():
+			setattr(self, key, value)
+
+
+class ReferenceSchema(Schema):
+	id = fields.Int(dump_only=True)
+	name = fields.Str()
+	distance = fields.Float(attribute='total_distance')
+	duration = fields.Int(as_string=True)
+	edited = fields.Bool()
+	startAt = fields.DateTime(attribute='start_at')
+	endAt = fields.DateTime(attribute='end_at', format='iso')
+	limit = fields.Int(load_only=True)
+	unit = fields.Str(default='km')
+
+	class Meta:
+		datetimeformat = '%Y-%m-%dT%H:%M:%S+00:00'
+
+class FastSchema(FastDumpSchema, ReferenceSchema):
+	pass
+
+
+class TestFastDumpSchema:
+	def test_same_output_as_schema(self):
+		start_at = dt.datetime(2020, 9, 27, 11, 29, 31)
+		obj = DumpedObject(id=1.7, name=12, total_distance=5, duration=321, edited=1, start_at=start_at, end_at=start_at, limit=3)
+		assert(FastSchema().dump(obj) == ReferenceSchema().dump(obj))
+		assert(FastSchema().dump(obj)["id"] == 1)
+		assert(FastSchema().dump(obj)["startAt"] == "2020-09-27T11:29:31+00:00")
+		assert("limit" not in FastSchema().dump(obj))
+
+	def test_finite_float_dumps_nan_as_none(self):
+		class PositionSchema(FastDumpSchema):
+			latitude = FiniteFloat()
+		assert(PositionSchema().dump(DumpedObject(latitude=float("nan")))["latitude"] is None)
+		assert(PositionSchema().dump(DumpedObject(latitude=float("inf")))["latitude"] is None)
+		assert(PositionSchema().dump(DumpedObject(latitude=63.5))["latitude"] == 63.5)
+
+	def test_same_output_for_missing_and_none(self):
+		obj = DumpedObject(id=None, name=None)
+		assert(FastSchema().dump(obj) == ReferenceSchema().dump(obj))
+		assert(FastSchema().dump(obj) == { "id": None, "name": None, "unit": "km" })
+
+	def test_same_output_for_dicts_and_lists(self):
+		items = [{ "id": 1, "name": "a", "total_distance": 1.5 }, { "id": 2, "edited": False }]
+		assert(FastSchema(many=True).dump(items) == ReferenceSchema(many=True).dump(items))
+		assert(FastSchema(only=("id",)).dump(items[0]) == { "id": 1 })
+
+
+class TestJsonOutput:
+	def test_dumps(self):
+		data = { "a": [1, 2.5, "x", None, True], "b": { "c": "æøå" } }
+		assert(json.loads(dumps(data)) == data)
+
+	def test_dumps_unsupported_by_fast_encoder(self):
+		assert(json.loads(dumps({ "big": 2**70 })) == { "big": 2**70 })
+
+	def test_api_json_response_is_encoded_by_dumps(self, api, client):
+		response = client.get(api.url_for(ApiVersion))
+		assert(response.headers["Content-Type"] == 'application/json')
+		assert(response.data.decode('utf-8') == dumps({ 'version': 1, 'env': 'test' }) + "\n")
@@ -18,6 +18,12 @@ class TestApiResource:
         assert(response_json["version"] == 1)
         assert(response_json["env"] == "test")
 
+    def test_small_response_is_not_compressed(self, api, client):
+        url = api.url_for(ApiVersion)
+        response = client.get(url, headers={ "Accept-Encoding": "gzip" })
+        assert("Content-Encoding" not in response.headers)
+        assert(get_response_json(response.data)["version"] == 1)
+
     def test_post_api_not_supported(self, api, client):
         url = api.url_for(ApiVersion)
         response = client.post(url)
@@ -39,6 +39,15 @@ class TestDisciplineResource:
 		assert(response_json[0]["length"] == 1000)
 		assert(response_json[0]["username"] == "user1")
 
+	def test_get_disciplinelist_revalidated(self, api, client, db):
+		self._create_disciplines(3, db)
+		url = api.url_for(DisciplineListResource)
+		response = client.get(url)
+		assert(response.headers["Cache-Control"] == "no-cache")
+		assert(client.get(url, headers={"If-None-Match": response.headers["ETag"]}).status_code == 304)
+		DisciplineModel("disc4", 2000, "user1").save()
+		assert(client.get(url, headers={"If-None-Match": response.headers["ETag"]}).status_code == 200)
+
 	def test_create_discipines_helper(self, api, client, db):
 		self._create_disciplines(10, db)
 		assert(DisciplineModel.query.count() == 10)
@@ -41,3 +41,8 @@ class TestGoalCategoryListResource:
 		assert(response_json[1]["workoutCategoryName"] == "Running")
 		assert(response_json[2]["name"] == "Weight gain")
 
+	def test_get_goal_categories_cacheable(self, api, client):
+		url = api.url_for(GoalCategoryListResource)
+		response = client.get(url)
+		assert(response.headers["Cache-Control"] == "public, max-age=3600")
+		assert(client.get(url, headers={"If-None-Match": response.headers["ETag"]}).status_code == 304)
@@ -31,6 +31,42 @@ class TestProfileResource:
 		assert(response_json["weight"] == 75)
 		assert(str(response_json["birthDate"]) == '1980-02-29')
 
+	def test_get_profile_not_modified(self, api, client):
+		token,_ = register_and_login_confirmed_user(api, client, "profiler", "pro@filer.com", "passwd", 179, 75.0, dt.date(1980, 2, 29))
+		url = api.url_for(Profile, username="profiler")
+		response = client.get(url, headers=get_authorization_header(token))
+		assert(response.headers["Cache-Control"] == "private, no-cache")
+		headers = get_authorization_header(token)
+		headers["If-None-Match"] = response.headers["ETag"]
+		assert(client.get(url, headers=headers).status_code == 304)
+		headers = get_authorization_header(token)
+		headers["If-Modified-Since"] = response.headers["Last-Modified"]
+		assert(client.get(url, headers=headers).status_code == 304)
+
+	def test_get_profile_modified_after_update(self, api, client):
+		token,_ = register_and_login_confirmed_user(api, client, "profiler", "pro@filer.com", "passwd", 179, 75.0, dt.date(1980, 2, 29))
+		url = api.url_for(Profile, username="profiler")
+		etag = client.get(url, headers=get_authorization_header(token)).headers["ETag"]
+		client.put(url, data={"height":180}, headers=get_authorization_header(token))
+		headers = get_authorization_header(token)
+		headers["If-None-Match"] = etag
+		response = client.get(url, headers=headers)
+		assert(response.status_code == 200)
+		assert(get_response_json(response.data)["height"] == 180)
+
+	def test_get_profile_last_modified_by_user_update(self, api, client):
+		token,_ = register_and_login_confirmed_user(api, client, "profiler", "pro@filer.com", "passwd", 179, 75.0, dt.date(1980, 2, 29))
+		url = api.url_for(Profile, username="profiler")
+		last_modified = client.get(url, headers=get_authorization_header(token)).headers["Last-Modified"]
+		user = User.find_by_username("profiler")
+		user.updated_at = user.profile.updated_at + dt.timedelta(seconds=10)
+		user.save()
+		headers = get_authorization_header(token)
+		headers["If-Modified-Since"] = last_modified
+		response = client.get(url, headers=headers)
+		assert(response.status_code == 200)
+		assert(response.headers["Last-Modified"] != last_modified)
+
 	def test_get_profile_data_not_set(self, api, client):
 		token,_ = register_and_login_confirmed_user(api, client, "profiler", "pro@filer.com", "passwd")
 		url = api.url_for(Profile, username="profiler")
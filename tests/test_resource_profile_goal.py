@@ -236,6 +236,14 @@ class TestProfileGoalResource:
 		assert(response.status_code == 200)	
 		assert(response_json["id"] == 2)
 
+	def test_get_goal_not_modified(self, api, client):
+		token,_ = register_and_login_confirmed_user(api, client, "jonny", "jonny@vikan.no", "jonny")
+		url = api.url_for(ProfileGoalResource, username="jonny", goal_id=2)
+		response = client.get(url, headers=get_authorization_header(token))
+		headers = get_authorization_header(token)
+		headers["If-None-Match"] = response.headers["ETag"]
+		assert(client.get(url, headers=headers).status_code == 304)
+
 	def test_get_nonexistant_goal(self, api, client):
 		token,_ = register_and_login_confirmed_user(api, client, "jonny", "jonny@vikan.no", "jonny")
 		url = api.url_for(ProfileGoalResource, username="jonny", goal_id=99)
@@ -1,10 +1,19 @@
 import io
 import os
+import re
+import json
+import gzip
+import zipfile
 import pytest
 import datetime as dt
 from flask import current_app
-from run4it.api.workout import ProfileWorkoutListResource, ProfileWorkoutResource, ProfileWorkoutGpxResource, WorkoutModel, WorkoutCategoryModel
+from run4it.api.workout import (ProfileWorkoutListResource, ProfileWorkoutResource, ProfileWorkoutGpxResource, ProfileWorkoutUploadJobResource,
+	ProfileWorkoutArchiveResource,
+	WorkoutModel, WorkoutCategoryModel, WorkoutUploadJobModel)
 from run4it.api.goal import GoalCategoryModel, GoalModel
+from run4it.api.workout.cache import track_cache
+from run4it.api.workout.track import track_distance
+from run4it.app.jobs import background_jobs
 from .helpers import get_response_json, register_confirmed_user, register_and_login_confirmed_user, get_authorization_header
 
 
@@ -226,6 +235,30 @@ class TestProfileWorkoutResource:
 		assert(response.status_code == 404)
 		assert(response_json["errors"]["workout"] is not None)
 
+	def test_get_workout_not_modified(self, api, client):
+		token,_ = register_and_login_confirmed_user(api, client, "jonny", "jonny@vikan.no", "jonny")
+		url = api.url_for(ProfileWorkoutResource, username="jonny", workout_id=2)
+		response = client.get(url, headers=get_authorization_header(token))
+		assert(response.headers["Cache-Control"] == "private, no-cache")
+		headers = get_authorization_header(token)
+		headers["If-None-Match"] = response.headers["ETag"]
+		not_modified_response = client.get(url, headers=headers)
+		assert(not_modified_response.status_code == 304)
+		assert(not_modified_response.data == b"")
+		assert(client.get(url + "?maxPoints=10", headers=headers).status_code == 200)
+
+	def test_get_workout_modified_after_update(self, api, client):
+		token,_ = register_and_login_confirmed_user(api, client, "jonny", "jonny@vikan.no", "jonny")
+		url = api.url_for(ProfileWorkoutResource, username="jonny", workout_id=2)
+		etag = client.get(url, headers=get_authorization_header(token)).headers["ETag"]
+		startAt = (dt.datetime.utcnow() - dt.timedelta(days=1)).strftime("%Y-%m-%dT%H:%M:%S+00:00")
+		client.put(url, data={ "name":"New name", "startAt":"{0}".format(startAt), "distance":4321, "duration":222, "categoryID":2 }, headers=get_authorization_header(token))
+		headers = get_authorization_header(token)
+		headers["If-None-Match"] = etag
+		response = client.get(url, headers=headers)
+		assert(response.status_code == 200)
+		assert(get_response_json(response.data)["name"] == "New name")
+
 	def test_update_workout_not_logged_in(self, api, client):
 		url = api.url_for(ProfileWorkoutResource, username="jonny", workout_id=1)
 		response = client.put(url)
@@ -262,6 +295,19 @@ class TestProfileWorkoutResource:
 		assert(response_json["resourceFile"] == "run1.gpx")
 		assert(response_json["edited"] == True)
 
+	def test_update_workout_clears_pending_name(self, api, client):
+		token,_ = register_and_login_confirmed_user(api, client, "jonny", "jonny@vikan.no", "jonny")
+		workout = WorkoutModel.get_by_id(1)
+		workout.set_pending_name(63.43, 10.39)
+		workout.save()
+		url = api.url_for(ProfileWorkoutResource, username="jonny", workout_id=1)
+		startAt = dt.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S+00:00")
+		response = client.put(url, data={ "name":"Running", "startAt":"{0}".format(startAt), "distance":4321, "duration":222, "categoryID":2 }, headers=get_authorization_header(token))
+		assert(response.status_code == 200)
+		workout = WorkoutModel.get_by_id(1)
+		assert(workout.name == "Running") # the user kept the name when changing the category
+		assert(not workout.name_pending)
+
 	def test_update_workout_with_nonexisting_category(self, api, client):
 		token,_ = register_and_login_confirmed_user(api, client, "jonny", "jonny@vikan.no", "jonny")
 		url = api.url_for(ProfileWorkoutResource, username="jonny", workout_id=1)
@@ -301,26 +347,12 @@ class TestProfileWorkoutGpxResource:
 		cat1.save(commit=False)
 	
 	def teardown(self):
-		try:
-			tmp_filename = os.path.join(current_app.config["GPX_UPLOAD_DIR"], "jonny_test.gpx")
-			os.remove(tmp_filename)
-		except:
-			pass
-		try:
-			filename = os.path.join(current_app.config["GPX_UPLOAD_DIR"], "jonny_workout_1.gpx")
-			os.remove(filename)
-		except:
-			pass
-		try:
-			tmp_filename = os.path.join(current_app.config["GPX_UPLOAD_DIR"], "jonny_test.tcx")
-			os.remove(tmp_filename)
-		except:
-			pass
-		try:
-			filename = os.path.join(current_app.config["GPX_UPLOAD_DIR"], "jonny_workout_1.tcx")
-			os.remove(filename)
-		except:
-			pass
+		for extension in ["gpx", "tcx", "fit"]:
+			for filename in ["jonny_test.{0}", "jonny_workout_1.{0}", "jonny_test.{0}.trk", "jonny_workout_1.{0}.trk"]:
+				try:
+					os.remove(os.path.join(current_app.config["GPX_UPLOAD_DIR"], filename.format(extension)))
+				except:
+					pass
 
 	def get_dummy_gpx_file(self):
 		gpxStr = "<?xml version=\"1.0\" encoding=\"UTF-8\"?><gpx xmlns=\"http://www.topografix.com/GPX/1/1\" version=\"1.1\" creator=\"Polar Ignite\">"
@@ -350,6 +382,11 @@ class TestProfileWorkoutGpxResource:
 		tcxStr += "<LangID>en</LangID><PartNumber>006-D2449-00</PartNumber></Author></TrainingCenterDatabase>"
 		return io.BytesIO(bytearray(str.encode(tcxStr)))
 
+	def get_dummy_fit_file(self):
+		fit_filepath = os.path.join(os.path.dirname(__file__), "..", "test_garmin.fit")
+		with open(fit_filepath, "rb") as fit_file:
+			return io.BytesIO(fit_file.read())
+
 	def test_content_type_is_json(self, api, client):
 		url = api.url_for(ProfileWorkoutGpxResource, username="jonny", category_id=1)
 		response = client.post(url)
@@ -401,6 +438,179 @@ class TestProfileWorkoutGpxResource:
 		assert(response_json["resourceFile"] == "jonny_workout_1.tcx")
 		assert(response_json["categoryName"] == "Running")
 
+	def test_upload_fit(self, api, client):
+		token,_ = register_and_login_confirmed_user(api, client, "jonny", "jonny@vikan.no", "jonny")
+		url = api.url_for(ProfileWorkoutGpxResource, username="jonny", category_id=1)
+		fileinfo = {"gpxfile" : (self.get_dummy_fit_file(), 'test.fit')}
+		response = client.post(url, data=fileinfo, headers=get_authorization_header(token))
+		response_json = get_response_json(response.data)
+		assert(response.status_code == 200)
+		assert(response_json["id"] == 1)
+		assert(response_json["duration"] == 1815)
+		assert(response_json["distance"] == 5267) # totals of the session recorded by the device
+		assert(response_json["climb"] == 131)
+		assert(response_json["resourceFile"] == "jonny_workout_1.fit")
+		assert(os.path.exists(os.path.join(current_app.config["GPX_UPLOAD_DIR"], "jonny_workout_1.fit.trk")))
+		assert(not os.path.exists(os.path.join(current_app.config["GPX_UPLOAD_DIR"], "jonny_test.fit.trk")))
+
+	def test_get_uploaded_workout_with_max_points(self, api, client):
+		token,_ = register_and_login_confirmed_user(api, client, "jonny", "jonny@vikan.no", "jonny")
+		url = api.url_for(ProfileWorkoutGpxResource, username="jonny", category_id=1)
+		client.post(url, data={"gpxfile" : (self.get_dummy_fit_file(), 'test.fit')}, headers=get_authorization_header(token))
+		url = api.url_for(ProfileWorkoutResource, username="jonny", workout_id=1)
+		response_json = get_response_json(client.get(url, headers=get_authorization_header(token)).data)
+		assert(len(response_json["trackData"]) == 272)
+		for simplify in ["map", "speed", "elevation", "heartRate"]:
+			response = client.get(url + "?maxPoints=50&simplify=" + simplify, headers=get_authorization_header(token))
+			simplified_json = get_response_json(response.data)
+			assert(response.status_code == 200)
+			assert(len(simplified_json["trackData"]) == 50)
+			assert(simplified_json["trackData"][0] == response_json["trackData"][0])
+			assert(simplified_json["trackData"][-1] == response_json["trackData"][-1])
+			assert(simplified_json["trackSplits"] == response_json["trackSplits"])
+
+	def test_get_uploaded_workout_range(self, api, client):
+		token,_ = register_and_login_confirmed_user(api, client, "jonny", "jonny@vikan.no", "jonny")
+		url = api.url_for(ProfileWorkoutGpxResource, username="jonny", category_id=1)
+		client.post(url, data={"gpxfile" : (self.get_dummy_fit_file(), 'test.fit')}, headers=get_authorization_header(token))
+		url = api.url_for(ProfileWorkoutResource, username="jonny", workout_id=1)
+		response = client.get(url + "?fromDistance=1000&toDistance=2000", headers=get_authorization_header(token))
+		response_json = get_response_json(response.data)
+		assert(response.status_code == 200)
+		assert(len(response_json["trackData"]) > 0)
+		assert(all(1000 <= point["distance"] <= 2000 for point in response_json["trackData"]))
+		response = client.get(url + "?fromDuration=600&toDuration=1200&maxPoints=10", headers=get_authorization_header(token))
+		response_json = get_response_json(response.data)
+		assert(len(response_json["trackData"]) == 10)
+		assert(all(600 <= point["duration"] <= 1200 for point in response_json["trackData"]))
+
+	def test_get_uploaded_workout_streamed(self, api, client):
+		token,_ = register_and_login_confirmed_user(api, client, "jonny", "jonny@vikan.no", "jonny")
+		url = api.url_for(ProfileWorkoutGpxResource, username="jonny", category_id=1)
+		client.post(url, data={"gpxfile" : (self.get_dummy_fit_file(), 'test.fit')}, headers=get_authorization_header(token))
+		url = api.url_for(ProfileWorkoutResource, username="jonny", workout_id=1)
+		response_json = get_response_json(client.get(url, headers=get_authorization_header(token)).data)
+		response = client.get(url + "?stream=true", headers=get_authorization_header(token))
+		assert(response.status_code == 200)
+		assert(response.is_streamed)
+		assert(response.headers["Content-Type"] == 'application/json')
+		assert(get_response_json(response.data) == response_json)
+
+	def test_get_uploaded_workout_without_positions(self, api, client, monkeypatch):
+		monkeypatch.setattr("run4it.api.serializer.orjson", None) # the standard library encoder writes NaN, which is not JSON
+		track_distance.device_metrics = True
+		with open(os.path.join(os.path.dirname(__file__), "..", "test_garmin.tcx")) as tcx_file:
+			tcx = re.sub(r"<Position>.*?</Position>", "", tcx_file.read(), flags=re.S)
+		token,_ = register_and_login_confirmed_user(api, client, "jonny", "jonny@vikan.no", "jonny")
+		url = api.url_for(ProfileWorkoutGpxResource, username="jonny", category_id=1)
+		response = client.post(url, data={"gpxfile" : (io.BytesIO(tcx.encode("utf-8")), 'treadmill.tcx')}, headers=get_authorization_header(token))
+		assert(response.status_code == 200)
+		url = api.url_for(ProfileWorkoutResource, username="jonny", workout_id=1)
+		for query in ["", "?stream=true"]:
+			response = client.get(url + query, headers=get_authorization_header(token))
+			assert(response.status_code == 200)
+			response_json = json.loads(response.data.decode("utf-8"), parse_constant=lambda constant: pytest.fail("Invalid JSON " + constant))
+			assert(len(response_json["trackData"]) == 504)
+			assert(all(point["latitude"] is None and point["longitude"] is None for point in response_json["trackData"]))
+			assert(response_json["trackSummary"]["latitude"] is None)
+			assert(response_json["trackData"][-1]["distance"] > 10000)
+
+	def test_get_uploaded_workout_compressed(self, api, client):
+		token,_ = register_and_login_confirmed_user(api, client, "jonny", "jonny@vikan.no", "jonny")
+		url = api.url_for(ProfileWorkoutGpxResource, username="jonny", category_id=1)
+		client.post(url, data={"gpxfile" : (self.get_dummy_fit_file(), 'test.fit')}, headers=get_authorization_header(token))
+		url = api.url_for(ProfileWorkoutResource, username="jonny", workout_id=1)
+		response = client.get(url, headers=get_authorization_header(token))
+		assert("Content-Encoding" not in response.headers)
+		assert("Accept-Encoding" in response.headers["Vary"])
+		headers = get_authorization_header(token)
+		headers["Accept-Encoding"] = "gzip, deflate"
+		compressed_response = client.get(url, headers=headers)
+		assert(compressed_response.headers["Content-Encoding"] == "gzip")
+		assert(len(compressed_response.data) < len(response.data) / 4)
+		assert(gzip.decompress(compressed_response.data) == response.data)
+		num_hits = track_cache.get_stats()["hits"]
+		assert(client.get(url, headers=headers).data == compressed_response.data)
+		assert(track_cache.get_stats()["hits"] == num_hits + 3) # parsed track, laps and compressed response
+		streamed_response = client.get(url + "?stream=true", headers=headers)
+		assert(streamed_response.headers["Content-Encoding"] == "gzip")
+		assert(get_response_json(gzip.decompress(streamed_response.data)) == get_response_json(response.data))
+
+	def test_get_uploaded_workout_compressed_not_modified(self, api, client):
+		token,_ = register_and_login_confirmed_user(api, client, "jonny", "jonny@vikan.no", "jonny")
+		url = api.url_for(ProfileWorkoutGpxResource, username="jonny", category_id=1)
+		client.post(url, data={"gpxfile" : (self.get_dummy_fit_file(), 'test.fit')}, headers=get_authorization_header(token))
+		url = api.url_for(ProfileWorkoutResource, username="jonny", workout_id=1)
+		headers = get_authorization_header(token)
+		headers["Accept-Encoding"] = "gzip"
+		response = client.get(url, headers=headers)
+		assert(response.headers["ETag"].startswith('W/"')) # compressed bytes differ from the identity representation
+		num_misses = track_cache.get_stats()["misses"]
+		num_hits = track_cache.get_stats()["hits"]
+		headers["If-None-Match"] = response.headers["ETag"]
+		assert(client.get(url, headers=headers).status_code == 304)
+		assert(track_cache.get_stats()["misses"] == num_misses) # answered before the track is loaded
+		assert(track_cache.get_stats()["hits"] == num_hits)
+
+	def test_get_uploaded_workout_with_invalid_max_points(self, api, client):
+		token,_ = register_and_login_confirmed_user(api, client, "jonny", "jonny@vikan.no", "jonny")
+		url = api.url_for(ProfileWorkoutGpxResource, username="jonny", category_id=1)
+		client.post(url, data={"gpxfile" : (self.get_dummy_fit_file(), 'test.fit')}, headers=get_authorization_header(token))
+		url = api.url_for(ProfileWorkoutResource, username="jonny", workout_id=1)
+		response = client.get(url + "?maxPoints=1", headers=get_authorization_header(token))
+		assert(response.status_code == 422)
+		response = client.get(url + "?maxPoints=50&simplify=abc", headers=get_authorization_header(token))
+		assert(response.status_code == 422)
+
+	def test_upload_invalid_fit(self, api, client):
+		token,_ = register_and_login_confirmed_user(api, client, "jonny", "jonny@vikan.no", "jonny")
+		url = api.url_for(ProfileWorkoutGpxResource, username="jonny", category_id=1)
+		fileinfo = {"gpxfile" : (io.BytesIO(b"abcdefghijklmnop"), 'test.fit')}
+		response = client.post(url, data=fileinfo, headers=get_authorization_header(token))
+		response_json = get_response_json(response.data)
+		assert(response.status_code == 422)
+		assert(response_json["errors"]["workout"][0] == "Failed to parse uploaded file")
+
+	def test_upload_in_background(self, api, client):
+		token,_ = register_and_login_confirmed_user(api, client, "jonny", "jonny@vikan.no", "jonny")
+		url = api.url_for(ProfileWorkoutGpxResource, username="jonny", category_id=1)
+		response = client.post(url + "?background=true", data={"gpxfile" : (self.get_dummy_fit_file(), 'test.fit')}, headers=get_authorization_header(token))
+		response_json = get_response_json(response.data)
+		assert(response.status_code == 202)
+		assert(response_json["status"] in ["pending", "processing", "completed"])
+		assert(response.headers["Location"].endswith(api.url_for(ProfileWorkoutUploadJobResource, username="jonny", job_id=response_json["id"])))
+		assert(background_jobs.wait(30))
+		job_response = client.get(response.headers["Location"], headers=get_authorization_header(token))
+		job_json = get_response_json(job_response.data)
+		assert(job_response.status_code == 200)
+		assert(job_json["status"] == "completed")
+		assert(job_json["progress"] == 100)
+		assert(job_json["workout"]["id"] == 1)
+		assert(job_json["workout"]["resourceFile"] == "jonny_workout_1.fit")
+		assert(job_json["workout"]["distance"] > 0)
+		assert("trackData" not in job_json["workout"])
+
+	def test_upload_invalid_fit_in_background(self, api, client):
+		token,_ = register_and_login_confirmed_user(api, client, "jonny", "jonny@vikan.no", "jonny")
+		url = api.url_for(ProfileWorkoutGpxResource, username="jonny", category_id=1)
+		fileinfo = {"gpxfile" : (io.BytesIO(b"abcdefghijklmnop"), 'test.fit')}
+		response = client.post(url + "?background=true", data=fileinfo, headers=get_authorization_header(token))
+		assert(response.status_code == 202)
+		assert(background_jobs.wait(30))
+		job_json = get_response_json(client.get(response.headers["Location"], headers=get_authorization_header(token)).data)
+		assert(job_json["status"] == "failed")
+		assert(job_json["message"] == "Failed to parse uploaded file")
+		assert(job_json["workout"] is None)
+		assert(not any("jonny" in filename for filename in os.listdir(current_app.config["GPX_UPLOAD_DIR"])))
+
+	def test_get_upload_job_for_another_user(self, api, client):
+		register_confirmed_user("test", "test@test.com", "pwd")
+		WorkoutUploadJobModel(1, WorkoutCategoryModel.get_by_id(1), "test_file.fit").save()
+		token,_ = register_and_login_confirmed_user(api, client, "jonny", "jonny@vikan.no", "jonny")
+		url = api.url_for(ProfileWorkoutUploadJobResource, username="jonny", job_id=1)
+		response = client.get(url, headers=get_authorization_header(token))
+		assert(response.status_code == 404)
+
 	def test_upload_with_nonexistant_category(self, api, client):
 		token,_ = register_and_login_confirmed_user(api, client, "jonny", "jonny@vikan.no", "jonny")
 		url = api.url_for(ProfileWorkoutGpxResource, username="jonny", category_id=99)
@@ -449,3 +659,139 @@ class TestProfileWorkoutGpxResource:
 		response = client.delete(url)
 		assert(response.status_code == 405) # not allowed
 
+
+@pytest.mark.usefixtures('db')
+class TestProfileWorkoutArchiveResource:
+	def setup(self):
+		cat1 = WorkoutCategoryModel('Running', True)
+		cat1.save(commit=False)
+
+	def teardown(self):
+		upload_dir = current_app.config["GPX_UPLOAD_DIR"]
+		for filename in os.listdir(upload_dir):
+			if filename.startswith("jonny_"):
+				os.remove(os.path.join(upload_dir, filename))
+
+	def get_dummy_archive(self, entries=None):
+		if entries is None:
+			dummy_files = TestProfileWorkoutGpxResource()
+			entries = [("2020/test.gpx", dummy_files.get_dummy_gpx_file().read()), ("readme.txt", b"Exported workouts"),
+				("2020/test.tcx", dummy_files.get_dummy_tcx_file().read()), ("invalid.fit", b"abcdefghijklmnop"),
+				("test.fit", dummy_files.get_dummy_fit_file().read())]
+		archive = io.BytesIO()
+		with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as archive_file:
+			for name, data in entries:
+				archive_file.writestr(name, data)
+		archive.seek(0)
+		return archive
+
+	def upload_archive(self, api, client, token, archive, filename="export.zip"):
+		url = api.url_for(ProfileWorkoutArchiveResource, username="jonny", category_id=1)
+		response = client.post(url, data={"archive" : (archive, filename)}, headers=get_authorization_header(token))
+		return response, get_response_json(response.data)
+
+	def test_upload_archive_not_logged_in(self, api, client):
+		url = api.url_for(ProfileWorkoutArchiveResource, username="jonny", category_id=1)
+		response = client.post(url)
+		assert(response.status_code == 401)
+
+	def test_upload_archive(self, api, client):
+		token,_ = register_and_login_confirmed_user(api, client, "jonny", "jonny@vikan.no", "jonny")
+		response, response_json = self.upload_archive(api, client, token, self.get_dummy_archive())
+		assert(response.status_code == 200)
+		assert(response_json["numCreated"] == 3)
+		assert(response_json["numFailed"] == 1)
+		assert(response_json["numSkipped"] == 1)
+		assert([result["file"] for result in response_json["files"]] == ["2020/test.gpx", "readme.txt", "2020/test.tcx", "invalid.fit", "test.fit"])
+		assert([result["status"] for result in response_json["files"]] == ["created", "skipped", "created", "failed", "created"])
+		assert([result["workoutId"] for result in response_json["files"]] == [1, None, 2, None, 3])
+		assert(response_json["files"][3]["message"] == "Failed to parse uploaded file")
+		workout = WorkoutModel.get_by_id(2)
+		assert(workout.name == "Running")
+		assert(workout.name_pending)
+		assert(workout.distance > 0)
+		assert(workout.resource_file == "jonny_workout_2.tcx")
+		assert(os.path.isfile(os.path.join(current_app.config["GPX_UPLOAD_DIR"], "jonny_workout_3.fit.trk")))
+		assert(sorted(filename for filename in os.listdir(current_app.config["GPX_UPLOAD_DIR"]) if filename.startswith("jonny_")) == ["jonny_workout_1.gpx", "jonny_workout_1.gpx.trk",
+			"jonny_workout_2.tcx", "jonny_workout_2.tcx.trk", "jonny_workout_3.fit", "jonny_workout_3.fit.trk"])
+
+	def test_uploaded_archive_workouts_are_added_to_goals(self, api, client):
+		token,_ = register_and_login_confirmed_user(api, client, "jonny", "jonny@vikan.no", "jonny")
+		goal_category = GoalCategoryModel("Number of workouts", "#", 1)
+		goal_category.save()
+		GoalModel(1, goal_category, dt.datetime(2000, 1, 1), dt.datetime(2100, 1, 1)).save()
+		current_app.config["WORKOUT_ARCHIVE_BATCH_SIZE"] = 2
+		response, response_json = self.upload_archive(api, client, token, self.get_dummy_archive())
+		assert(response_json["numCreated"] == 3)
+		assert(GoalModel.get_by_id(1).current_value == 3)
+
+	def test_upload_archive_parsed_in_request(self, api, client):
+		token,_ = register_and_login_confirmed_user(api, client, "jonny", "jonny@vikan.no", "jonny")
+		current_app.config["WORKOUT_ARCHIVE_PROCESSES"] = 0
+		response, response_json = self.upload_archive(api, client, token, self.get_dummy_archive())
+		assert(response.status_code == 200)
+		assert([result["workoutId"] for result in response_json["files"]] == [1, None, 2, None, 3])
+
+	def test_upload_archive_in_background(self, api, client):
+		token,_ = register_and_login_confirmed_user(api, client, "jonny", "jonny@vikan.no", "jonny")
+		url = api.url_for(ProfileWorkoutArchiveResource, username="jonny", category_id=1)
+		response = client.post(url + "?background=true", data={"archive" : (self.get_dummy_archive(), "export.zip")}, headers=get_authorization_header(token))
+		response_json = get_response_json(response.data)
+		assert(response.status_code == 202)
+		assert(response.headers["Location"].endswith(api.url_for(ProfileWorkoutUploadJobResource, username="jonny", job_id=response_json["id"])))
+		assert(background_jobs.wait(60))
+		job_json = get_response_json(client.get(response.headers["Location"], headers=get_authorization_header(token)).data)
+		assert(job_json["status"] == "completed")
+		assert(job_json["workout"] is None)
+		assert(job_json["archive"]["numCreated"] == 3)
+		assert(job_json["archive"]["numFailed"] == 1)
+		assert([result["workoutId"] for result in job_json["archive"]["files"]] == [1, None, 2, None, 3])
+		assert(not any(filename.endswith(".zip") for filename in os.listdir(current_app.config["GPX_UPLOAD_DIR"])))
+
+	def test_upload_invalid_archive_in_background(self, api, client):
+		token,_ = register_and_login_confirmed_user(api, client, "jonny", "jonny@vikan.no", "jonny")
+		url = api.url_for(ProfileWorkoutArchiveResource, username="jonny", category_id=1)
+		response = client.post(url + "?background=true", data={"archive" : (io.BytesIO(b"abcdefghijklmnop"), "export.zip")}, headers=get_authorization_header(token))
+		assert(response.status_code == 202)
+		assert(background_jobs.wait(30))
+		job_json = get_response_json(client.get(response.headers["Location"], headers=get_authorization_header(token)).data)
+		assert(job_json["status"] == "failed")
+		assert(job_json["message"] == "Workout archive could not be read.")
+		assert(job_json["archive"] is None)
+		assert(not any(filename.startswith("jonny_") for filename in os.listdir(current_app.config["GPX_UPLOAD_DIR"])))
+
+	def test_upload_archive_with_too_large_file(self, api, client):
+		token,_ = register_and_login_confirmed_user(api, client, "jonny", "jonny@vikan.no", "jonny")
+		current_app.config["WORKOUT_ARCHIVE_MAX_FILE_BYTES"] = 1024
+		response, response_json = self.upload_archive(api, client, token, self.get_dummy_archive())
+		assert(response_json["numCreated"] == 1) # the gpx file
+		assert(response_json["files"][4]["status"] == "skipped")
+		assert(response_json["files"][4]["message"] == "Workout file too large.")
+
+	def test_upload_archive_with_too_many_files(self, api, client):
+		token,_ = register_and_login_confirmed_user(api, client, "jonny", "jonny@vikan.no", "jonny")
+		current_app.config["WORKOUT_ARCHIVE_MAX_FILES"] = 2
+		response, response_json = self.upload_archive(api, client, token, self.get_dummy_archive())
+		assert(response_json["numCreated"] == 2)
+		assert(response_json["files"][4]["message"] == "Too many files in archive.")
+
+	def test_upload_invalid_archive(self, api, client):
+		token,_ = register_and_login_confirmed_user(api, client, "jonny", "jonny@vikan.no", "jonny")
+		response, response_json = self.upload_archive(api, client, token, io.BytesIO(b"abcdefghijklmnop"))
+		assert(response.status_code == 422)
+		assert(response_json["errors"]["workout"][0] == "Workout archive could not be read.")
+		assert(not any(filename.startswith("jonny_") for filename in os.listdir(current_app.config["GPX_UPLOAD_DIR"])))
+
+	def test_upload_archive_invalid_filename(self, api, client):
+		token,_ = register_and_login_confirmed_user(api, client, "jonny", "jonny@vikan.no", "jonny")
+		response, response_json = self.upload_archive(api, client, token, self.get_dummy_archive(), "export.tar")
+		assert(response.status_code == 422)
+		assert(response_json["errors"]["workout"][0] == "Workout archive filename invalid.")
+
+	def test_upload_archive_with_no_file(self, api, client):
+		token,_ = register_and_login_confirmed_user(api, client, "jonny", "jonny@vikan.no", "jonny")
+		url = api.url_for(ProfileWorkoutArchiveResource, username="jonny", category_id=1)
+		response = client.post(url, headers=get_authorization_header(token))
+		response_json = get_response_json(response.data)
+		assert(response.status_code == 422)
+		assert(response_json["errors"]["workout"][0] == "Workout archive not provided.")
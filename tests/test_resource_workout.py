@@ -37,3 +37,22 @@ class TestWorkoutCategoryListResource:
 		assert(response_json[1]["name"] == "Hiking")
 		assert(response_json[2]["name"] == "Running")
 
+	def test_get_workout_categories_cacheable(self, api, client):
+		url = api.url_for(WorkoutCategoryListResource)
+		response = client.get(url)
+		assert(response.headers["Cache-Control"] == "public, max-age=3600")
+		assert(response.headers["ETag"] is not None)
+		not_modified_response = client.get(url, headers={"If-None-Match": response.headers["ETag"]})
+		assert(not_modified_response.status_code == 304)
+		assert(not_modified_response.data == b"")
+		assert(not_modified_response.headers["ETag"] == response.headers["ETag"])
+		assert("Accept-Encoding" in not_modified_response.headers["Vary"]) # as the 200 it stands for
+
+	def test_get_workout_categories_changed(self, api, client):
+		url = api.url_for(WorkoutCategoryListResource)
+		etag = client.get(url).headers["ETag"]
+		WorkoutCategoryModel('Swimming', False).save()
+		response = client.get(url, headers={"If-None-Match": etag})
+		assert(response.status_code == 200)
+		assert(response.headers["ETag"] != etag)
+
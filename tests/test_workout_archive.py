@@ -0,0 +1,55 @@
+import os
+import time
+import shutil
+import pytest
+from run4it.api.workout.archive import parse_workout_file_summaries, get_archive_pool_context
+from run4it.api.workout.store import get_track_store_path
+
+
+class TestWorkoutArchive:
+	def copy_test_files(self, tmpdir, names):
+		filepaths = []
+		for num, name in enumerate(names):
+			filepath = os.path.join(str(tmpdir), "{0}_{1}".format(num, name))
+			shutil.copy2(os.path.join(os.path.dirname(__file__), "..", name), filepath)
+			filepaths.append(filepath)
+		return filepaths
+
+	def test_pool_is_not_forked(self):
+		assert(get_archive_pool_context().get_start_method() in ["forkserver", "spawn"])
+
+	def test_summaries_in_order_without_processes(self, tmpdir):
+		filepaths = self.copy_test_files(tmpdir, ["test.gpx", "test_garmin.fit", "test.tcx"])
+		summaries = list(parse_workout_file_summaries(iter(filepaths), 0))
+		assert([filepath for filepath, _ in summaries] == filepaths)
+		assert(all(summary.distance > 0 for _, summary in summaries))
+
+	def test_summaries_of_all_files(self, tmpdir):
+		filepaths = self.copy_test_files(tmpdir, ["test.gpx", "test_garmin.fit", "test.tcx", "test_garmin.gpx"])
+		with open(filepaths[1], "wb") as invalid_file:
+			invalid_file.write(b"abcdefghijklmnop")
+		summaries = dict(parse_workout_file_summaries(iter(filepaths), 2))
+		assert(sorted(summaries.keys()) == sorted(filepaths))
+		assert(summaries[filepaths[1]] is None)
+		assert(summaries[filepaths[0]].distance > 0)
+
+	def test_summary_yielded_before_all_files_are_extracted(self, tmpdir):
+		filepaths = self.copy_test_files(tmpdir, ["test_garmin.fit", "test.gpx"])
+		extracted = []
+
+		def extract_files():
+			extracted.append(filepaths[0])
+			yield filepaths[0]
+			timeout = time.time() + 30
+			while not os.path.isfile(get_track_store_path(filepaths[0])) and time.time() < timeout: # parsed by a worker
+				time.sleep(0.05)
+			time.sleep(0.5)
+			extracted.append(filepaths[1])
+			yield filepaths[1]
+			extracted.append(None) # all extracted
+
+		summaries = parse_workout_file_summaries(extract_files(), 1)
+		filepath, summary = next(summaries)
+		assert(filepath == filepaths[0] and summary is not None)
+		assert(extracted == filepaths) # yielded while the archive is extracted, not after
+		assert(next(summaries)[0] == filepaths[1])
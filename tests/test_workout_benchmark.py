@@ -0,0 +1,127 @@
+import os
+import pytest
+import tracemalloc
+from run4it.api.workout.benchmark import (read_track_points, write_synthetic_track, run_benchmarks, compare_to_baseline,
+	read_baseline, write_baseline, memory_benchmark_file, distance_benchmark_file, serialization_benchmark_file, BENCHMARK_STAGES,
+	BENCHMARK_SERIALIZATION_STAGES, BENCHMARK_DETAIL_STAGES, BENCHMARK_MIN_REGRESSION_BYTES)
+from run4it.api.workout.gpx import GpxParser
+from run4it.api.workout.fit import FitParser
+from run4it.app.commands import benchmark
+from run4it.api.workout.track import track_distance
+
+PROJECT_ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+
+def get_result(points, seconds):
+	return { 'points': points, 'stages': { stage: { 'seconds': seconds, 'pointsPerSecond': points / seconds } for stage in BENCHMARK_STAGES } }
+
+
+class TestWorkoutBenchmark:
+	def test_read_track_points_before_trim(self):
+		points = read_track_points(os.path.join(PROJECT_ROOT, "test.gpx"))
+		parser = GpxParser(os.path.join(PROJECT_ROOT, "test.gpx"))
+		assert(len(points) >= len(parser.gpx_data[0]))
+		assert(len(points.strip_no_movement()) == len(parser.get_track_data(1)[0]))
+
+	def test_synthetic_tracks_are_the_same_in_each_format(self, tmpdir):
+		num_points = []
+		for extension in ["gpx", "tcx", "fit"]:
+			filepath = os.path.join(str(tmpdir), "synthetic." + extension)
+			write_synthetic_track(filepath, 1000)
+			points = read_track_points(filepath)
+			num_points.append((len(points), len(points.strip_no_movement())))
+		assert(num_points[0] == num_points[1] == num_points[2])
+		assert(num_points[0][0] == 1000)
+		assert(num_points[0][1] < 1000) # standing still at the ends
+
+	def test_synthetic_fit_is_parsed(self, tmpdir):
+		filepath = os.path.join(str(tmpdir), "synthetic.fit")
+		write_synthetic_track(filepath, 2000)
+		track_data, split_data, summary = FitParser(filepath).get_track_data()
+		assert(len(track_data) > 1900)
+		assert(len(split_data) > 4)
+		assert(summary.heart_bpm > 0)
+		assert(abs(summary.latitude - 63.43049) < 0.001)
+
+	def test_run_benchmarks(self, tmpdir):
+		results = run_benchmarks(PROJECT_ROOT, str(tmpdir), 1, 500)
+		assert(sorted(results.keys()) == sorted(["test.gpx", "test_garmin.gpx", "test.tcx", "test_garmin.tcx", "test_garmin.fit", "test_polar.fit",
+			"synthetic_500.gpx", "synthetic_500.tcx", "synthetic_500.fit"]))
+		assert(results["synthetic_500.fit"]["points"] == 500)
+		assert(all(results["test.gpx"]["stages"][stage]["pointsPerSecond"] > 0 for stage in BENCHMARK_STAGES))
+
+	def test_compare_to_baseline(self):
+		baseline = { "a.gpx": get_result(1000, 0.1), "b.fit": get_result(1000, 0.001), "c.tcx": get_result(1000, 0.1) }
+		results = { "a.gpx": get_result(1000, 0.15), "b.fit": get_result(1000, 0.002), "c.tcx": get_result(2000, 0.2), "d.gpx": get_result(1000, 1.0) }
+		regressions = compare_to_baseline(results, baseline, 0.25)
+		assert(sorted(set(case_name for case_name, _, _, _ in regressions)) == ["a.gpx"]) # b.fit is within timer noise, c.tcx is another track
+		assert(len(regressions) == len(BENCHMARK_STAGES))
+		assert(compare_to_baseline(results, baseline, 0.6) == [])
+
+	def test_baseline_roundtrip(self, tmpdir):
+		filepath = os.path.join(str(tmpdir), "baseline.json")
+		assert(read_baseline(filepath) is None)
+		write_baseline(filepath, { "a.gpx": get_result(1000, 0.1) })
+		assert(read_baseline(filepath) == { "a.gpx": get_result(1000, 0.1) })
+
+	def test_benchmark_command(self, app, tmpdir):
+		baseline_path = os.path.join(str(tmpdir), "baseline.json")
+		runner = app.test_cli_runner()
+		result = runner.invoke(benchmark, ["--baseline", baseline_path, "--repeat", "1", "--synthetic-points", "200", "--save-baseline"])
+		assert(result.exit_code == 0)
+		assert(os.path.isfile(baseline_path))
+		result = runner.invoke(benchmark, ["--baseline", baseline_path, "--repeat", "1", "--synthetic-points", "200", "--threshold", "1000"])
+		assert(result.exit_code == 0)
+		assert("0 regression(s)" in result.output)
+		assert("synthetic_200.fit" in result.output)
+
+	def test_memory_benchmark_file(self, app, tmpdir):
+		result = memory_benchmark_file(os.path.join(PROJECT_ROOT, "test_garmin.fit"), str(tmpdir))
+		assert(result["points"] > 0)
+		assert(list(result["stages"].keys()) == list(BENCHMARK_STAGES + BENCHMARK_DETAIL_STAGES))
+		assert(all(result["stages"][stage]["peakBytes"] >= result["stages"][stage]["retainedBytes"] for stage in result["stages"]))
+		assert(result["stages"]["load"]["peakBytes"] > result["stages"]["reload"]["peakBytes"]) # parsing takes more than reading the stored track
+		assert(os.path.isfile(os.path.join(str(tmpdir), "detail_test_garmin.fit.trk")))
+		assert(not tracemalloc.is_tracing())
+
+	def test_compare_memory_to_baseline(self):
+		baseline = { "a.gpx": { 'points': 10, 'stages': { 'parse': { 'peakBytes': 1000000, 'retainedBytes': 0 }, 'load': { 'peakBytes': 1000, 'retainedBytes': 0 } } } }
+		results = { "a.gpx": { 'points': 10, 'stages': { 'parse': { 'peakBytes': 2000000, 'retainedBytes': 0 }, 'load': { 'peakBytes': 2000, 'retainedBytes': 0 } } } }
+		assert(compare_to_baseline(results, baseline, 0.25, BENCHMARK_MIN_REGRESSION_BYTES, 'peakBytes') == [("a.gpx", "parse", 1000000, 2000000)])
+
+	def test_memory_benchmark_command(self, app, tmpdir):
+		baseline_path = os.path.join(str(tmpdir), "baseline.json")
+		runner = app.test_cli_runner()
+		result = runner.invoke(benchmark, ["--memory", "--baseline", baseline_path, "--synthetic-points", "200", "--save-baseline"])
+		assert(result.exit_code == 0)
+		assert("peak/retained KiB" in result.output)
+		assert(os.path.isfile(baseline_path))
+
+	def test_distance_benchmark_file(self, app):
+		result = distance_benchmark_file(os.path.join(PROJECT_ROOT, "test_garmin.gpx"), 1)
+		assert(sorted(result["models"].keys()) == ["flat", "geodesic", "haversine"])
+		assert(result["models"]["geodesic"]["maxErrorM"] == 0.0 and result["models"]["geodesic"]["distanceErrorM"] == 0.0)
+		assert(result["models"]["flat"]["maxErrorM"] < 0.001)
+		assert(result["models"]["haversine"]["maxErrorM"] > result["models"]["flat"]["maxErrorM"])
+		assert(track_distance.model == "geodesic")
+
+	def test_distance_benchmark_command(self, app):
+		result = app.test_cli_runner().invoke(benchmark, ["--distance-models", "--repeat", "1", "--synthetic-points", "0"])
+		assert(result.exit_code == 0)
+		assert("test_polar.fit" in result.output and "haversine" in result.output)
+
+	def test_serialization_benchmark_file(self, app):
+		result = serialization_benchmark_file(os.path.join(PROJECT_ROOT, "test_polar.fit"), 1)
+		assert(result["points"] > 0)
+		assert(list(result["stages"].keys()) == list(BENCHMARK_SERIALIZATION_STAGES))
+		assert(result["sameOutput"])
+
+	def test_serialization_benchmark_command(self, app, tmpdir):
+		baseline_path = os.path.join(str(tmpdir), "baseline.json")
+		runner = app.test_cli_runner()
+		result = runner.invoke(benchmark, ["--serialization", "--baseline", baseline_path, "--repeat", "1", "--synthetic-points", "200", "--save-baseline"])
+		assert(result.exit_code == 0)
+		assert("us/pt" in result.output and "same output" in result.output)
+		result = runner.invoke(benchmark, ["--serialization", "--baseline", baseline_path, "--repeat", "1", "--synthetic-points", "200", "--threshold", "1000"])
+		assert(result.exit_code == 0)
+		assert("0 regression(s)" in result.output)
@@ -0,0 +1,90 @@
+import os
+import shutil
+import pytest
+import datetime as dt
+from flask import current_app
+from run4it.api.workout import WorkoutModel, WorkoutCategoryModel
+from run4it.api.workout.bulk import find_workout_files
+from run4it.api.goal import GoalCategoryModel, GoalModel
+from run4it.api.scripts import ScriptModel, script_import_workout_directory
+from .helpers import register_confirmed_user
+
+PROJECT_ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+
+@pytest.mark.usefixtures('db')
+class TestWorkoutDirectoryImport:
+	def setup(self):
+		WorkoutCategoryModel('Running', True).save()
+		register_confirmed_user("jonny", "jonny@vikan.no", "jonny")
+
+	def teardown(self):
+		upload_dir = current_app.config["GPX_UPLOAD_DIR"]
+		for filename in os.listdir(upload_dir):
+			if filename.startswith("jonny_import_"):
+				os.remove(os.path.join(upload_dir, filename))
+
+	def create_workout_directory(self, directory):
+		os.makedirs(os.path.join(str(directory), "2019", ".hidden"))
+		os.makedirs(os.path.join(str(directory), "2020"))
+		shutil.copyfile(os.path.join(PROJECT_ROOT, "test.gpx"), os.path.join(str(directory), "2019", "a.gpx"))
+		shutil.copyfile(os.path.join(PROJECT_ROOT, "test.gpx"), os.path.join(str(directory), "2019", ".hidden", "b.gpx"))
+		shutil.copyfile(os.path.join(PROJECT_ROOT, "test.tcx"), os.path.join(str(directory), "2020", "b.TCX"))
+		shutil.copyfile(os.path.join(PROJECT_ROOT, "test_garmin.fit"), os.path.join(str(directory), "c.fit"))
+		with open(os.path.join(str(directory), "2020", "invalid.fit"), "wb") as invalid_file:
+			invalid_file.write(b"abcdefghijklmnop")
+		with open(os.path.join(str(directory), "readme.txt"), "w") as text_file:
+			text_file.write("Exported workouts")
+		return str(directory)
+
+	def test_find_workout_files(self, tmpdir):
+		directory = self.create_workout_directory(tmpdir)
+		assert(find_workout_files(directory, current_app.config["ALLOWED_UPLOAD_EXTENSIONS"]) == ["2019/a.gpx", "2020/b.TCX", "2020/invalid.fit", "c.fit"])
+
+	def test_import_directory(self, tmpdir):
+		directory = self.create_workout_directory(tmpdir)
+		goal_category = GoalCategoryModel("Number of workouts", "#", 1)
+		goal_category.save()
+		GoalModel(1, goal_category, dt.datetime(2000, 1, 1), dt.datetime(2100, 1, 1)).save()
+		assert(script_import_workout_directory("workout_import", "jonny", directory, "Running", 2, 2) == 0)
+		workouts = WorkoutModel.query.order_by(WorkoutModel.id.asc()).all()
+		assert(len(workouts) == 3)
+		assert([os.path.splitext(workout.resource_path)[1] for workout in workouts] == [".gpx", ".tcx", ".fit"])
+		assert(all(workout.name == "Running" and workout.name_pending for workout in workouts))
+		assert(workouts[0].distance > 0)
+		assert(workouts[0].start_latitude is not None)
+		assert(all(os.path.isfile(workout.resource_path + ".trk") for workout in workouts))
+		assert(GoalModel.get_by_id(1).current_value == 3)
+		assert(ScriptModel.find_by_name("workout_import").checkpoint is None)
+
+	def test_import_directory_in_one_process(self, tmpdir):
+		directory = self.create_workout_directory(tmpdir)
+		assert(script_import_workout_directory("workout_import", "jonny", directory, "Running", 0) == 0)
+		assert(WorkoutModel.query.count() == 3)
+
+	def test_import_directory_resumes_from_checkpoint(self, tmpdir):
+		directory = self.create_workout_directory(tmpdir)
+		script_entry = ScriptModel("workout_import")
+		script_entry.set_checkpoint({ 'directory': os.path.abspath(directory), 'profileId': 1, 'categoryId': 1, 'importId': "abc",
+			'nextFile': 2, 'numImported': 2, 'numFailed': 0 })
+		script_entry.save()
+		assert(script_import_workout_directory("workout_import", "jonny", directory, "Running", 0) == 0)
+		workouts = WorkoutModel.query.all()
+		assert(len(workouts) == 1)
+		assert(os.path.basename(workouts[0].resource_path) == "jonny_import_abc_3.fit")
+		assert(ScriptModel.find_by_name("workout_import").checkpoint is None)
+
+	def test_import_of_another_directory_is_not_resumed(self, tmpdir):
+		directory = self.create_workout_directory(tmpdir)
+		script_entry = ScriptModel("workout_import")
+		script_entry.set_checkpoint({ 'directory': "/another/directory", 'profileId': 1, 'categoryId': 1, 'importId': "abc",
+			'nextFile': 2, 'numImported': 2, 'numFailed': 0 })
+		script_entry.save()
+		assert(script_import_workout_directory("workout_import", "jonny", directory, "Running", 0) == 1)
+		assert(WorkoutModel.query.count() == 0)
+		assert(script_import_workout_directory("workout_import", "jonny", directory, "Running", 0, restart=True) == 0)
+		assert(WorkoutModel.query.count() == 3)
+
+	def test_import_for_unknown_profile(self, tmpdir):
+		directory = self.create_workout_directory(tmpdir)
+		assert(script_import_workout_directory("workout_import", "unknown", directory, "Running", 0) == 1)
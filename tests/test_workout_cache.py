@@ -0,0 +1,79 @@
+import os
+import pytest
+from run4it.api.workout.cache import TrackCache, TRACK_CACHE_ENTRY_OVERHEAD_BYTES
+from run4it.api.workout.model import parse_workout_file, load_workout_laps
+
+
+class TestTrackCache:
+	def setup(self):
+		self.parsed_files = []
+
+	def parse_file(self, filepath):
+		self.parsed_files.append(filepath)
+		return None, None, None
+
+	def create_file(self, tmpdir, name, content="abc"):
+		workout_file = tmpdir.join(name)
+		workout_file.write(content)
+		return str(workout_file)
+
+	def test_repeated_get_is_cached(self, tmpdir):
+		cache = TrackCache()
+		filepath = self.create_file(tmpdir, "a.gpx")
+		cache.get(filepath, self.parse_file)
+		cache.get(filepath, self.parse_file)
+		stats = cache.get_stats()
+		assert(len(self.parsed_files) == 1)
+		assert(stats["hits"] == 1)
+		assert(stats["misses"] == 1)
+		assert(stats["entries"] == 1)
+
+	def test_changed_file_is_parsed_again(self, tmpdir):
+		cache = TrackCache()
+		filepath = self.create_file(tmpdir, "a.gpx")
+		cache.get(filepath, self.parse_file)
+		with open(filepath, "w") as workout_file:
+			workout_file.write("abcdef")
+		cache.get(filepath, self.parse_file)
+		assert(len(self.parsed_files) == 2)
+		assert(cache.get_stats()["entries"] == 1) # old version is dropped
+
+	def test_least_recently_used_is_evicted(self, tmpdir):
+		cache = TrackCache(2 * TRACK_CACHE_ENTRY_OVERHEAD_BYTES)
+		filepath_a = self.create_file(tmpdir, "a.gpx")
+		filepath_b = self.create_file(tmpdir, "b.gpx")
+		filepath_c = self.create_file(tmpdir, "c.gpx")
+		cache.get(filepath_a, self.parse_file)
+		cache.get(filepath_b, self.parse_file)
+		cache.get(filepath_a, self.parse_file)
+		cache.get(filepath_c, self.parse_file) # evicts b
+		cache.get(filepath_a, self.parse_file)
+		stats = cache.get_stats()
+		assert(stats["evictions"] == 1)
+		assert(stats["bytes"] == 2 * TRACK_CACHE_ENTRY_OVERHEAD_BYTES)
+		assert(self.parsed_files == [filepath_a, filepath_b, filepath_c])
+		cache.get(filepath_b, self.parse_file)
+		assert(self.parsed_files[-1] == filepath_b)
+
+	def test_missing_file_is_not_cached(self, tmpdir):
+		cache = TrackCache()
+		filepath = os.path.join(str(tmpdir), "missing.gpx")
+		assert(cache.get(filepath, self.parse_file) == (None, None, None))
+		cache.get(filepath, self.parse_file)
+		assert(len(self.parsed_files) == 2)
+		assert(cache.get_stats()["entries"] == 0)
+
+	def test_parsed_track_is_cached(self):
+		cache = TrackCache()
+		filepath = os.path.join(os.path.dirname(__file__), "..", "test_garmin.fit")
+		track_data, split_data, summary = cache.get(filepath, parse_workout_file)
+		assert(cache.get(filepath, parse_workout_file)[0] is track_data)
+		assert(len(track_data) == 272)
+		assert(cache.get_stats()["bytes"] == TRACK_CACHE_ENTRY_OVERHEAD_BYTES + track_data.nbytes + split_data.nbytes)
+
+	def test_laps_are_cached_by_variant(self):
+		cache = TrackCache()
+		filepath = os.path.join(os.path.dirname(__file__), "..", "test_garmin.fit")
+		laps = cache.get(filepath, load_workout_laps, "laps")
+		assert(cache.get(filepath, load_workout_laps, "laps") is laps)
+		assert(cache.get_stats()["bytes"] == TRACK_CACHE_ENTRY_OVERHEAD_BYTES + laps.nbytes)
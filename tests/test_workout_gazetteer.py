@@ -0,0 +1,102 @@
+import os
+import pytest
+import numpy as np
+from flask import current_app
+from run4it.api.workout.gazetteer import (Gazetteer, gazetteer, read_places, build_gazetteer_index, write_gazetteer_index,
+	get_unit_vectors)
+from run4it.api.workout.gmaps import GeoCodeLookup
+
+
+PLACES_CSV = """name,type,latitude,longitude
+Trondheim,PPLA,63.43049,10.39506
+Stjørdal,PPLA2,63.46953,10.91795
+Melhus,PPLA2,63.28506,10.27817
+Oslo,PPLC,59.91273,10.74609
+"""
+
+GEONAMES_TXT = ("3133880\tTrondheim\tTrondheim\tTrondhjem\t63.43049\t10.39506\tP\tPPLA\tNO\t\t21\t\t\t\t147139\t\t15\tEurope/Oslo\t2019-09-05\n"
+	"3137115\tOslofjorden\tOslofjorden\t\t59.5\t10.6\tH\tFJD\tNO\t\t00\t\t\t\t0\t\t-9999\tEurope/Oslo\t2012-01-18\n")
+
+
+class TestGazetteer:
+	def write_places(self, tmpdir, name="places.csv", content=PLACES_CSV):
+		filepath = os.path.join(str(tmpdir), name)
+		with open(filepath, "w", encoding="utf-8") as places_file:
+			places_file.write(content)
+		return filepath
+
+	def test_read_csv_places(self, tmpdir):
+		names, types, latitudes, longitudes = read_places(self.write_places(tmpdir))
+		assert(names == ["Trondheim", "Stjørdal", "Melhus", "Oslo"])
+		assert(types[0] == "PPLA")
+		assert(latitudes[3] == 59.91273)
+		assert(longitudes[3] == 10.74609)
+
+	def test_read_geonames_populated_places(self, tmpdir):
+		names, types, latitudes, longitudes = read_places(self.write_places(tmpdir, "NO.txt", GEONAMES_TXT))
+		assert(names == ["Trondheim"])
+		assert(types == ["PPLA"])
+		assert(latitudes == [63.43049])
+
+	def test_nearest_place(self, tmpdir):
+		places = Gazetteer()
+		places.load(self.write_places(tmpdir))
+		assert(places.get_name_of_place(63.42, 10.40) == "Trondheim")
+		assert(places.get_name_of_place(63.45, 10.90) == "Stjørdal")
+		name, place_type, distance_km = places.find_nearest(63.30, 10.28)
+		assert(name == "Melhus")
+		assert(place_type == "PPLA2")
+		assert(1.0 < distance_km < 2.0)
+
+	def test_no_place_in_range(self, tmpdir):
+		places = Gazetteer(max_distance_km=25.0)
+		places.load(self.write_places(tmpdir))
+		assert(places.get_name_of_place(61.0, 10.0) is None)
+
+	def test_not_loaded(self):
+		assert(Gazetteer().get_name_of_place(63.42, 10.40) is None)
+
+	def test_prebuilt_index_is_memory_mapped(self, tmpdir):
+		index_filepath = os.path.join(str(tmpdir), "places.npy")
+		assert(write_gazetteer_index(self.write_places(tmpdir), index_filepath) == 4)
+		places = Gazetteer()
+		places.load(index_filepath)
+		assert(isinstance(places.index, np.memmap))
+		assert(places.get_name_of_place(59.9, 10.7) == "Oslo")
+
+	def test_index_must_be_npy(self, tmpdir):
+		with pytest.raises(ValueError):
+			write_gazetteer_index(self.write_places(tmpdir), os.path.join(str(tmpdir), "places.idx"))
+
+	def test_nearest_equals_brute_force(self):
+		random = np.random.RandomState(42)
+		latitudes = np.degrees(np.arcsin(random.uniform(-1.0, 1.0, 5000)))
+		longitudes = random.uniform(-180.0, 180.0, 5000)
+		places = Gazetteer(max_distance_km=20000.0)
+		places.set_index(build_gazetteer_index([str(i) for i in range(5000)], ["PPL"] * 5000, latitudes, longitudes))
+		points = get_unit_vectors(latitudes, longitudes)
+		for latitude, longitude in zip(random.uniform(-90.0, 90.0, 200), random.uniform(-180.0, 180.0, 200)):
+			expected = np.argmin(np.sum((points - get_unit_vectors([latitude], [longitude])[0])**2, axis=1))
+			assert(places.get_name_of_place(latitude, longitude) == str(expected))
+
+
+@pytest.mark.usefixtures('db')
+class TestOfflineGeoCodeLookup:
+	def setup(self):
+		gazetteer.set_index(build_gazetteer_index(["Trondheim"], ["PPLA"], [63.43049], [10.39506]))
+
+	def teardown(self):
+		gazetteer.index = None
+		gazetteer.points = None
+
+	def test_offline_lookup(self):
+		current_app.config["GEOCODE_PROVIDER"] = "offline"
+		assert(GeoCodeLookup().get_name_of_place(63.42, 10.40) == "Trondheim")
+
+	def test_offline_lookup_without_fallback(self):
+		current_app.config["GEOCODE_PROVIDER"] = "offline"
+		current_app.config["GEOCODE_GOOGLE_FALLBACK"] = False
+		assert(GeoCodeLookup().get_name_of_place(59.9, 10.7) == "")
+
+	def test_google_lookup_does_not_use_gazetteer(self):
+		assert(GeoCodeLookup().get_name_of_place(63.42, 10.40) == "") # no valid Google API key in tests
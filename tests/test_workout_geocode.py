@@ -0,0 +1,72 @@
+import pytest
+import datetime as dt
+from run4it.api.workout import GeoCodeCacheEntryModel
+from run4it.api.workout.gmaps import GeoCodeCache, GeoCodeLookup, get_geohash
+
+
+class TestGeohash:
+	def test_known_geohash(self):
+		assert(get_geohash(57.64911, 10.40744, 11) == "u4pruydqqvj")
+		assert(get_geohash(-25.382708, -49.265506, 8) == "6gkzwgjz")
+
+	def test_precision(self):
+		assert(get_geohash(63.43049, 10.39506, 6) == get_geohash(63.43049, 10.39506, 9)[:6])
+
+	def test_nearby_positions_share_cell(self):
+		assert(get_geohash(63.43049, 10.39506, 6) == get_geohash(63.43100, 10.39600, 6))
+		assert(get_geohash(63.43049, 10.39506, 6) != get_geohash(63.46049, 10.39506, 6))
+
+
+@pytest.mark.usefixtures('db')
+class TestGeoCodeCache:
+	def setup(self):
+		self.lookups = []
+
+	def lookup(self, latitude, longitude):
+		self.lookups.append((latitude, longitude))
+		return "Trondheim"
+
+	def failed_lookup(self, latitude, longitude):
+		self.lookups.append((latitude, longitude))
+		return None
+
+	def test_lookup_is_cached(self):
+		cache = GeoCodeCache()
+		assert(cache.get_name_of_place(63.43049, 10.39506, self.lookup) == "Trondheim")
+		assert(cache.get_name_of_place(63.43100, 10.39600, self.lookup) == "Trondheim")
+		assert(len(self.lookups) == 1)
+		assert(GeoCodeCacheEntryModel.find_by_geohash(get_geohash(63.43049, 10.39506, 6)).place_name == "Trondheim")
+		assert(cache.get_stats() == { "precision": 6, "hits": 1, "misses": 1, "hitRate": 0.5 })
+
+	def test_cache_is_persistent(self):
+		GeoCodeCache().get_name_of_place(63.43049, 10.39506, self.lookup)
+		assert(GeoCodeCache().get_name_of_place(63.43049, 10.39506, self.failed_lookup) == "Trondheim")
+		assert(len(self.lookups) == 1)
+
+	def test_expired_entry_is_looked_up(self):
+		cache = GeoCodeCache()
+		GeoCodeCacheEntryModel(get_geohash(63.43049, 10.39506, 6), "Nidaros", dt.datetime.utcnow() - dt.timedelta(days=1)).save()
+		assert(cache.get_name_of_place(63.43049, 10.39506, self.lookup) == "Trondheim")
+		entry = GeoCodeCacheEntryModel.find_by_geohash(get_geohash(63.43049, 10.39506, 6))
+		assert(entry.place_name == "Trondheim")
+		assert(entry.expires_at > dt.datetime.utcnow() + dt.timedelta(days=179))
+
+	def test_expired_entry_is_used_if_lookup_fails(self):
+		cache = GeoCodeCache()
+		GeoCodeCacheEntryModel(get_geohash(63.43049, 10.39506, 6), "Nidaros", dt.datetime.utcnow() - dt.timedelta(days=1)).save()
+		assert(cache.get_name_of_place(63.43049, 10.39506, self.failed_lookup) == "Nidaros")
+
+	def test_failed_lookup_is_not_cached(self):
+		cache = GeoCodeCache()
+		assert(cache.get_name_of_place(63.43049, 10.39506, self.failed_lookup) is None)
+		assert(GeoCodeCacheEntryModel.find_by_geohash(get_geohash(63.43049, 10.39506, 6)) is None)
+
+	def test_place_without_name_is_cached(self):
+		cache = GeoCodeCache()
+		assert(cache.get_name_of_place(0.0, 0.0, lambda latitude, longitude: "") == "")
+		assert(cache.get_name_of_place(0.0, 0.0, self.lookup) == "")
+		assert(len(self.lookups) == 0)
+
+	def test_lookup_without_position(self):
+		assert(GeoCodeLookup().get_name_of_place(float("nan"), 10.39506) == "")
+		assert(GeoCodeLookup().get_name_of_place(None, None) == "")
@@ -0,0 +1,101 @@
+import pytest
+import datetime as dt
+from flask import current_app
+from run4it.api.workout import WorkoutModel, WorkoutCategoryModel, GeoCodeCacheEntryModel
+from run4it.api.workout.resource import name_pending_workouts
+from run4it.api.scripts.script import _name_all_pending_workouts
+from run4it.api.workout.gmaps import geocode_cache, get_geohash
+from run4it.api.workout.gazetteer import gazetteer, build_gazetteer_index
+
+
+@pytest.mark.usefixtures('db')
+class TestWorkoutNaming:
+	def setup(self):
+		self.category = WorkoutCategoryModel('Running', True)
+		self.category.save()
+
+	def teardown(self):
+		gazetteer.index = None
+		gazetteer.points = None
+
+	def create_pending_workout(self, latitude, longitude):
+		workout = WorkoutModel(1, self.category, "", dt.datetime.utcnow(), 1000, 300, 0, None, False)
+		workout.set_pending_name(latitude, longitude)
+		workout.save()
+		return workout
+
+	def use_gazetteer(self):
+		current_app.config["GEOCODE_PROVIDER"] = "offline"
+		current_app.config["GEOCODE_GOOGLE_FALLBACK"] = False
+		gazetteer.set_index(build_gazetteer_index(["Trondheim", "Oslo"], ["PPLA", "PPLC"], [63.43049, 59.91273], [10.39506, 10.74609]))
+
+	def test_pending_name_is_category_name(self):
+		workout = self.create_pending_workout(63.43, 10.39)
+		assert(workout.name == "Running")
+		assert(workout.name_pending)
+
+	def test_pending_names_are_looked_up(self):
+		self.use_gazetteer()
+		self.create_pending_workout(63.43, 10.39)
+		self.create_pending_workout(59.91, 10.75)
+		assert(name_pending_workouts() == 2)
+		assert(WorkoutModel.get_by_id(1).name == "Trondheim Running")
+		assert(WorkoutModel.get_by_id(2).name == "Oslo Running")
+		assert(not WorkoutModel.get_by_id(1).name_pending)
+		assert(name_pending_workouts() == 0)
+
+	def test_workout_without_position_keeps_category_name(self):
+		self.use_gazetteer()
+		self.create_pending_workout(float("nan"), float("nan"))
+		assert(name_pending_workouts() == 1)
+		assert(WorkoutModel.get_by_id(1).name == "Running")
+		assert(not WorkoutModel.get_by_id(1).name_pending)
+
+	def test_workout_renamed_by_user_is_untouched(self):
+		self.use_gazetteer()
+		workout = self.create_pending_workout(63.43, 10.39)
+		workout.name = "Morning run"
+		workout.save()
+		assert(name_pending_workouts() == 0)
+		assert(WorkoutModel.get_by_id(1).name == "Morning run")
+		assert(not WorkoutModel.get_by_id(1).name_pending) # not in the next batches
+
+	def test_workout_moved_to_another_category_is_untouched(self):
+		self.use_gazetteer()
+		workout = self.create_pending_workout(63.43, 10.39)
+		workout.category = WorkoutCategoryModel('Hiking', True)
+		workout.save()
+		assert(name_pending_workouts() == 0)
+		assert(WorkoutModel.get_by_id(1).name == "Running")
+		assert(not WorkoutModel.get_by_id(1).name_pending)
+
+	def test_nearby_workouts_are_looked_up_once(self):
+		GeoCodeCacheEntryModel(get_geohash(63.43, 10.39, geocode_cache.precision), "Trondheim", dt.datetime.utcnow() + dt.timedelta(days=1)).save()
+		self.create_pending_workout(63.43, 10.39)
+		self.create_pending_workout(63.4301, 10.3901)
+		geocode_cache.reset_stats()
+		assert(name_pending_workouts() == 2)
+		assert(geocode_cache.get_stats()["hits"] == 1)
+		assert(WorkoutModel.get_by_id(2).name == "Trondheim Running")
+
+	def test_failed_lookup_stays_pending(self):
+		self.create_pending_workout(63.43, 10.39) # no valid Google API key in tests
+		assert(name_pending_workouts() == 0)
+		assert(WorkoutModel.get_by_id(1).name_pending)
+
+	def test_batch_size(self):
+		self.use_gazetteer()
+		for _ in range(3):
+			self.create_pending_workout(63.43, 10.39)
+		assert(name_pending_workouts(2) == 2)
+		assert(name_pending_workouts(2) == 1)
+
+	def test_name_all_pending_workouts_passes_failed_lookups(self, monkeypatch):
+		GeoCodeCacheEntryModel(get_geohash(63.43, 10.39, geocode_cache.precision), "Trondheim", dt.datetime.utcnow() + dt.timedelta(days=1)).save()
+		monkeypatch.setattr("run4it.api.scripts.script.WORKOUT_NAMING_BATCH_SIZE", 2)
+		for _ in range(2):
+			self.create_pending_workout(59.91, 10.75) # not cached, no valid Google API key in tests
+		self.create_pending_workout(63.43, 10.39)
+		assert(_name_all_pending_workouts() == 1)
+		assert(WorkoutModel.get_by_id(1).name_pending and WorkoutModel.get_by_id(2).name_pending)
+		assert(WorkoutModel.get_by_id(3).name == "Trondheim Running")
@@ -0,0 +1,250 @@
+import os
+import re
+import json
+import shutil
+import struct
+import pytest
+import datetime as dt
+import numpy as np
+from run4it.api.workout.track import TrackPoints, track_distance
+from run4it.api.workout.pipeline import (chunk_points, sanitize_points, trim_no_movement, collect_points,
+	ingest_track, fill_forward)
+from run4it.api.workout.model import parse_workout_file, load_workout_summary, load_workout_laps, Workout, WorkoutCategory
+from run4it.api.workout.schema import workout_schema
+from run4it.api.workout.gpx import GpxParser
+from run4it.api.workout.tcx import TcxParser
+from run4it.api.workout.fit import FitParser, read_fit_summary, read_fit_laps, FIT_EPOCH, FIT_MESG_RECORD, FIT_MESG_SESSION, FIT_MESG_LAP
+
+PROJECT_ROOT = os.path.join(os.path.dirname(__file__), "..")
+START_TIME = dt.datetime(2020, 6, 30, 4, 49, 19)
+
+
+def get_track_points(num_still_start, num_moving, num_still_middle, num_still_end):
+	# moving north at approx. 3.3 m/s with a stop in the middle, one point per second
+	latitudes = [63.0] * num_still_start
+	latitudes += [63.0 + 0.00003 * i for i in range(num_moving)]
+	latitudes += latitudes[-1:] * num_still_middle
+	latitudes += [latitudes[-1] + 0.00003 * i for i in range(1, num_moving)]
+	latitudes += latitudes[-1:] * num_still_end
+	num_points = len(latitudes)
+	times = [START_TIME + dt.timedelta(seconds=i) for i in range(num_points)]
+	return TrackPoints.from_datetimes(times, latitudes, [10.0] * num_points, [100.0 + i for i in range(num_points)], [150] * num_points)
+
+
+def assert_same_points(points, expected):
+	assert(len(points) == len(expected))
+	assert(points.start_time == expected.start_time)
+	for column in ["time_offsets", "latitudes", "longitudes", "elevations", "heart_rates"]:
+		assert(np.array_equal(getattr(points, column), getattr(expected, column)))
+
+
+class TestPipelineTrim:
+	@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 50, 1024])
+	def test_trim_equals_strip_no_movement(self, chunk_size):
+		points = get_track_points(10, 30, 15, 10)
+		trimmed = collect_points(trim_no_movement(points.get_chunks(chunk_size)))
+		assert_same_points(trimmed, points.strip_no_movement())
+		assert(len(trimmed) == len(points) - 10 - 11) # the last moving point is dropped
+
+	@pytest.mark.parametrize("chunk_size", [1, 4, 1024])
+	def test_last_point_kept_if_moving(self, chunk_size):
+		points = get_track_points(5, 20, 0, 0)
+		trimmed = collect_points(trim_no_movement(points.get_chunks(chunk_size)))
+		assert_same_points(trimmed, points.strip_no_movement())
+		assert(len(trimmed) == len(points) - 5)
+
+	@pytest.mark.parametrize("chunk_size", [1, 1024])
+	def test_no_movement_at_all(self, chunk_size):
+		points = get_track_points(20, 1, 0, 20)
+		assert(len(collect_points(trim_no_movement(points.get_chunks(chunk_size)))) == 0)
+
+	def test_leading_points_dropped(self):
+		chunks = list(trim_no_movement(get_track_points(3000, 10, 0, 0).get_chunks(100)))
+		assert(chunks[0].time_offsets[0] == 3000.0) # first point of the first moving pair
+		assert(sum(len(chunk) for chunk in chunks) == 19)
+
+
+class TestPipelineSanitize:
+	def test_elevation_of_previous_point_across_chunks(self):
+		times = [START_TIME + dt.timedelta(seconds=i) for i in range(6)]
+		elevations = [None, None, 120.0, None, None, 125.0]
+		points = zip(times, [63.0] * 6, [10.0] * 6, elevations, [None] * 6)
+		chunks = list(sanitize_points(chunk_points(points, 2)))
+		assert(np.isnan(chunks[0].elevations).all()) # filled when collected
+		assert(chunks[1].elevations.tolist() == [120.0, 120.0])
+		assert(chunks[2].elevations.tolist() == [120.0, 125.0])
+		assert(collect_points(chunks).elevations.tolist() == [120.0, 120.0, 120.0, 120.0, 120.0, 125.0])
+
+	def test_points_without_position_dropped(self):
+		times = [START_TIME + dt.timedelta(seconds=i) for i in range(5)]
+		latitudes = [None, 63.0, None, 63.0001, 63.0002]
+		points = zip(times, latitudes, [10.0] * 5, [100.0] * 5, [140, 141, 142, 143, 144])
+		collected = collect_points(sanitize_points(chunk_points(points, 2)))
+		assert(collected.heart_rates.tolist() == [141, 143, 144])
+		assert(collected.start_time == START_TIME + dt.timedelta(seconds=1))
+		assert(collected.time_offsets.tolist() == [0.0, 2.0, 3.0])
+
+	def test_fill_forward(self):
+		assert(np.isnan(fill_forward(np.array([np.nan, 1.0]))[0]))
+		assert(fill_forward(np.array([np.nan, 1.0, np.nan]), 5.0).tolist() == [5.0, 1.0, 1.0])
+
+
+class TestPipelineIngest:
+	def test_chunks_share_start_time(self):
+		times = [START_TIME + dt.timedelta(seconds=i) for i in range(5)]
+		chunks = list(chunk_points(zip(times, [63.0] * 5, [10.0] * 5, [100.0] * 5, [None] * 5), 2))
+		assert([len(chunk) for chunk in chunks] == [2, 2, 1])
+		assert(all(chunk.start_time == START_TIME for chunk in chunks))
+		assert(chunks[2].time_offsets.tolist() == [4.0])
+
+	def test_nothing_left(self):
+		assert(ingest_track(iter([])) == (None, None, None))
+		assert(ingest_track(get_track_points(20, 1, 0, 20).get_chunks(8)) == (None, None, None))
+
+	def test_ingest_equals_track_data_of_stripped_points(self):
+		points = get_track_points(10, 400, 30, 10)
+		track_data, split_data, summary = ingest_track(points.get_chunks(64))
+		expected_track_data, expected_split_data, expected_summary = points.strip_no_movement().get_track_data()
+		assert(np.array_equal(track_data.distances, expected_track_data.distances))
+		assert(np.array_equal(split_data.durations, expected_split_data.durations))
+		assert(summary.__dict__ == expected_summary.__dict__)
+
+	@pytest.mark.parametrize("filename", ["test.gpx", "test_garmin.gpx", "test.tcx", "test_garmin.tcx", "test_garmin.fit", "test_polar.fit"])
+	def test_workout_file_equals_parser(self, filename):
+		filepath = os.path.join(PROJECT_ROOT, filename)
+		if filename.endswith(".gpx"):
+			expected = GpxParser(filepath).get_track_data(1)
+		elif filename.endswith(".tcx"):
+			expected = TcxParser(filepath).get_track_data()
+		else:
+			expected = FitParser(filepath).get_track_data()
+		track_data, split_data, summary = parse_workout_file(filepath)
+		assert(len(track_data) > 0)
+		assert(np.array_equal(track_data.latitudes, expected[0].latitudes))
+		assert(np.array_equal(split_data.distances, expected[1].distances))
+		assert(summary.__dict__ == expected[2].__dict__)
+
+	def test_unreadable_workout_file(self, tmpdir):
+		filepath = os.path.join(str(tmpdir), "broken.gpx")
+		with open(filepath, "w") as broken_file:
+			broken_file.write("<gpx><trk><trkseg><trkpt lat=")
+		assert(parse_workout_file(filepath) == (None, None, None))
+
+
+class TestPipelineFitSession:
+	def test_summary_of_session_totals(self):
+		filepath = os.path.join(PROJECT_ROOT, "test_garmin.fit")
+		track_data, _, summary = parse_workout_file(filepath)
+		assert((summary.duration, summary.distance, summary.elevation) == (1815.5, 5267.1, 131))
+		assert(track_data.distances[-1] == 5248.0) # the track is still computed from the records
+		assert(read_fit_summary(filepath).__dict__ == summary.__dict__)
+
+	def test_summary_without_session_position(self):
+		filepath = os.path.join(PROJECT_ROOT, "test_polar.fit")
+		_, _, summary = parse_workout_file(filepath)
+		fast_summary = load_workout_summary(filepath)
+		assert(fast_summary.distance == summary.distance == 15102.6)
+		assert((fast_summary.latitude, fast_summary.longitude) == (summary.latitude, summary.longitude)) # first position recorded
+
+	def test_summary_of_other_formats(self, tmpdir):
+		filepath = os.path.join(str(tmpdir), "test.tcx")
+		shutil.copyfile(os.path.join(PROJECT_ROOT, "test.tcx"), filepath)
+		assert(load_workout_summary(filepath).__dict__ == parse_workout_file(filepath)[2].__dict__)
+		assert(os.path.exists(filepath + ".trk")) # parsed and stored as on upload
+
+	def write_paused_fit(self, filepath, with_laps=False):
+		# running north at about 3 m/s for 600 s, paused for 300 s, then 600 s more, and the session of the device
+		start = int((START_TIME - FIT_EPOCH).total_seconds())
+		data = struct.pack('<BBBHB', 0x40, 0, 0, FIT_MESG_RECORD, 3) + bytes([253, 4, 0x86, 0, 4, 0x85, 1, 4, 0x85])
+		semicircles = 2**31 / 180.0
+		for i, offset in enumerate(list(range(600)) + list(range(900, 1500))):
+			data += struct.pack('<BIii', 0, start + offset, int(round((63.0 + 0.000027 * i) * semicircles)), int(round(10.0 * semicircles)))
+		data += struct.pack('<BBBHB', 0x41, 0, 0, FIT_MESG_SESSION, 6) + bytes([253, 4, 0x86, 2, 4, 0x86, 7, 4, 0x86, 8, 4, 0x86, 9, 4, 0x86, 22, 2, 0x84])
+		data += struct.pack('<BIIIIIH', 1, start + 1500, start, 1500000, 1200000, 360000, 10)
+		if with_laps: # a lap before and after the pause, without end positions
+			data += struct.pack('<BBBHB', 0x42, 0, 0, FIT_MESG_LAP, 5) + bytes([253, 4, 0x86, 2, 4, 0x86, 7, 4, 0x86, 8, 4, 0x86, 9, 4, 0x86])
+			data += struct.pack('<BIIIII', 2, start + 900, start, 900000, 600000, 180000)
+			data += struct.pack('<BIIIII', 2, start + 1500, start + 900, 600000, 600000, 180000)
+		with open(filepath, "wb") as fit_file:
+			fit_file.write(struct.pack('<BBHI4s', 12, 0x10, 2132, len(data), b'.FIT') + data + b'\0\0')
+
+	def test_laps_without_positions(self, app, tmpdir):
+		filepath = os.path.join(str(tmpdir), "paused.fit")
+		self.write_paused_fit(filepath, True)
+		laps = read_fit_laps(filepath)
+		assert(laps.durations.tolist() == [600.0, 600.0])
+		assert(np.isnan(laps.latitudes).all() and np.isnan(laps.longitudes).all())
+		workout = Workout(1, WorkoutCategory("Running", True), "Running", START_TIME, 0, 1, 0, filepath, False)
+		workout.register_extended_data()
+		dumped = workout_schema.dump(workout)
+		assert([(lap["latitude"], lap["longitude"]) for lap in dumped["trackLaps"]] == [(None, None), (None, None)])
+		assert([lap["distance"] for lap in dumped["trackLaps"]] == [1800.0, 1800.0])
+		json.dumps(dumped, allow_nan=False) # valid JSON without orjson
+
+	def test_paused_activity(self, tmpdir):
+		filepath = os.path.join(str(tmpdir), "paused.fit")
+		self.write_paused_fit(filepath)
+		track_data, split_data, summary = parse_workout_file(filepath)
+		assert(track_data.durations[-1] == 1499.0) # time since the first point, with the pause
+		assert(summary.duration == 1200.0) # the time the timer ran
+		assert(summary.distance == 3600.0)
+		assert(summary.average_speed == 10.8)
+		assert(read_fit_summary(filepath).__dict__ == summary.__dict__)
+
+	def test_laps(self):
+		laps = read_fit_laps(os.path.join(PROJECT_ROOT, "test_garmin.fit"))
+		assert(laps.distances.tolist() == [1000.0, 1000.0, 1000.0, 1000.0, 1000.0, 267.08])
+		assert(round(float(np.sum(laps.durations)), 1) == 1815.5)
+		assert(len(read_fit_laps(os.path.join(PROJECT_ROOT, "test_polar.fit"))) == 15)
+		assert(load_workout_laps(os.path.join(PROJECT_ROOT, "test.gpx")) is None)
+		assert(load_workout_laps(os.path.join(PROJECT_ROOT, "missing.fit")) is None)
+
+
+class TestPipelineDeviceMetrics:
+	def setup(self):
+		track_distance.device_metrics = True
+
+	def teardown(self):
+		track_distance.device_metrics = False
+
+	def get_points(self):
+		times = [START_TIME + dt.timedelta(seconds=i) for i in range(6)]
+		latitudes = [None, 63.0, None, 63.0001, 63.0002, None]
+		distances = [0.0, 4.0, 8.0, 12.0, 16.0, None]
+		return zip(times, latitudes, latitudes, [100.0] * 6, [None] * 6, distances, [4.0] * 6)
+
+	def test_points_without_position_kept_with_device_distance(self):
+		collected = collect_points(sanitize_points(chunk_points(self.get_points(), 2)))
+		assert(collected.device_distances.tolist() == [0.0, 4.0, 8.0, 12.0, 16.0])
+		assert(collected.latitudes.tolist() == [63.0, 63.0, 63.0, 63.0001, 63.0002]) # position of the point before, or the first
+		assert(collected.device_speeds.tolist() == [4.0] * 5)
+
+	def test_device_values_ignored_without_device_metrics(self):
+		collected = collect_points(sanitize_points(chunk_points(self.get_points(), 2), False))
+		assert(len(collected) == 3)
+		assert(collected.device_distances is None and collected.device_speeds is None)
+
+	def test_treadmill_workout(self, tmpdir):
+		with open(os.path.join(PROJECT_ROOT, "test_garmin.tcx")) as tcx_file:
+			tcx = re.sub(r"<Position>.*?</Position>", "", tcx_file.read(), flags=re.S)
+		filepath = os.path.join(str(tmpdir), "treadmill.tcx")
+		with open(filepath, "w") as tcx_file:
+			tcx_file.write(tcx)
+		track_data, split_data, summary = parse_workout_file(filepath)
+		assert(len(track_data) == 504)
+		assert(summary.distance == 10778.4)
+		assert(len(split_data) == 11)
+		assert(np.isnan(summary.latitude))
+		track_distance.device_metrics = False
+		assert(parse_workout_file(filepath) == (None, None, None))
+
+	def test_fit_device_distance(self):
+		track_data, _, _ = parse_workout_file(os.path.join(PROJECT_ROOT, "test_polar.fit"))
+		points = get_track_points_of_fit("test_polar.fit")
+		assert(track_data.distances[-1] == round(points.device_distances[-1] - points.device_distances[0], 1))
+		assert(track_data.speeds[100] == round(3.6 * points.device_speeds[100], 1))
+
+
+def get_track_points_of_fit(filename):
+	from run4it.api.workout.fit import decode_fit_track
+	return collect_points(trim_no_movement(sanitize_points(decode_fit_track(os.path.join(PROJECT_ROOT, filename)))))
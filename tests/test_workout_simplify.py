@@ -0,0 +1,56 @@
+import pytest
+import numpy as np
+import datetime as dt
+from run4it.api.workout.track import TrackPoints
+from run4it.api.workout.simplify import (simplify_track_data, get_douglas_peucker_indices, get_lttb_indices,
+	TRACK_SIMPLIFY_MAP, TRACK_SIMPLIFY_SPEED)
+
+
+class TestTrackSimplify:
+	def test_douglas_peucker_keeps_corners(self):
+		# north 100 points, then east 100 points
+		latitudes = [63.0 + 0.0001 * i for i in range(100)] + [63.0099] * 100
+		longitudes = [10.0] * 100 + [10.0 + 0.0002 * i for i in range(1, 101)]
+		indices = get_douglas_peucker_indices(np.array(latitudes), np.array(longitudes), 3)
+		assert(indices.tolist() == [0, 99, 199])
+
+	def test_douglas_peucker_max_points(self):
+		latitudes = 63.0 + 0.001 * np.sin(np.linspace(0, 20, 1000))
+		longitudes = np.linspace(10.0, 10.1, 1000)
+		indices = get_douglas_peucker_indices(latitudes, longitudes, 100)
+		assert(len(indices) == 100)
+		assert(indices[0] == 0 and indices[-1] == 999)
+		assert(np.all(np.diff(indices) > 0))
+
+	def test_lttb_keeps_peak(self):
+		x = np.arange(1000, dtype=np.float64)
+		y = np.zeros(1000)
+		y[567] = 100.0
+		indices = get_lttb_indices(x, y, 10)
+		assert(len(indices) == 10)
+		assert(indices[0] == 0 and indices[-1] == 999)
+		assert(567 in indices.tolist())
+
+	def test_short_track_is_not_simplified(self):
+		track_data = self.get_track_data(20)
+		assert(simplify_track_data(track_data, 20, TRACK_SIMPLIFY_MAP) is track_data)
+		assert(simplify_track_data(track_data, None) is track_data)
+
+	def test_simplified_track_data(self):
+		track_data = self.get_track_data(500)
+		simplified = simplify_track_data(track_data, 50, TRACK_SIMPLIFY_SPEED)
+		assert(len(simplified) == 50)
+		assert(simplified[0].time == track_data[0].time)
+		assert(simplified[-1].distance == track_data[-1].distance)
+
+	def test_track_without_positions_simplified_by_speed(self):
+		track_data = self.get_track_data(500)
+		track_data.latitudes = np.full(500, np.nan)
+		simplified = simplify_track_data(track_data, 50, TRACK_SIMPLIFY_MAP)
+		assert(simplified.durations.tolist() == simplify_track_data(track_data, 50, TRACK_SIMPLIFY_SPEED).durations.tolist())
+
+	def get_track_data(self, num_points):
+		times = [dt.datetime(2020, 6, 30, 4, 49, 19) + dt.timedelta(seconds=i) for i in range(num_points)]
+		latitudes = [63.0 + 0.00003 * i for i in range(num_points)]
+		track_data, _, _ = TrackPoints.from_datetimes(times, latitudes, [10.0] * num_points, [100.0] * num_points).get_track_data()
+		return track_data
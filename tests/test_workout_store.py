@@ -0,0 +1,84 @@
+import os
+import shutil
+import pytest
+from run4it.api.workout.model import parse_workout_file, load_workout_file
+from run4it.api.workout.store import (read_track_store, write_track_store, get_track_store_path,
+	rename_track_store, remove_track_store)
+
+
+class TestTrackStore:
+	def copy_test_file(self, tmpdir, name="test_garmin.fit"):
+		filepath = os.path.join(str(tmpdir), name)
+		shutil.copy2(os.path.join(os.path.dirname(__file__), "..", name), filepath)
+		return filepath
+
+	@pytest.mark.parametrize("name", ["test_garmin.fit", "test_polar.fit", "test.tcx"])
+	def test_stored_track_equals_parsed_track(self, tmpdir, name):
+		filepath = self.copy_test_file(tmpdir, name)
+		track_data, split_data, summary = parse_workout_file(filepath)
+		assert(write_track_store(filepath, (track_data, split_data, summary)))
+		stored_track_data, stored_split_data, stored_summary = read_track_store(filepath)
+		assert(len(stored_track_data) == len(track_data))
+		for column in ["time_offsets", "latitudes", "longitudes", "elevations", "durations", "distances", "speeds", "heart_rates"]:
+			assert(getattr(stored_track_data, column).tolist() == getattr(track_data, column).tolist())
+			assert(getattr(stored_split_data, column).tolist() == getattr(split_data, column).tolist())
+		assert(stored_track_data.start_time == track_data.start_time)
+		assert(stored_split_data.start_time == split_data.start_time)
+		assert(stored_track_data[-1].time == track_data[-1].time)
+		assert(vars(stored_summary) == vars(summary))
+
+	def test_store_of_other_version_is_not_used(self, tmpdir):
+		filepath = self.copy_test_file(tmpdir)
+		load_workout_file(filepath)
+		with open(get_track_store_path(filepath), "r+b") as store_file:
+			store_file.seek(4)
+			store_file.write(bytes([1]))
+		assert(read_track_store(filepath) is None)
+
+	def test_store_is_smaller_than_file(self, tmpdir):
+		filepath = self.copy_test_file(tmpdir, "test.gpx")
+		load_workout_file(filepath)
+		assert(os.path.getsize(get_track_store_path(filepath)) * 10 < os.path.getsize(filepath))
+
+	def test_load_writes_store_once(self, tmpdir):
+		filepath = self.copy_test_file(tmpdir)
+		assert(read_track_store(filepath) is None)
+		_, _, summary = load_workout_file(filepath)
+		assert(os.path.exists(get_track_store_path(filepath)))
+		assert(load_workout_file(filepath)[2].distance == summary.distance)
+
+	def test_store_of_changed_file_is_not_used(self, tmpdir):
+		filepath = self.copy_test_file(tmpdir)
+		load_workout_file(filepath)
+		with open(filepath, "ab") as workout_file:
+			workout_file.write(b"\0")
+		assert(read_track_store(filepath) is None)
+
+	def test_invalid_store_is_not_used(self, tmpdir):
+		filepath = self.copy_test_file(tmpdir)
+		with open(get_track_store_path(filepath), "wb") as store_file:
+			store_file.write(b"abcdefghijklmnopqrstuvwxyz")
+		assert(read_track_store(filepath) is None)
+
+	def test_nothing_to_store(self, tmpdir):
+		filepath = self.copy_test_file(tmpdir)
+		assert(not write_track_store(filepath, (None, None, None)))
+		assert(not os.path.exists(get_track_store_path(filepath)))
+
+	def test_track_without_positions_not_stored(self, tmpdir):
+		filepath = self.copy_test_file(tmpdir)
+		track_data, split_data, summary = parse_workout_file(filepath)
+		track_data.latitudes = track_data.latitudes.copy()
+		track_data.latitudes[:] = float("nan")
+		assert(not write_track_store(filepath, (track_data, split_data, summary)))
+		assert(not os.path.exists(get_track_store_path(filepath)))
+
+	def test_rename_and_remove_store(self, tmpdir):
+		filepath = self.copy_test_file(tmpdir)
+		new_filepath = os.path.join(str(tmpdir), "renamed.fit")
+		load_workout_file(filepath)
+		os.rename(filepath, new_filepath)
+		rename_track_store(filepath, new_filepath)
+		assert(read_track_store(new_filepath) is not None)
+		remove_track_store(new_filepath)
+		assert(not os.path.exists(get_track_store_path(new_filepath)))
@@ -0,0 +1,288 @@
+import io
+import struct
+from array import array
+import pytest
+import datetime as dt
+import numpy as np
+from run4it.api.workout.track import (TrackPoints, TrackData, TrackDistance, WorkoutDataPoint, geodesic_distances, haversine_distances, flat_distances,
+	get_segment_distances, find_movement_bounds, parse_xml_datetime, fill_missing_values, track_distance)
+from run4it.api.workout.tcx import read_tcx_trackpoints
+from run4it.api.workout.gpx import read_gpx_trackpoints
+from run4it.api.workout.fit import FitDecoder, FIT_MESG_RECORD, FIT_RECORD_FIELDS, FIT_EPOCH, get_fit_session_summary, get_fit_laps
+from run4it.api.workout.schema import WorkoutTrackDataField
+
+
+def get_track_points(num_moving, num_still_start=0, num_still_end=0):
+	# moving north at approx. 3.3 m/s, one point per second
+	latitudes = [63.0] * num_still_start
+	latitudes += [63.0 + 0.00003 * i for i in range(num_moving)]
+	latitudes += latitudes[-1:] * num_still_end
+	num_points = len(latitudes)
+	start_time = dt.datetime(2020, 6, 30, 4, 49, 19)
+	times = [start_time + dt.timedelta(seconds=i) for i in range(num_points)]
+	return TrackPoints.from_datetimes(times, latitudes, [10.0] * num_points, [100.0] * num_points, [150] * num_points)
+
+
+class TestTrackDistance:
+	def test_geodesic_distance(self):
+		distances = geodesic_distances([63.60100167, 63.0, 63.0], [10.99771167, 10.0, 10.0], [63.600985, 63.01, 63.0], [10.99769833, 10.0, 10.01])
+		assert(round(distances[0], 4) == 1.9726)
+		assert(round(distances[1], 4) == 1114.6174)
+		assert(round(distances[2], 4) == 506.7282)
+
+	def test_geodesic_distance_same_point(self):
+		distances = geodesic_distances([63.0], [10.0], [63.0], [10.0])
+		assert(distances[0] == 0.0)
+
+	def test_approximations_of_short_segments(self):
+		latitudes1, longitudes1 = [63.60100167, 63.0, -33.9, 0.0], [10.99771167, 10.0, 151.2, 179.99999]
+		latitudes2, longitudes2 = [63.600985, 63.00003, -33.90002, 0.0], [10.99769833, 10.00004, 151.20001, -179.99999]
+		geodesic = geodesic_distances(latitudes1, longitudes1, latitudes2, longitudes2)
+		assert(np.max(np.abs(flat_distances(latitudes1, longitudes1, latitudes2, longitudes2) - geodesic)) < 0.0001)
+		assert(np.max(np.abs(haversine_distances(latitudes1, longitudes1, latitudes2, longitudes2) / geodesic - 1.0)) < 0.006)
+
+	def test_haversine_distance(self):
+		distances = haversine_distances([63.0, 63.0], [10.0, 10.0], [63.01, 63.0], [10.0, 10.0])
+		assert(round(distances[0], 4) == 1111.9508)
+		assert(distances[1] == 0.0)
+
+	def test_unknown_distance_model(self):
+		with pytest.raises(ValueError):
+			TrackDistance("manhattan")
+
+	def test_distance_model_of_track_metrics(self):
+		points = get_track_points(700)
+		try:
+			track_distance.set_model("haversine")
+			_, _, haversine_summary = points.get_track_data()
+			track_distance.set_model("flat")
+			_, _, flat_summary = points.get_track_data()
+		finally:
+			track_distance.set_model("geodesic")
+		_, _, geodesic_summary = points.get_track_data()
+		assert(abs(flat_summary.distance - geodesic_summary.distance) < 0.2)
+		assert(abs(haversine_summary.distance - geodesic_summary.distance) > 1.0) # the sphere is too small for northward movement at 63N
+
+
+class TestTrackDeviceMetrics:
+	def test_segment_distances_from_device(self):
+		latitudes = np.array([63.0, 63.00003, 63.00006, 63.00009])
+		longitudes = np.full(4, 10.0)
+		device_distances = np.array([0.0, 5.0, np.nan, 12.0])
+		distances = get_segment_distances(latitudes, longitudes, device_distances=device_distances)
+		geodesic = geodesic_distances(latitudes[:-1], longitudes[:-1], latitudes[1:], longitudes[1:])
+		assert(distances[0] == 5.0)
+		assert(distances[1:].tolist() == geodesic[1:].tolist()) # from positions where the device has no distance
+		assert(get_segment_distances(latitudes, longitudes, device_distances=device_distances, step=3).tolist() == [12.0])
+
+	def test_device_restarting_its_distance(self):
+		distances = get_segment_distances(np.full(3, 63.0), np.full(3, 10.0), device_distances=np.array([100.0, 0.0, 3.0]))
+		assert(distances.tolist() == [0.0, 3.0])
+
+	def test_track_data_of_device_metrics(self):
+		points = get_track_points(100)
+		points.device_distances = np.arange(100) * 4.0
+		points.device_speeds = np.full(100, 4.0)
+		points.device_speeds[50] = np.nan
+		track_data, _, summary = points.get_track_data()
+		assert(summary.distance == 396.0)
+		assert(track_data.speeds[10] == 14.4)
+		assert(track_data.speeds[50] == 14.4) # from the device distances
+		assert(summary.latitude == 63.0)
+
+	def test_no_movement_by_device_distance(self):
+		points = get_track_points(100, 10, 10)
+		points.device_distances = np.zeros(len(points))
+		assert(len(points.strip_no_movement()) == 0) # the device did not move, whatever the positions say
+
+
+class TestTrackMovement:
+	def test_no_movement_trimmed_in_both_ends(self):
+		points = get_track_points(100, 10, 10)
+		start, stop = find_movement_bounds(points.latitudes, points.longitudes, points.time_offsets)
+		assert(start == 10)
+		assert(stop == 109) # last moving point is not included
+
+	def test_no_movement_at_all(self):
+		points = get_track_points(1, 0, 20)
+		assert(len(points.strip_no_movement()) == 0)
+
+	def test_strip_keeps_start_time_of_first_point(self):
+		points = get_track_points(100, 10, 0).strip_no_movement()
+		assert(len(points) == 100)
+		assert(points.start_time == dt.datetime(2020, 6, 30, 4, 49, 29))
+		assert(points.time_offsets[0] == 0.0)
+
+
+class TestTrackData:
+	def test_empty_track(self):
+		track_data, split_data, summary = get_track_points(0).get_track_data()
+		assert(len(track_data) == 0)
+		assert(len(split_data) == 0)
+		assert(summary is None)
+
+	def test_track_data(self):
+		track_data, _, _ = get_track_points(700).get_track_data()
+		assert(len(track_data) == 700)
+		assert(track_data[0].duration == 0.0)
+		assert(track_data[0].distance == 0.0)
+		assert(track_data[0].average_speed == track_data[5].average_speed)
+		assert(track_data[-1].duration == 699.0)
+		assert(track_data[-1].distance == 2337.4)
+		assert(track_data[-1].average_speed == 12.0)
+		assert(track_data[-1].heart_bpm == 150)
+
+	def test_splits(self):
+		_, split_data, _ = get_track_points(700).get_track_data()
+		assert(len(split_data) == 3)
+		assert(split_data[0].distance >= 998)
+		assert(split_data[1].distance >= 998)
+		assert(round(sum(split.distance for split in split_data), 1) == 2337.4)
+		assert(sum(split.duration for split in split_data) == 699.0)
+		assert(split_data[0].average_pace == "04:59")
+
+	def test_track_data_is_columnar(self):
+		track_data, split_data, _ = get_track_points(700).get_track_data()
+		assert(isinstance(track_data, TrackData))
+		assert(isinstance(split_data, TrackData))
+		assert(track_data.distances.dtype == np.float64)
+		assert(track_data[-1].distance == track_data[699].distance)
+		assert(track_data[10].time == dt.datetime(2020, 6, 30, 4, 49, 29))
+		assert(len(list(split_data)) == 3)
+		with pytest.raises(IndexError):
+			track_data[700]
+
+	def test_track_data_range(self):
+		track_data, _, _ = get_track_points(700).get_track_data()
+		assert(track_data.get_range() is track_data)
+		distance_range = track_data.get_range(from_distance=1000.0, to_distance=2000.0)
+		assert(distance_range.distances[0] >= 1000.0 and track_data.distances[299] < 1000.0 and track_data.distances[599] > 2000.0)
+		assert(distance_range.distances[-1] <= 2000.0)
+		assert(len(distance_range) == 299)
+		duration_range = track_data.get_range(from_duration=100.0, to_duration=199.0)
+		assert(duration_range.durations.tolist() == track_data.durations[100:200].tolist())
+		assert(duration_range[0].time == track_data[100].time)
+		both_ranges = track_data.get_range(from_distance=1000.0, to_duration=399.0)
+		assert(len(both_ranges) == 100)
+		assert(len(track_data.get_range(from_distance=2000.0, to_distance=1000.0)) == 0)
+
+	def test_track_data_field(self):
+		track_data, _, _ = get_track_points(700).get_track_data()
+		dumped = WorkoutTrackDataField()._serialize(track_data, 'trackData', None)
+		assert(len(dumped) == 700)
+		assert(dumped[-1] == { 'latitude': 63.02097, 'longitude': 10.0, 'elevation': 100, 'duration': 699.0, 'distance': 2337.4,
+			'speed': 12.0, 'pace': '05:00', 'heartBpm': 150 })
+		assert(WorkoutTrackDataField()._serialize(None, 'trackData', None) is None)
+
+	def test_summary(self):
+		_, _, summary = get_track_points(700).get_track_data()
+		assert(summary.latitude == 63.0)
+		assert(summary.longitude == 10.0)
+		assert(summary.time == dt.datetime(2020, 6, 30, 4, 49, 19))
+		assert(summary.duration == 699.0)
+		assert(summary.distance == 2337.4)
+		assert(summary.elevation == 0)
+		assert(summary.heart_bpm == 150)
+
+
+class TestTrackDecoding:
+	def test_parse_xml_datetime(self):
+		assert(parse_xml_datetime("2020-04-29T18:11:27.826Z") == dt.datetime(2020, 4, 29, 18, 11, 27, 826000))
+		assert(parse_xml_datetime("2020-06-30T04:49:19Z") == dt.datetime(2020, 6, 30, 4, 49, 19))
+		assert(parse_xml_datetime("2020-06-30T06:49:19.5+02:00") == dt.datetime(2020, 6, 30, 4, 49, 19, 500000))
+
+	def test_fill_missing_values(self):
+		filled = fill_missing_values(np.array([np.nan, 10.0, np.nan, 12.0]), 0.0)
+		assert(filled.tolist() == [10.0, 10.0, 10.0, 12.0])
+		assert(fill_missing_values(np.array([np.nan, np.nan]), 0.0).tolist() == [0.0, 0.0])
+
+	def test_read_tcx_trackpoints(self):
+		tcx = "<?xml version=\"1.0\" encoding=\"UTF-8\"?><TrainingCenterDatabase xmlns=\"http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2\">"
+		tcx += "<Activities><Activity Sport=\"Running\"><Lap StartTime=\"2020-04-29T18:11:27.826Z\"><AverageHeartRateBpm><Value>119</Value></AverageHeartRateBpm><Track>"
+		tcx += "<Trackpoint><Time>2020-04-29T18:11:27.826Z</Time><Position><LatitudeDegrees>63.60100167</LatitudeDegrees><LongitudeDegrees>10.99771167</LongitudeDegrees></Position>"
+		tcx += "<DistanceMeters>0.2</DistanceMeters><HeartRateBpm><Value>84</Value></HeartRateBpm></Trackpoint>"
+		tcx += "<Trackpoint><Time>2020-04-29T18:11:28.826Z</Time><AltitudeMeters>84.735</AltitudeMeters></Trackpoint>"
+		tcx += "</Track></Lap></Activity></Activities></TrainingCenterDatabase>"
+		points = list(read_tcx_trackpoints(io.BytesIO(tcx.encode())))
+		assert(len(points) == 2)
+		assert(points[0] == (dt.datetime(2020, 4, 29, 18, 11, 27, 826000), 63.60100167, 10.99771167, None, 84, 0.2, None))
+		assert(points[1] == (dt.datetime(2020, 4, 29, 18, 11, 28, 826000), None, None, 84.735, None, None, None))
+
+	def test_read_gpx_trackpoints(self):
+		gpx = "<?xml version=\"1.0\" encoding=\"UTF-8\"?><gpx xmlns=\"http://www.topografix.com/GPX/1/1\" version=\"1.1\">"
+		gpx += "<metadata><time>2020-04-29T18:11:26.826Z</time></metadata><trk><trkseg>"
+		gpx += "<trkpt lat=\"63.60100167\" lon=\"10.99771167\"><ele>15.0</ele><time>2020-04-29T18:11:26.826Z</time></trkpt></trkseg><trkseg>"
+		gpx += "<trkpt lat=\"63.600985\" lon=\"10.99769833\"><time>2020-04-29T18:11:28.827Z</time></trkpt></trkseg></trk>"
+		gpx += "<trk><trkseg></trkseg></trk></gpx>"
+		points = list(read_gpx_trackpoints(io.BytesIO(gpx.encode())))
+		assert(len(points) == 3)
+		assert(points[0] == (1, dt.datetime(2020, 4, 29, 18, 11, 26, 826000), 63.60100167, 10.99771167, 15.0))
+		assert(points[1] == (1, dt.datetime(2020, 4, 29, 18, 11, 28, 827000), 63.600985, 10.99769833, None))
+		assert(points[2] == (2, None, None, None, None))
+
+	def test_fit_decoder(self, tmpdir):
+		records = struct.pack('<BBBHB', 0x40, 0, 0, 20, 4) + bytes([253, 4, 0x86, 0, 4, 0x85, 1, 4, 0x85, 3, 1, 0x02])
+		records += struct.pack('<BIiiB', 0x00, 1000, 758845760, 131205120, 150)
+		records += struct.pack('<BBBHB', 0x41, 0, 0, 20, 3) + bytes([0, 4, 0x85, 1, 4, 0x85, 3, 1, 0x02])
+		records += struct.pack('<BiiB', 0x80 | (1 << 5) | 10, 758845800, 131205120, 0xFF) # compressed timestamp, invalid heart rate
+		fit_file = tmpdir.join("test.fit")
+		fit_file.write_binary(struct.pack('<BBHI4s', 12, 0x10, 0, len(records), b'.FIT') + records + b'\x00\x00')
+		values = FitDecoder({ FIT_MESG_RECORD: FIT_RECORD_FIELDS }).decode(str(fit_file))[FIT_MESG_RECORD]
+		assert(values['timestamp'].tolist() == [1000.0, 1002.0])
+		assert(values['position_lat'].tolist() == [758845760.0, 758845800.0])
+		assert(values['heart_rate'][0] == 150.0)
+		assert(np.isnan(values['heart_rate'][1]))
+		assert(np.isnan(values['altitude'][0]))
+
+	def test_fit_decoder_compressed_timestamp_first(self, tmpdir):
+		records = struct.pack('<BBBHB', 0x40, 0, 0, 20, 2) + bytes([0, 4, 0x85, 1, 4, 0x85])
+		records += struct.pack('<Bii', 0x80 | 10, 758845760, 131205120) # compressed timestamp, no full timestamp before it
+		records += struct.pack('<BBBHB', 0x41, 0, 0, 20, 3) + bytes([253, 4, 0x86, 0, 4, 0x85, 1, 4, 0x85])
+		records += struct.pack('<BIii', 0x01, 1000, 758845800, 131205120)
+		fit_file = tmpdir.join("test.fit")
+		fit_file.write_binary(struct.pack('<BBHI4s', 12, 0x10, 0, len(records), b'.FIT') + records + b'\x00\x00')
+		values = FitDecoder({ FIT_MESG_RECORD: FIT_RECORD_FIELDS }).decode(str(fit_file))[FIT_MESG_RECORD]
+		assert(np.isnan(values['timestamp'][0]))
+		assert(values['timestamp'][1] == 1000.0)
+		assert(values['position_lat'].tolist() == [758845760.0, 758845800.0])
+
+	def get_fit_messages(self, **columns):
+		return { name: array('d', values) for name, values in columns.items() }
+
+	def test_fit_session_summary(self):
+		sessions = self.get_fit_messages(start_time=[1000.0, 5000.0], start_position_lat=[758845760.0, np.nan], start_position_long=[131205120.0, np.nan],
+			total_timer_time=[3000000.0, 1000000.0], total_distance=[1000000.0, 200000.0], avg_heart_rate=[150.0, 170.0], total_ascent=[100.0, 20.0])
+		summary = get_fit_session_summary(sessions)
+		assert(summary.time == FIT_EPOCH + dt.timedelta(seconds=1000))
+		assert((summary.latitude, summary.longitude) == (63.605717, 10.997486))
+		assert((summary.duration, summary.distance, summary.elevation) == (4000.0, 12000.0, 120))
+		assert(summary.average_speed == 10.8)
+		assert(summary.heart_bpm == 155) # weighted by duration
+
+	def test_fit_session_without_totals(self):
+		sessions = self.get_fit_messages(start_time=[1000.0], start_position_lat=[np.nan], start_position_long=[np.nan],
+			total_timer_time=[3000000.0], total_distance=[1000000.0], avg_heart_rate=[np.nan], total_ascent=[np.nan])
+		assert(get_fit_session_summary(sessions) is None)
+		computed = WorkoutDataPoint(63.0, 10.0, 50.0, dt.datetime(2020, 1, 1), 2990.0, 9950.0, 12.0, 140)
+		summary = get_fit_session_summary(sessions, computed)
+		assert((summary.latitude, summary.longitude, summary.elevation, summary.heart_bpm) == (63.0, 10.0, 50, 140))
+		assert((summary.duration, summary.distance) == (3000.0, 10000.0))
+		no_sessions = self.get_fit_messages(**{ name: [] for name in sessions })
+		assert(get_fit_session_summary(no_sessions, computed) is computed)
+
+	def test_fit_laps(self):
+		laps = self.get_fit_messages(timestamp=[1300.0, 1600.0, np.nan], start_time=[1000.0, np.nan, 1600.0],
+			end_position_lat=[758845760.0, np.nan, np.nan], end_position_long=[131205120.0, np.nan, np.nan],
+			total_elapsed_time=[300000.0, 300000.0, 1000.0], total_timer_time=[240000.0, np.nan, 1000.0], total_distance=[100000.0, np.nan, 0.0], avg_heart_rate=[150.0, np.nan, np.nan],
+			total_ascent=[12.0, np.nan, np.nan])
+		lap_data = get_fit_laps(laps)
+		assert(len(lap_data) == 2) # without an end time
+		assert(lap_data.start_time == FIT_EPOCH + dt.timedelta(seconds=1000))
+		assert(lap_data.time_offsets.tolist() == [300.0, 600.0])
+		assert(lap_data.durations.tolist() == [240.0, 300.0]) # timer time, or elapsed time if it is missing
+		assert(lap_data.distances[0] == 1000.0 and np.isnan(lap_data.distances[1]))
+		assert(lap_data.speeds[0] == 15.0)
+		assert(lap_data.elevations.tolist() == [12, 0])
+		assert(lap_data.heart_rates.tolist() == [150, 0])
+		assert(lap_data.latitudes[0] == 63.605717 and np.isnan(lap_data.latitudes[1]))
+		assert(lap_data.get_paces() == ["04:00", ""])